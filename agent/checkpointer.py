@@ -0,0 +1,425 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    INTERRUPT,
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+def _typed_size(typed: Tuple[str, bytes]) -> int:
+    return len(typed[0]) + len(typed[1])
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    InMemorySaver that evicts whole threads.
+
+    Threads idle for longer than `ttl_seconds` are dropped, and the least
+    recently used threads are dropped while there are more than `max_threads`
+    or the serialized checkpoints exceed `max_bytes`. Threads waiting on an
+    interrupt are left to the TTL, so their question can still be answered.
+    """
+
+    backend = "memory"
+
+    def __init__(self, max_threads: int = 1000, ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        # thread_id -> last access, least recently used first
+        self._last_access = OrderedDict()
+        self._thread_bytes = defaultdict(int)
+        self._thread_checkpoints = defaultdict(int)
+        # Keys of blobs and writes per thread, so a thread is deleted without scanning everything
+        self._blob_keys = defaultdict(set)
+        self._write_keys = defaultdict(set)
+        self.bytes = 0
+        self.evictions = {"ttl": 0, "lru": 0, "memory": 0}
+
+    def _touch(self, thread_id: str):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id not in self._last_access:
+                # InMemorySaver's defaultdicts would create an empty entry for every lookup
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config is not None and config["configurable"]["thread_id"] not in self._last_access:
+                return
+            tuples = list(super().list(config, **kwargs))
+        yield from tuples
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            previous = self.storage[thread_id][checkpoint_ns].get(checkpoint["id"])
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            added = sum(_typed_size(part) for part in self.storage[thread_id][checkpoint_ns][checkpoint["id"]][:2])
+            if previous is None:
+                self._thread_checkpoints[thread_id] += 1
+            else:
+                added -= sum(_typed_size(part) for part in previous[:2])
+            for channel, version in new_versions.items():
+                key = (thread_id, checkpoint_ns, channel, version)
+                if key not in self._blob_keys[thread_id]:
+                    self._blob_keys[thread_id].add(key)
+                    added += _typed_size(self.blobs[key])
+            self._thread_bytes[thread_id] += added
+            self.bytes += added
+            self._touch(thread_id)
+            self._evict(keep=thread_id)
+        return next_config
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        outer_key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        with self._lock:
+            before = sum(_typed_size(write[2]) for write in self.writes.get(outer_key, {}).values())
+            super().put_writes(config, writes, task_id, task_path)
+            added = sum(_typed_size(write[2]) for write in self.writes.get(outer_key, {}).values()) - before
+            self._write_keys[thread_id].add(outer_key)
+            self._thread_bytes[thread_id] += added
+            self.bytes += added
+            self._touch(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self.bytes -= self._thread_bytes.pop(thread_id, 0)
+            self._thread_checkpoints.pop(thread_id, None)
+            self._last_access.pop(thread_id, None)
+
+    def _interrupted(self, thread_id: str) -> bool:
+        """Whether the latest checkpoint of the thread has a pending interrupt."""
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            if checkpoints:
+                writes = self.writes.get((thread_id, checkpoint_ns, max(checkpoints)), {})
+                if any(write[1] == INTERRUPT for write in writes.values()):
+                    return True
+        return False
+
+    def _evict(self, keep: str):
+        """Drop idle threads, then least recently used ones while over the limits; never `keep`."""
+        now = time.monotonic()
+        for thread_id, last_access in list(self._last_access.items()):
+            if now - last_access <= self.ttl_seconds:
+                # Ordered by last access, so the rest are fresher
+                break
+            if thread_id != keep:
+                self.delete_thread(thread_id)
+                self.evictions["ttl"] += 1
+        for thread_id in list(self._last_access):
+            over_threads = len(self._last_access) > self.max_threads
+            over_bytes = self.bytes > self.max_bytes
+            if not (over_threads or over_bytes):
+                break
+            if thread_id != keep and not self._interrupted(thread_id):
+                self.delete_thread(thread_id)
+                self.evictions["lru" if over_threads else "memory"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "threads": len(self._last_access),
+                "checkpoints": sum(self._thread_checkpoints.values()),
+                "bytes": self.bytes,
+                "evictions": dict(self.evictions),
+            }
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """
+    Checkpointer persisted in SQLite.
+
+    Every `compact_every` checkpoints, older checkpoints of each thread (and
+    their writes) are deleted so only the latest one is kept, threads idle for
+    longer than `ttl_seconds` are dropped and the least recently used threads
+    beyond `max_threads` are dropped, except those waiting on an interrupt.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = "data/checkpoints.sqlite", max_threads: int = 1000, ttl_seconds: float = 3600,
+                 compact_every: int = 500, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._puts_since_compaction = 0
+        self.compactions = 0
+        self.evictions = {"ttl": 0, "lru": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Must be set before the first table exists to take effect
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT, type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, value BLOB,
+                task_path TEXT,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+            """
+        )
+        self._conn.commit()
+
+    def _touch(self, thread_id: str):
+        self._conn.execute("INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, time.time()))
+
+    def _pending_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        rows = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=self._pending_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            self._conn.commit()
+            return self._tuple(row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query, params = "SELECT * FROM checkpoints WHERE 1 = 1", []
+        if config is not None:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if "checkpoint_ns" in config["configurable"]:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            tuples = [self._tuple(row) for row in self._conn.execute(query, params).fetchall()]
+        count = 0
+        for checkpoint_tuple in tuples:
+            if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            yield checkpoint_tuple
+            count += 1
+            if limit is not None and count >= limit:
+                break
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, serialized, metadata_type, serialized_metadata),
+            )
+            self._touch(thread_id)
+            self._conn.commit()
+            self._puts_since_compaction += 1
+            if self._puts_since_compaction >= self.compact_every:
+                self._compact()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        regular, special = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                   channel, type_, serialized, task_path)
+            (special if channel in WRITES_IDX_MAP else regular).append(row)
+        # Like InMemorySaver, regular writes are kept once per task while special ones (errors, interrupts) replace
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+            self._conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_threads([thread_id])
+            self._conn.commit()
+
+    def _delete_threads(self, thread_ids):
+        for table in ("checkpoints", "writes", "threads"):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+
+    def compact(self):
+        """Keep only the latest checkpoint per thread, evict idle and excess threads and reclaim the space."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        self._puts_since_compaction = 0
+        self._conn.execute(
+            """
+            DELETE FROM checkpoints WHERE checkpoint_id < (
+                SELECT MAX(latest.checkpoint_id) FROM checkpoints AS latest
+                WHERE latest.thread_id = checkpoints.thread_id AND latest.checkpoint_ns = checkpoints.checkpoint_ns
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints AS kept
+                WHERE kept.thread_id = writes.thread_id AND kept.checkpoint_ns = writes.checkpoint_ns
+                AND kept.checkpoint_id = writes.checkpoint_id
+            )
+            """
+        )
+        idle = [row[0] for row in self._conn.execute(
+            "SELECT thread_id FROM threads WHERE last_access < ?", (time.time() - self.ttl_seconds,)
+        )]
+        self._delete_threads(idle)
+        # Threads whose latest checkpoint has a pending interrupt count towards max_threads but are kept
+        interrupted = [row[0] for row in self._conn.execute(
+            """
+            SELECT DISTINCT writes.thread_id FROM writes JOIN checkpoints AS latest
+            ON latest.thread_id = writes.thread_id AND latest.checkpoint_ns = writes.checkpoint_ns
+            AND latest.checkpoint_id = writes.checkpoint_id
+            WHERE writes.channel = ?
+            """,
+            (INTERRUPT,),
+        )]
+        excess = [row[0] for row in self._conn.execute(
+            f"SELECT thread_id FROM threads WHERE thread_id NOT IN ({', '.join('?' * len(interrupted))}) "
+            "ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+            (*interrupted, max(1, self.max_threads - len(interrupted))),
+        )]
+        self._delete_threads(excess)
+        self._conn.commit()
+        self._conn.execute("PRAGMA incremental_vacuum")
+        self.evictions["ttl"] += len(idle)
+        self.evictions["lru"] += len(excess)
+        self.compactions += 1
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            return {
+                "backend": self.backend,
+                "threads": self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0],
+                "checkpoints": self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0],
+                "bytes": page_count * page_size,
+                "evictions": dict(self.evictions),
+                "compactions": self.compactions,
+            }
+
+
+def create_checkpointer():
+    """Create the checkpointer selected by CHECKPOINT_BACKEND: "memory" (default) or "sqlite"."""
+    backend = os.getenv("CHECKPOINT_BACKEND", "memory").lower()
+    max_threads = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+    ttl_seconds = float(os.getenv("CHECKPOINT_TTL_SECONDS", "3600"))
+    if backend == "memory":
+        return BoundedMemorySaver(
+            max_threads=max_threads,
+            ttl_seconds=ttl_seconds,
+            max_bytes=int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024))),
+        )
+    if backend == "sqlite":
+        return SQLiteSaver(
+            os.getenv("CHECKPOINT_PATH", "data/checkpoints.sqlite"),
+            max_threads=max_threads,
+            ttl_seconds=ttl_seconds,
+            compact_every=int(os.getenv("CHECKPOINT_COMPACT_EVERY", "500")),
+        )
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
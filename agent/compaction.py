@@ -0,0 +1,147 @@
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import tiktoken
+
+# Catalog fields every product row carries
+BASE_FIELDS = ["name", "brand", "department", "prices.Each", "sku", "href"]
+
+# Extra catalog fields, added when the query mentions one of the keywords
+KEYWORD_FIELDS = [
+    (r"\bcase\b", ["prices.Case"]),
+    (r"per (pound|lb|unit)|price per|unit price", ["pricePer"]),
+    (r"weigh|\blbs?\b|pound|heav|light", ["weights.EACH", "weights.CASE"]),
+    (r"image|picture|photo|pic\b|look like", ["showImage"]),
+    (r"dimension|size|\bbig\b|small", ["dimensions.EACH"]),
+    (r"how many (items|pieces|slices)|item count|pack|per case", ["itemCounts.EACH", "itemCounts.CASE"]),
+    (r"discount|sale|deal|offer|promo", ["discount"]),
+    (r"stock|availab|sold out", ["empty"]),
+    (r"popular|best.?sell|top", ["popularityOrder"]),
+    (r"related|similar|alternative", ["relateds"]),
+]
+
+# Every catalog field; anything else (computed by a pipeline) is always kept
+CATALOG_FIELDS = {"showImage", "name", "brand", "department", "itemCounts", "dimensions", "weights", "images",
+                  "relateds", "prices", "pricePer", "sku", "discount", "empty", "href", "priceOrder",
+                  "popularityOrder", "score", "contentHash", "_id"}
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its vocabularies on first use; don't fail the turn when that is impossible
+        print(f"Could not load tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    """Count the tokens of `text` with the model's tokenizer."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def select_fields(query: str) -> List[str]:
+    """Catalog fields (dotted paths) the query needs."""
+    query = query.lower()
+    fields = list(BASE_FIELDS)
+    for pattern, extra in KEYWORD_FIELDS:
+        if re.search(pattern, query):
+            fields.extend(field for field in extra if field not in fields)
+    return fields
+
+
+def _lookup(record: Dict[str, Any], path: str):
+    value = record
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, list):
+        return ",".join(_cell(item) for item in value)
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def project_records(records: List[Dict[str, Any]], fields: List[str]) -> Tuple[List[str], List[List[str]]]:
+    """Project product records to the columns that are present in at least one record."""
+    extra = []
+    for record in records:
+        extra.extend(key for key in record if key not in CATALOG_FIELDS and key not in extra)
+    columns = [field for field in fields if any(_lookup(record, field) is not None for record in records)] + extra
+    rows = [[_cell(_lookup(record, column)) for column in columns] for record in records]
+    return columns, rows
+
+
+def compact_results(records: List[Dict[str, Any]], query: str, total: int = None, budget: int = None,
+                    model: str = "gpt-4.1") -> Tuple[str, Dict[str, int]]:
+    """
+    Encode search results as a compact table that fits a token budget.
+
+    Rows without a sku (counts, group-by results) are listed first as-is;
+    product rows are projected to the fields the query needs. Rows of
+    either kind are added until PROMPT_RESULT_TOKEN_BUDGET is reached.
+
+    Args:
+        records: Search results, best first
+        query: The user query, used to pick the columns
+        total: Total number of results, defaults to len(records)
+        budget: Token budget, defaults to PROMPT_RESULT_TOKEN_BUDGET
+        model: Model whose tokenizer measures the budget
+
+    Returns:
+        Tuple of (compact text, stats with raw/compact/saved token counts)
+    """
+    budget = budget or int(os.getenv("PROMPT_RESULT_TOKEN_BUDGET", "3000"))
+    total = len(records) if total is None else total
+    records = [record for record in records if isinstance(record, dict)]
+    aggregates = [record for record in records if not record.get("sku")]
+    products = [record for record in records if record.get("sku")]
+
+    lines = []
+    used = 0
+    shown = 0
+    # A $project without sku returns whole products here, so these rows are budgeted too
+    for record in aggregates:
+        line = ", ".join(f"{key}: {_cell(value)}" for key, value in record.items())
+        cost = count_tokens(line, model) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+        shown += 1
+    if products and shown == len(aggregates):
+        columns, rows = project_records(products, select_fields(query))
+        header = " | ".join(columns)
+        lines.append(header)
+        used += count_tokens(header, model) + 1
+        for row in rows:
+            line = " | ".join(row)
+            cost = count_tokens(line, model) + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+            shown += 1
+    lines.append(f"(showing {shown} of {total} results)")
+    text = "\n".join(lines)
+
+    raw_tokens = count_tokens(str(records), model)
+    compact_tokens = count_tokens(text, model)
+    stats = {"raw_tokens": raw_tokens, "compact_tokens": compact_tokens, "tokens_saved": max(raw_tokens - compact_tokens, 0)}
+    return text, stats
@@ -0,0 +1,106 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+from bson import ObjectId
+
+# Fields of a Pinecone match that make up a compact product record
+PINECONE_FIELDS = ("sku", "name", "brand", "department", "pricePer", "href", "showImage", "discount", "empty")
+
+
+def _pinecone_matches(results) -> List[Dict[str, Any]]:
+    """Flatten Pinecone query responses (objects, dicts or lists of them) into match dicts."""
+    if results is None:
+        return []
+    if isinstance(results, list):
+        matches = []
+        for item in results:
+            if isinstance(item, dict) and "matches" not in item:
+                matches.append(item)
+            else:
+                matches.extend(_pinecone_matches(item))
+        return matches
+    if hasattr(results, "to_dict"):
+        results = results.to_dict()
+    if isinstance(results, dict):
+        return [match if isinstance(match, dict) else match.to_dict() for match in results.get("matches", [])]
+    return []
+
+
+def normalize_pinecone_results(results) -> List[Dict[str, Any]]:
+    """Turn Pinecone matches into compact product records, best match first."""
+    records = []
+    for match in _pinecone_matches(results):
+        metadata = match.get("metadata") or {}
+        record = {field: metadata[field] for field in PINECONE_FIELDS if field in metadata}
+        record.setdefault("sku", match.get("id"))
+        prices = {}
+        if "price_each" in metadata:
+            prices["Each"] = metadata["price_each"]
+        if "price_case" in metadata:
+            prices["Case"] = metadata["price_case"]
+        if prices:
+            record["prices"] = prices
+        if "images" in metadata and "showImage" not in record:
+            record["showImage"] = metadata["images"]
+        records.append(record)
+    return records
+
+
+def normalize_mongo_results(results) -> List[Dict[str, Any]]:
+    """Drop storage-only fields from MongoDB documents; the _id of a $group row is its key and is kept."""
+    return [{k: v for k, v in doc.items() if k != "contentHash" and not (k == "_id" and isinstance(v, ObjectId))}
+            for doc in results or [] if isinstance(doc, dict)]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merge ranked product lists with reciprocal rank fusion, deduplicated by sku.
+
+    Each record scores sum(1 / (k + rank)) over the lists it appears in. Fields
+    from earlier lists win when the same sku appears in several lists.
+
+    Args:
+        ranked_lists: Lists of product records, each ordered best first
+        k: RRF damping constant
+
+    Returns:
+        Fused records, best first
+    """
+    scores = {}
+    merged = {}
+    for records in ranked_lists:
+        for rank, record in enumerate(records, start=1):
+            sku = record["sku"]
+            scores[sku] = scores.get(sku, 0.0) + 1.0 / (k + rank)
+            merged[sku] = {**record, **merged.get(sku, {})}
+    return [merged[sku] for sku in sorted(scores, key=lambda sku: -scores[sku])]
+
+
+def fuse_search_results(mongo_results, pinecone_results, top_n: int = None,
+                        mongo_total: int = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Normalize, deduplicate and rank MongoDB and Pinecone results.
+
+    Records without a sku (counts, group-by rows, ...) are answers in their
+    own right; they are kept in their original order ahead of the products.
+
+    Args:
+        mongo_results: Documents returned by the aggregation pipeline
+        pinecone_results: Pinecone query response(s)
+        top_n: Maximum number of records kept, defaults to SEARCH_RESULT_TOP_N
+        mongo_total: Documents the pipeline matched before the MongoDB result cap
+
+    Returns:
+        Tuple of (top records, total number of distinct records before the cap)
+    """
+    top_n = top_n or int(os.getenv("SEARCH_RESULT_TOP_N", "20"))
+    mongo_records = normalize_mongo_results(mongo_results)
+    aggregates = [record for record in mongo_records if not record.get("sku")]
+    products = reciprocal_rank_fusion(
+        [[record for record in mongo_records if record.get("sku")], normalize_pinecone_results(pinecone_results)],
+        k=int(os.getenv("RRF_K", "60")),
+    )
+    fused = aggregates + products
+    # Matches the MongoDB cap cut off never reached fusion but still count towards the total
+    uncounted = max((mongo_total or 0) - len(mongo_records), 0)
+    return fused[:top_n], len(fused) + uncounted
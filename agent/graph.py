@@ -1,46 +1,96 @@
+import os
 from typing import Literal
 from agent.state import AgentState
 from langgraph.graph import StateGraph, END
 from agent.nodes.clarification import clarification
-from agent.nodes.understanding import query_understanding
-from agent.nodes.planning import planning
-from agent.nodes.reasoning import reasoning
-from agent.tool_nodes.mongo_search import mongo_search
-from agent.tool_nodes.pinecone_search import pinecone_search
-from agent.tool_nodes.web_search import web_search
-from agent.nodes.response import response
-from langgraph.checkpoint.memory import InMemorySaver
+from agent.nodes.understanding import query_understanding, aquery_understanding
+from agent.nodes.planning import planning, aplanning
+from agent.nodes.front_end import front_end, afront_end
+from agent.nodes.reasoning import reasoning, areasoning
+from agent.tool_nodes.mongo_search import mongo_search, amongo_search
+from agent.tool_nodes.pinecone_search import pinecone_search, apinecone_search
+from agent.tool_nodes.web_search import web_search, aweb_search
+from agent.nodes.response import response, aresponse
+from agent.history import manage_history, amanage_history, refresh_summary, arefresh_summary
+from agent.fusion import fuse_search_results
+from agent.speculation import finish_speculation
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from agent.checkpointer import create_checkpointer
 
-def create_agent_graph():
-    memory = InMemorySaver()
+GRAPH_MODES = ("standard", "fused")
+
+def dual_node(name: str, func, afunc):
+    """A node that runs `func` under stream/invoke and the native coroutine `afunc` under astream/ainvoke."""
+    return RunnableLambda(func, afunc=afunc, name=name)
+
+def create_agent_graph(mode: str = None):
+    """
+    Build and compile the agent graph.
+
+    Args:
+        mode: "standard" runs understanding, planning and reasoning as separate
+            LLM calls before searching; "fused" lets a single front_end call
+            decide on clarification and generate the search queries.
+            Defaults to AGENT_GRAPH_MODE.
+
+    Returns:
+        The compiled graph
+    """
+    mode = (mode or os.getenv("AGENT_GRAPH_MODE", "standard")).lower()
+    if mode not in GRAPH_MODES:
+        raise ValueError(f"Unknown AGENT_GRAPH_MODE: {mode}")
+    memory = create_checkpointer()
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("query_understanding", query_understanding)
+    # Older turns are folded into a summary before any prompt sees the history
+    workflow.add_node("history", dual_node("history", manage_history, amanage_history))
+    if mode == "fused":
+        workflow.add_node("front_end", dual_node("front_end", front_end, afront_end))
+    else:
+        workflow.add_node("query_understanding", dual_node("query_understanding", query_understanding, aquery_understanding))
+        workflow.add_node("planning", dual_node("planning", planning, aplanning))
     workflow.add_node("clarification", clarification)
-    workflow.add_node("planning", planning)
-    workflow.add_node("reasoning", reasoning)
-    workflow.add_node("mongo_search", mongo_search)
-    workflow.add_node("pinecone_search", pinecone_search)
+    workflow.add_node("reasoning", dual_node("reasoning", reasoning, areasoning))
+    workflow.add_node("mongo_search", dual_node("mongo_search", mongo_search, amongo_search))
+    workflow.add_node("pinecone_search", dual_node("pinecone_search", pinecone_search, apinecone_search))
     workflow.add_node("aggregator", aggregate_search_results)
 # Create a branch node for parallel execution of MongoDB and Pinecone searches
     workflow.add_node("parallel_search",parallel_search)
-    workflow.add_node("web_search",web_search)
+    workflow.add_node("web_search",dual_node("web_search", web_search, aweb_search))
 
-    workflow.add_node("response",response)
+    workflow.add_node("response",dual_node("response", response, aresponse))
+    # The model rewrites the summary after the answer has streamed, not before the next turn's first prompt
+    workflow.add_node("summarize_history", dual_node("summarize_history", refresh_summary, arefresh_summary))
 
-    workflow.set_entry_point("query_understanding")
-    
-    def needs_clarification_router(state: AgentState) -> Literal["clarification", "planning"]:
-        return "clarification" if state["needs_clarification"] else "planning"
+    if mode == "fused":
+        workflow.set_entry_point("history")
+        workflow.add_edge("history", "front_end")
 
-    workflow.add_conditional_edges(
-        "query_understanding",
-        needs_clarification_router,
-        {"clarification": "clarification", "planning": "planning"}
-    )
+        # The front end already generated the search queries, so go straight to search
+        def front_end_router(state: AgentState) -> Literal["clarification", "search"]:
+            return "clarification" if state["needs_clarification"] else "search"
+
+        workflow.add_conditional_edges(
+            "front_end",
+            front_end_router,
+            {"clarification": "clarification", "search": "parallel_search"}
+        )
+        workflow.add_edge("clarification", "front_end")
+    else:
+        workflow.set_entry_point("history")
+        workflow.add_edge("history", "query_understanding")
+
+        def needs_clarification_router(state: AgentState) -> Literal["clarification", "planning"]:
+            return "clarification" if state["needs_clarification"] else "planning"
+
+        workflow.add_conditional_edges(
+            "query_understanding",
+            needs_clarification_router,
+            {"clarification": "clarification", "planning": "planning"}
+        )
 
-    workflow.add_edge("clarification", "query_understanding")
-    workflow.add_edge("planning", "reasoning")
+        workflow.add_edge("clarification", "query_understanding")
+        workflow.add_edge("planning", "reasoning")
     
     # After reasoning, route to appropriate search tools or END
     def search_router(state: AgentState) -> Literal["search", "response","web_search"]:
@@ -78,23 +128,29 @@ def create_agent_graph():
     # After aggregating results, go back to reasoning to analyze results
     workflow.add_edge("aggregator", "reasoning")
     workflow.add_edge("web_search", "response")
-    workflow.add_edge("response", END)
+    workflow.add_edge("response", "summarize_history")
+    workflow.add_edge("summarize_history", END)
     return workflow.compile(checkpointer=memory)
 
-def aggregate_search_results(state: AgentState) -> AgentState:
+def aggregate_search_results(state: AgentState, config: RunnableConfig) -> AgentState:
     """Aggregate results from MongoDB and Pinecone searches"""
+    # Both searches are done; unused speculative results of this turn are wasted
+    finish_speculation(config.get("configurable", {}).get("thread_id"))
     # In a real implementation, you would process and format the search results
     # print("#########################")
     mongo_results = state.get("mongo_results", [])
     pinecone_results = state.get("pinecone_results", [])
-    searched_result = mongo_results + pinecone_results
-    # print(mongo_results, pinecone_results, searched_result)
+    # Normalize both sources, dedup by sku, rank with reciprocal rank fusion and cap the prompt payload
+    searched_result, total = fuse_search_results(mongo_results, pinecone_results, mongo_total=state.get("mongo_total"))
     # Create a new state with is_database_searched set to True
     new_state = {**state}
     new_state["is_database_searched"] = True
     new_state["searched_result"] = searched_result
-    new_state["mongo_results"] = []
-    new_state["pinecone_results"] = []
+    new_state["searched_result_total"] = total
+    # Only the fused sample is kept; the raw results would pile up in the checkpoint on every search loop
+    new_state["mongo_results"] = None
+    new_state["mongo_total"] = 0
+    new_state["pinecone_results"] = None
     # For demonstration, we're assuming the search results are already in proper format
     # In a real scenario, you might need to transform them
     
@@ -0,0 +1,238 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+
+from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.compaction import count_tokens
+from agent.speculation import SKU_PATTERN
+
+load_dotenv()
+llm = ChatOpenAI(model="gpt-4o-mini", openai_api_key=os.getenv("OPENAI_API_KEY"))
+
+# State a new turn carries over from the previous one, besides the messages
+HISTORY_FIELDS = ("history_summary", "pinned_skus", "summarized_message_count", "pending_history")
+
+summary_prompt = ChatPromptTemplate.from_template("""
+You keep the running summary of a conversation between a user and a cheese shopping assistant.
+Update the summary with the turns below, so that a later step can resolve references like "the cheaper one" or "that brand".
+Keep the user's preferences and constraints (cheese types, brands, budgets, quantities) and the products the assistant suggested, with their sku.
+Drop greetings, formatting and product details that can be looked up again by sku.
+Write plain text of at most {max_words} words.
+
+Current summary: {summary}
+Turns to add:
+{turns}
+""")
+
+
+def history_settings() -> Dict[str, Any]:
+    """History limits from the environment."""
+    return {
+        "enabled": os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "keep_turns": max(1, int(os.getenv("HISTORY_KEEP_TURNS", "3"))),
+        "token_budget": int(os.getenv("HISTORY_TOKEN_BUDGET", "1500")),
+        "summary_tokens": int(os.getenv("HISTORY_SUMMARY_TOKENS", "200")),
+        "max_pinned_skus": int(os.getenv("HISTORY_MAX_PINNED_SKUS", "20")),
+        "summarizer": os.getenv("HISTORY_SUMMARIZER", "llm").lower(),
+    }
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a user message."""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def clip_text(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """
+    Shorten `text` to at most `max_tokens` tokens.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token limit
+        from_end: Keep the end of the text instead of the beginning
+
+    Returns:
+        The text, or a clipped copy marked with "…"
+    """
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    keep = len(text) * max_tokens // tokens
+    while keep > 0:
+        clipped = "…" + text[len(text) - keep:] if from_end else text[:keep] + "…"
+        if count_tokens(clipped) <= max_tokens:
+            return clipped
+        keep = keep * 9 // 10
+    return ""
+
+
+def message_line(message: BaseMessage) -> str:
+    role = "User" if isinstance(message, HumanMessage) else "Assistant"
+    return f"{role}: {' '.join(str(message.content).split())}"
+
+
+def pin_skus(messages: List[BaseMessage], pinned: List[str], limit: int) -> List[str]:
+    """SKUs mentioned in the conversation, most recent first, merged with the ones pinned before."""
+    skus = []
+    for message in reversed(messages):
+        skus.extend(SKU_PATTERN.findall(str(message.content)))
+    return list(dict.fromkeys(skus + list(pinned or [])))[:limit]
+
+
+def render_history(state: AgentState, messages: List[BaseMessage] = None) -> str:
+    """
+    The conversation history for a prompt, within HISTORY_TOKEN_BUDGET.
+
+    The rolling summary and the pinned SKUs come first; the verbatim turns
+    fill the rest of the budget from the most recent message backwards.
+
+    Args:
+        state: Agent state with the summary and pinned SKUs
+        messages: Messages to render, defaults to state["messages"]
+
+    Returns:
+        The history as "User:" / "Assistant:" lines
+    """
+    settings = history_settings()
+    if messages is None:
+        messages = state.get("messages", [])
+    if not settings["enabled"]:
+        return "\n".join(message_line(message) for message in messages)
+
+    header = []
+    if state.get("history_summary"):
+        header.append(f"Summary of the earlier conversation: {state['history_summary']}")
+    if state.get("pinned_skus"):
+        header.append(f"Products referenced earlier (sku): {', '.join(state['pinned_skus'])}")
+    remaining = settings["token_budget"] - count_tokens("\n".join(header))
+
+    lines = []
+    for message in reversed(messages):
+        line = message_line(message)
+        tokens = count_tokens(line)
+        if tokens > remaining:
+            # Older messages are covered by the summary; only the newest one is worth a clipped copy
+            if not lines and remaining > 0:
+                lines.append(clip_text(line, remaining))
+            break
+        lines.append(line)
+        remaining -= tokens
+    return "\n".join(header + lines[::-1])
+
+
+def _turns_text(turns: List[List[BaseMessage]], settings: Dict[str, Any]) -> str:
+    return "\n".join(clip_text(message_line(message), settings["token_budget"]) for turn in turns for message in turn)
+
+
+def extractive_summary(summary: str, turns: List[List[BaseMessage]], max_tokens: int) -> str:
+    """Summary without a model call: the user's requests, most recent kept when it gets too long."""
+    requests = [message_line(message)[len("User: "):] for turn in turns for message in turn
+                if isinstance(message, HumanMessage)]
+    text = " ".join(part for part in [summary] + [f"The user asked: {request}" for request in requests] if part)
+    return clip_text(text, max_tokens, from_end=True)
+
+
+def _prepare(state: AgentState) -> Tuple[Dict[str, Any], List[BaseMessage], List[List[BaseMessage]]]:
+    """Split the carried-over messages into the turns kept verbatim and the ones folded into the summary."""
+    settings = history_settings()
+    turns = split_turns(state.get("messages", []))
+    kept = turns[-settings["keep_turns"]:]
+    folded = turns[:-settings["keep_turns"]]
+    # Long answers can blow the budget with fewer turns; fold them too, but always keep the last turn
+    turn_budget = settings["token_budget"] - settings["summary_tokens"]
+    while len(kept) > 1 and count_tokens(_turns_text(kept, settings)) > turn_budget:
+        folded.append(kept.pop(0))
+    return settings, [message for turn in kept for message in turn], folded
+
+
+def _summary_prompt(state: AgentState, settings: Dict[str, Any]):
+    return summary_prompt.invoke({
+        "summary": state.get("history_summary") or "(none)",
+        "turns": state["pending_history"],
+        "max_words": settings["summary_tokens"] * 3 // 4,
+    })
+
+
+def manage_history(state: AgentState) -> AgentState:
+    """
+    Keep the last HISTORY_KEEP_TURNS turns verbatim and fold older ones into the rolling summary.
+
+    The folding is extractive, so the turn doesn't wait on a model call; with
+    HISTORY_SUMMARIZER=llm the folded turns are kept in pending_history for
+    refresh_summary() to rewrite the summary after the answer.
+    """
+    settings = history_settings()
+    if not settings["enabled"]:
+        return state
+    settings, kept, folded = _prepare(state)
+    if not folded:
+        return {**state, "pinned_skus": pin_skus(kept, state.get("pinned_skus", []), settings["max_pinned_skus"])}
+    folded_messages = [message for turn in folded for message in turn]
+    summary = extractive_summary(state.get("history_summary", ""), folded, settings["summary_tokens"])
+    pending = ""
+    if settings["summarizer"] == "llm":
+        # Turns a failed refresh left behind are summarized together with these
+        pending = "\n".join(part for part in (state.get("pending_history", ""), _turns_text(folded, settings)) if part)
+        pending = clip_text(pending, settings["token_budget"], from_end=True)
+    print(f"History: folded {len(folded)} turns into the summary, keeping {len(kept)} messages")
+    return {
+        **state,
+        "messages": kept,
+        "history_summary": summary,
+        "pinned_skus": pin_skus(folded_messages + kept, state.get("pinned_skus", []), settings["max_pinned_skus"]),
+        "summarized_message_count": state.get("summarized_message_count", 0) + len(folded_messages),
+        "pending_history": pending,
+    }
+
+
+async def amanage_history(state: AgentState) -> AgentState:
+    """Async version of manage_history(); it makes no model call, so it runs the same code."""
+    return manage_history(state)
+
+
+def _needs_refresh(state: AgentState, settings: Dict[str, Any]) -> bool:
+    return settings["enabled"] and settings["summarizer"] == "llm" and bool(state.get("pending_history"))
+
+
+def _refreshed(state: AgentState, settings: Dict[str, Any], summary: str) -> AgentState:
+    print("History: summary refreshed by the model")
+    return {**state, "history_summary": clip_text(summary, settings["summary_tokens"]), "pending_history": ""}
+
+
+def refresh_summary(state: AgentState) -> AgentState:
+    """Rewrite the rolling summary with the model once the answer is out; the next turn starts from it."""
+    settings = history_settings()
+    if not _needs_refresh(state, settings):
+        return state
+    try:
+        summary = cached_invoke("history", llm, _summary_prompt(state, settings)).content
+    except Exception as e:
+        # The extractive summary stays; the pending turns are retried after the next answer
+        print(f"History summarization failed: {e}")
+        return state
+    return _refreshed(state, settings, summary)
+
+
+async def arefresh_summary(state: AgentState) -> AgentState:
+    """Async version of refresh_summary()."""
+    settings = history_settings()
+    if not _needs_refresh(state, settings):
+        return state
+    try:
+        response = await acached_invoke("history", llm, _summary_prompt(state, settings))
+    except Exception as e:
+        print(f"History summarization failed: {e}")
+        return state
+    return _refreshed(state, settings, response.content)
@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cheese_data.json")
+
+# Words a message made only of greetings / small talk consists of. "is", "it" and "good" are left out:
+# "how is it?" or "whats good" mid-conversation asks about a product
+GREETING_WORDS = {"hi", "hello", "hey", "hiya", "howdy", "greetings", "yo", "sup", "morning", "afternoon",
+                  "evening", "day", "how", "are", "you", "doing", "today", "what's", "whats", "up",
+                  "going", "there", "everyone", "all", "again", "nice", "to", "meet"}
+GREETING_CORE = {"hi", "hello", "hey", "hiya", "howdy", "greetings", "yo", "sup", "morning", "afternoon", "evening",
+                 "how", "what's", "whats"}
+# "good" only greets as part of "good morning" and the like
+GOOD_TIMES = {"morning", "afternoon", "evening", "day"}
+
+# Shopping terms that make a message catalog-related on their own
+SHOP_TERMS = {"cheese", "cheeses", "price", "prices", "priced", "cost", "costs", "cheap", "cheapest", "expensive",
+              "brand", "brands", "sku", "skus", "department", "departments", "discount", "discounts", "product",
+              "products", "catalog", "lb", "lbs"}
+
+# Words from product names and brands that are too generic to imply a cheese query
+COMMON_WORDS = {"with", "fresh", "white", "gold", "free", "grade", "label", "classic", "small", "medium", "mini",
+                "ball", "block", "thin", "wrap", "bulk", "tradition", "import", "imported", "domestic", "frozen",
+                "fancy", "mild", "sharp", "hard", "organic", "smoke", "smoked", "pepper", "american", "french",
+                "indian", "greek", "bulgarian", "cups", "portions", "string", "roma", "president", "packer", "stella",
+                "cucina", "royal", "good", "culture", "select", "farms", "valley", "north", "beach", "pacific",
+                "california", "crafters", "commodity", "laughing", "premium", "grilling", "processed", "whipped",
+                "yellow", "jack", "blend", "tub", "pail", "brine", "feather", "slices", "slice", "sliced", "loaf"}
+
+PRICE_PATTERN = re.compile(r"\$\s?\d|\b(under|below|over|above|less than|more than)\s+\$?\d+")
+
+
+@lru_cache(maxsize=1)
+def load_catalog(path: str = CATALOG_PATH) -> List[Dict[str, Any]]:
+    """Products of the catalog file the vocabulary is built from."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load catalog vocabulary: {e}")
+        return []
+
+
+def catalog_values(field: str) -> List[str]:
+    """Distinct values of a catalog field, e.g. every brand or department."""
+    return sorted({str(product[field]) for product in load_catalog() if product.get(field)})
+
+
+@lru_cache(maxsize=1)
+def catalog_vocabulary() -> Set[str]:
+    """Cheese types, brands and departments from the product catalog, lowercased."""
+    vocabulary = set()
+    for product in load_catalog():
+        text = " ".join(str(product.get(field, "")) for field in ("name", "brand", "department"))
+        vocabulary.update(word for word in re.findall(r"[a-z]+", text.lower())
+                          if len(word) >= 4 and word not in COMMON_WORDS)
+    return vocabulary
+
+
+def _words(query: str):
+    return re.findall(r"[a-z$][a-z0-9'$]*", query.lower())
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if word.endswith("s") and len(word) > 4 else word
+
+
+def _is_greeting(words: List[str]) -> bool:
+    for index, word in enumerate(words):
+        if word == "good" and index + 1 < len(words) and words[index + 1] in GOOD_TIMES:
+            continue
+        if word not in GREETING_WORDS:
+            return False
+    return any(word in GREETING_CORE for word in words)
+
+
+def classify_query(query: str, history: List[Any] = None) -> Optional[Dict[str, Any]]:
+    """
+    Decide the clear cases of query understanding without calling the LLM.
+
+    On the first turn, a message made only of greetings and small talk needs
+    clarification; a message that mentions a price or a cheese type, brand or
+    department from the catalog can proceed. Anything else is ambiguous.
+
+    Args:
+        query: The user query
+        history: Earlier messages of the conversation; with any, short
+            messages are follow-ups and never taken for a greeting
+
+    Returns:
+        The understanding result (needs_clarification, reason,
+        suggested_clarifying_question), or None when the LLM must decide
+    """
+    words = _words(query)
+    if not words:
+        return None
+
+    if not history and _is_greeting(words):
+        return {
+            "needs_clarification": True,
+            "reason": "User provided a greeting.",
+            "suggested_clarifying_question": "Hello! How can I help you with our cheese products today?",
+        }
+
+    vocabulary = catalog_vocabulary()
+    matched = sorted({word for word in words if word in SHOP_TERMS or _stem(word) in vocabulary or word in vocabulary})
+    if matched or PRICE_PATTERN.search(query.lower()):
+        terms = ", ".join(matched) if matched else "a price"
+        return {
+            "needs_clarification": False,
+            "reason": f"Query mentions catalog terms ({terms}) and can proceed.",
+            "suggested_clarifying_question": "",
+        }
+    return None
+
+
+intent_stats = {"turns": 0, "greeting": 0, "catalog": 0, "llm": 0}
+_stats_lock = threading.Lock()
+
+
+def fast_path_enabled() -> bool:
+    return os.getenv("INTENT_FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def fast_path_understanding(query: str, history: List[Any] = None) -> Optional[Dict[str, Any]]:
+    """Classify the query locally if the fast path is enabled, recording how the turn was decided."""
+    result = classify_query(query, history) if fast_path_enabled() else None
+    outcome = "llm" if result is None else ("greeting" if result["needs_clarification"] else "catalog")
+    with _stats_lock:
+        intent_stats["turns"] += 1
+        intent_stats[outcome] += 1
+    if result is not None:
+        print(f"Understanding fast path ({outcome}): {result['reason']}")
+    return result
+
+
+def get_intent_stats() -> Dict[str, Any]:
+    """Counts of turns decided locally vs by the LLM and the fraction short-circuited."""
+    with _stats_lock:
+        stats = dict(intent_stats)
+    short_circuited = stats["greeting"] + stats["catalog"]
+    stats["short_circuit_rate"] = short_circuited / stats["turns"] if stats["turns"] else 0.0
+    return stats
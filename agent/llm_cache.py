@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Type
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+
+class MemoryLLMCache:
+    """Bounded in-process LRU cache of LLM outputs."""
+
+    backend = "memory"
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteLLMCache:
+    """LRU cache of LLM outputs persisted in SQLite."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = "data/llm_cache.sqlite", max_size: int = 10000):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, last_access) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_size
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+def create_llm_cache():
+    """Create the LLM cache selected by LLM_CACHE_BACKEND: "memory" (default), "sqlite" or "none"."""
+    backend = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    max_size = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SQLiteLLMCache(os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite"), max_size=max_size)
+    if backend == "memory":
+        return MemoryLLMCache(max_size=max_size)
+    raise ValueError(f"Unknown LLM_CACHE_BACKEND: {backend}")
+
+
+llm_cache = create_llm_cache()
+node_stats = defaultdict(lambda: {"hits": 0, "misses": 0, "bypassed": 0})
+_stats_lock = threading.Lock()
+
+
+def _count(node: str, outcome: str):
+    with _stats_lock:
+        node_stats[node][outcome] += 1
+
+
+def cache_disabled_for(node: str) -> bool:
+    """Whether LLM_CACHE_DISABLED_NODES (comma-separated node names) opts this node out."""
+    disabled = {name.strip() for name in os.getenv("LLM_CACHE_DISABLED_NODES", "").split(",") if name.strip()}
+    return llm_cache is None or node in disabled
+
+
+def model_name(llm) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def make_cache_key(llm, prompt, schema: Type[BaseModel] = None) -> str:
+    """Hash of (model, prompt messages, structured-output schema)."""
+    messages = prompt.to_messages() if hasattr(prompt, "to_messages") else prompt
+    payload = {
+        "model": model_name(llm),
+        "prompt": [[message.type, message.content] for message in messages],
+        "schema": schema.model_json_schema() if schema is not None else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cached_invoke(node: str, llm, prompt, schema: Type[BaseModel] = None):
+    """
+    Invoke an LLM through the shared exact-match cache.
+
+    Args:
+        node: Name of the calling graph node (for statistics and opt-out)
+        llm: Chat model
+        prompt: Prompt value or list of messages
+        schema: Pydantic model for structured output, or None for a plain message
+
+    Returns:
+        An instance of `schema`, or an AIMessage when no schema is given
+    """
+    if cache_disabled_for(node):
+        _count(node, "bypassed")
+        return llm.with_structured_output(schema).invoke(prompt) if schema is not None else llm.invoke(prompt)
+
+    key = make_cache_key(llm, prompt, schema)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        _count(node, "hits")
+        return schema.model_validate_json(cached) if schema is not None else AIMessage(content=cached)
+
+    _count(node, "misses")
+    if schema is not None:
+        result = llm.with_structured_output(schema).invoke(prompt)
+        llm_cache.set(key, result.model_dump_json())
+    else:
+        result = llm.invoke(prompt)
+        llm_cache.set(key, result.content)
+    return result
+
+
+async def acached_invoke(node: str, llm, prompt, schema: Type[BaseModel] = None):
+    """Async version of cached_invoke, sharing its cache and statistics."""
+    if cache_disabled_for(node):
+        _count(node, "bypassed")
+        return await (llm.with_structured_output(schema).ainvoke(prompt) if schema is not None else llm.ainvoke(prompt))
+
+    key = make_cache_key(llm, prompt, schema)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        _count(node, "hits")
+        return schema.model_validate_json(cached) if schema is not None else AIMessage(content=cached)
+
+    _count(node, "misses")
+    if schema is not None:
+        result = await llm.with_structured_output(schema).ainvoke(prompt)
+        llm_cache.set(key, result.model_dump_json())
+    else:
+        result = await llm.ainvoke(prompt)
+        llm_cache.set(key, result.content)
+    return result
+
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    """Per-node hit statistics of the LLM cache."""
+    with _stats_lock:
+        nodes = {}
+        for node, counts in node_stats.items():
+            lookups = counts["hits"] + counts["misses"]
+            nodes[node] = {**counts, "hit_rate": counts["hits"] / lookups if lookups else 0.0}
+    return {
+        "backend": llm_cache.backend if llm_cache is not None else "none",
+        "entries": len(llm_cache) if llm_cache is not None else 0,
+        "evictions": llm_cache.evictions if llm_cache is not None else 0,
+        "nodes": nodes,
+    }
@@ -0,0 +1,125 @@
+from typing import List
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import HumanMessage
+from langchain.chat_models import init_chat_model
+from pydantic import BaseModel
+from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.intent import classify_query, fast_path_enabled
+from agent.history import render_history
+from agent.nodes.reasoning import cheese_example
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+llm = init_chat_model("gpt-4.1",openai_api_key=os.getenv("OPENAI_API_KEY"))
+
+class LLMOutput(BaseModel):
+    needs_clarification: bool
+    reason: str
+    suggested_clarifying_question: str
+    plan: List[str]
+    thought: str
+    mongo_query: str
+    pinecone_query: str
+
+front_end_prompt = ChatPromptTemplate.from_template("""
+You are the front end of a cheese product chatbot, behaving like a professional cheese sales expert.
+In one step you decide whether the user's query can be acted on and, if it can, generate the database searches that answer it.
+
+User query: {user_query}
+History: {history}
+Example cheese data schema: {cheese_example}
+
+### 1. Clarification
+First, understand the query in the context of the history.
+Set needs_clarification = true ONLY IF:
+1.  It's a simple greeting (e.g., "hello", "how are you?"). Respond politely and ask how you can assist with cheese.
+2.  It's completely unrelated to cheese, our products, or food/shopping in general (e.g., "what's the capital of France?"). Politely state you can only help with cheese-related queries.
+In that case put the question in suggested_clarifying_question and leave plan, mongo_query and pinecone_query empty.
+Otherwise set needs_clarification = false and suggested_clarifying_question = "".
+
+### 2. Plan (optional)
+A short plan of at most 3 steps. Reduce the steps as much as possible; an empty list is fine.
+
+### 3. Search queries
+Generate a MongoDB aggregation pipeline and a Pinecone query that answer the user's question.
+Available MongoDB fields: name, brand, department (the category, like "Sliced Cheese"), weights, prices (Case and Each),
+pricePer, sku, discount, popularityOrder, priceOrder, itemCounts, dimensions, images, relateds, empty, href.
+- Prioritize MongoDB. The Pinecone query is for conceptual similarity searches only; if it is not necessary, make it "".
+- As default the normal price is the each price and if there is no requirement about the data fields, only search for the name,brand,department(category),price,sku,href,images.
+- Always don't search the _id field and sort by the price.(set the _id project to 0 and sort by the price)
+- If the user asks about the previous conversation, identify the product sku and use the sku to search the database.
+- For counts or other aggregations, compute them with one correct pipeline instead of listing the products.
+
+**VERY IMPORTANT for `mongo_query`:**
+- The entire `mongo_query` string MUST be a valid JSON array of pipeline stages.
+- ALL keys and ALL string values within the pipeline MUST be enclosed in **double quotes**.
+- Example: `"[{{\"$match\": {{\"brand\": \"Schreiber\"}}}}, {{\"$project\": {{\"name\": 1, \"brand\": 1, \"prices.Each\": 1, \"_id\": 0}}}}, {{\"$sort\": {{\"prices.Each\": 1}}}} ]"`
+
+Respond with a JSON object in this format:
+{{
+  "needs_clarification": true/false,
+  "reason": "Brief explanation for your decision",
+  "suggested_clarifying_question": "question (only if needs_clarification is true, otherwise empty string)",
+  "plan": ["Step 1: description", ...],
+  "thought": "Your reasoning about the query and search strategy",
+  "mongo_query": "MongoDB aggregation pipeline in JSON format",
+  "pinecone_query": "Search term for Pinecone"
+}}
+""")
+
+
+def _update(state: AgentState, messages, result: LLMOutput) -> AgentState:
+    return {
+        **state,
+        "messages": messages,
+        "query": state["query"],
+        "needs_clarification": result.needs_clarification,
+        "reason": result.reason,
+        "suggested_clarifying_question": result.suggested_clarifying_question,
+        "plan": result.plan,
+        "thought": state.get("thought", []) + [result.thought],
+        "is_database_searched": False,
+        "is_result_sufficient": False,
+        "needs_web_search": False,
+        "mongo_query": result.mongo_query,
+        "pinecone_query": result.pinecone_query,
+        "web_search_query": "",
+        "mongo_results": [],
+        "pinecone_results": []
+    }
+
+
+def _greeting_result(user_query: str, history):
+    # A greeting needs no search queries, so the LLM call is skipped entirely
+    fast_result = classify_query(user_query, history) if fast_path_enabled() else None
+    if fast_result is not None and fast_result["needs_clarification"]:
+        return LLMOutput(**fast_result, plan=[], thought="", mongo_query="", pinecone_query="")
+    return None
+
+
+def _prompt(state: AgentState):
+    return front_end_prompt.invoke({
+        "user_query": state["query"],
+        "history": render_history(state),
+        "cheese_example": cheese_example
+    })
+
+
+def front_end(state: AgentState) -> AgentState:
+    """Understanding, planning and query generation in one structured LLM call."""
+    messages = state.get("messages", []) + [HumanMessage(content=state["query"])]
+    result = _greeting_result(state["query"], state.get("messages", []))
+    if result is None:
+        result = cached_invoke("front_end", llm, _prompt(state), LLMOutput)
+    return _update(state, messages, result)
+
+
+async def afront_end(state: AgentState) -> AgentState:
+    """Async version of front_end()."""
+    messages = state.get("messages", []) + [HumanMessage(content=state["query"])]
+    result = _greeting_result(state["query"], state.get("messages", []))
+    if result is None:
+        result = await acached_invoke("front_end", llm, _prompt(state), LLMOutput)
+    return _update(state, messages, result)
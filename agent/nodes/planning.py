@@ -1,5 +1,7 @@
 import json
 from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.history import render_history
 from langchain_core.messages import HumanMessage
 from langgraph.types import interrupt
 from langchain_core.prompts import ChatPromptTemplate
@@ -78,7 +80,13 @@ cheese_example = {
   }
 def planning(state: AgentState) -> AgentState:
     query = state["query"]
-    prompt = planning_prompt.invoke({"query": state["messages"], "cheese_example": cheese_example})
-    response = llm.invoke(prompt)
+    prompt = planning_prompt.invoke({"query": render_history(state), "cheese_example": cheese_example})
+    response = cached_invoke("planning", llm, prompt)
+    state["plan"] = json.loads(response.content)["plan"]
+    return state
+
+async def aplanning(state: AgentState) -> AgentState:
+    prompt = planning_prompt.invoke({"query": render_history(state), "cheese_example": cheese_example})
+    response = await acached_invoke("planning", llm, prompt)
     state["plan"] = json.loads(response.content)["plan"]
     return state
@@ -1,6 +1,9 @@
 from langchain.prompts import ChatPromptTemplate
 from pydantic import BaseModel
 from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.compaction import compact_results
+from agent.history import render_history
 from langgraph.types import interrupt
 from langchain.chat_models import init_chat_model
 import os
@@ -58,6 +61,7 @@ User query: {user_query}
 History: {history}
 Is database search already performed: {is_database_searched}
 Search results: {searched_result}
+Total number of matching results: {searched_result_total}
 Example cheese data schema: {cheese_example}
 
 Your system has three search capabilities:
@@ -122,19 +126,28 @@ Only use double quotes: `[{{\"$match\": {{\"brand\": \"Schreiber\"}}}}]`
 """)
 
 
-def reasoning(state: AgentState) -> AgentState:
+def _prepare(state: AgentState):
     is_database_searched = state.get("is_database_searched", False)
     
+    searched_result = state.get("searched_result", {})
+    tokens_saved = 0
+    if is_database_searched:
+        searched_result, stats = compact_results(searched_result, state["query"], total=state.get("searched_result_total"))
+        tokens_saved = stats["tokens_saved"]
+        print(f"Reasoning prompt results: {stats}")
+    
     prompt = reasoning_prompt.invoke({
         "user_query": state["query"], 
-        "history": state["messages"][:-1],
+        "history": render_history(state, state["messages"][:-1]),
         "is_database_searched": is_database_searched,
-        "searched_result": state.get("searched_result", {}),
+        "searched_result": searched_result,
+        "searched_result_total": state.get("searched_result_total", 0),
         "cheese_example": cheese_example
     })
-    
-    response = llm.with_structured_output(LLMOutput).invoke(prompt)
-    
+    return prompt, tokens_saved
+
+
+def _update(state: AgentState, response: LLMOutput, tokens_saved: int) -> AgentState:
     # Add new thought to existing thoughts list
     if "thought" not in state:
         state["thought"] = []
@@ -148,6 +161,7 @@ def reasoning(state: AgentState) -> AgentState:
     new_state["web_search_query"] = response.web_search_query
     new_state["mongo_results"] = []
     new_state["pinecone_results"] = []
+    new_state["prompt_tokens_saved"] = state.get("prompt_tokens_saved", 0) + tokens_saved
     print(new_state)
     # If results are not sufficient and web search is needed, interrupt for user confirmation
     if (not response.is_result_sufficient) and response.needs_web_search:
@@ -159,3 +173,14 @@ def reasoning(state: AgentState) -> AgentState:
     
     return new_state
 
+
+def reasoning(state: AgentState) -> AgentState:
+    prompt, tokens_saved = _prepare(state)
+    response = cached_invoke("reasoning", llm, prompt, LLMOutput)
+    return _update(state, response, tokens_saved)
+
+
+async def areasoning(state: AgentState) -> AgentState:
+    prompt, tokens_saved = _prepare(state)
+    response = await acached_invoke("reasoning", llm, prompt, LLMOutput)
+    return _update(state, response, tokens_saved)
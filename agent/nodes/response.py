@@ -1,4 +1,6 @@
 from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.compaction import compact_results
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import AIMessage, HumanMessage,SystemMessage
@@ -17,6 +19,7 @@ User's Query:
 
 Information from Database Search (e.g., product details, inventory):
 {database_results}
+Total number of database results: {database_total}
 
 Information from Web Search (e.g., articles, reviews, general knowledge, images):
 {web_results}
@@ -36,30 +39,56 @@ And please show the products in the streamlit markdown format. And show the prod
 Begin your response:
 """
 
-def response(state: AgentState) -> AgentState:
-    """
-    Generates the final AI response for the user based on aggregated search results.
-    """
+def _prepare(state: AgentState):
     user_query = state.get("query", "")
     database_results = state.get("searched_result", {}) # This is from your aggregate_search_results
     web_results = state.get("web_search_results", [])
 
-    # Basic error handling or empty state
-    if not user_query:
-        return {"final_response": "I didn't receive a query. How can I help you?"}
+    database_total = state.get("searched_result_total", len(database_results))
+    database_results, stats = compact_results(database_results or [], user_query, total=database_total)
+    print(f"Response prompt results: {stats}")
 
     prompt = [
         SystemMessage(content=RESPONSE_PROMPT_TEMPLATE.format(
             app_name="Cheese Shopping Assistant", # Or your app's actual name
             user_query=user_query,
             database_results=database_results,
+            database_total=database_total,
             web_results=web_results
         )),
         HumanMessage(content=f"Please generate a response for my query: {user_query}")
     ]
+    return prompt, stats
 
-    ai_response = llm.invoke(prompt)
-    print(ai_response.content)
+
+def _update(state: AgentState, ai_response, stats) -> AgentState:
     final_response = ai_response.content
     messages = state["messages"] + [AIMessage(content=ai_response.content)]
-    return {"messages":messages, "final_response":final_response}
+    prompt_tokens_saved = state.get("prompt_tokens_saved", 0) + stats["tokens_saved"]
+    return {"messages":messages, "final_response":final_response, "prompt_tokens_saved": prompt_tokens_saved}
+
+
+def response(state: AgentState) -> AgentState:
+    """
+    Generates the final AI response for the user based on aggregated search results.
+    """
+    # Basic error handling or empty state
+    if not state.get("query", ""):
+        return {"final_response": "I didn't receive a query. How can I help you?"}
+
+    prompt, stats = _prepare(state)
+    # The tokens reach the user through stream_mode="messages" while this call runs
+    ai_response = cached_invoke("response", llm, prompt)
+    return _update(state, ai_response, stats)
+
+
+async def aresponse(state: AgentState) -> AgentState:
+    """
+    Async version of response().
+    """
+    if not state.get("query", ""):
+        return {"final_response": "I didn't receive a query. How can I help you?"}
+
+    prompt, stats = _prepare(state)
+    ai_response = await acached_invoke("response", llm, prompt)
+    return _update(state, ai_response, stats)
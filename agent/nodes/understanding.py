@@ -1,5 +1,10 @@
 import json
 from agent.state import AgentState
+from agent.llm_cache import acached_invoke, cached_invoke
+from agent.intent import fast_path_understanding
+from agent.speculation import start_speculation
+from agent.history import render_history
+from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import HumanMessage
 from langgraph.types import interrupt
 from langchain_core.prompts import ChatPromptTemplate
@@ -53,19 +58,19 @@ LLM Output: {{\"needs_clarification\": false, \"reason\": \"Query is specific an
 Note: Be professional and knowledgeable like a cheese sales expert.
 """)
 
-def query_understanding(state: AgentState) -> AgentState:
-    
+def _prepare(state: AgentState):
     user_query = state["query"]
     # print(state)
-    if "messages" in state.keys():
-        prompt = query_prompt.invoke({"user_query": user_query, "history": state["messages"]})
-        messages = state["messages"] + [HumanMessage(content=user_query)]
-    else:
-        prompt = query_prompt.invoke({"user_query": user_query, "history": []})
-        messages = [HumanMessage(content=user_query)]
-    response = llm.with_structured_output(LLMOutput).invoke(prompt)
+    prompt = query_prompt.invoke({"user_query": user_query, "history": render_history(state)})
+    messages = state.get("messages", []) + [HumanMessage(content=user_query)]
+    return prompt, messages
+
 
-    result = response
+def _update(state: AgentState, config: RunnableConfig, messages, result: LLMOutput) -> AgentState:
+    user_query = state["query"]
+    # Search the likely products while planning and reasoning wait for the LLM
+    if not result.needs_clarification:
+        start_speculation(config.get("configurable", {}).get("thread_id"), user_query, state.get("messages", []))
     
     return {
         **state,
@@ -74,4 +79,25 @@ def query_understanding(state: AgentState) -> AgentState:
         "needs_clarification": result.needs_clarification,
         "reason": result.reason,
         "suggested_clarifying_question": result.suggested_clarifying_question
-    }
\ No newline at end of file
+    }
+
+
+def query_understanding(state: AgentState, config: RunnableConfig) -> AgentState:
+    prompt, messages = _prepare(state)
+    # Greetings and obvious catalog queries are decided without the LLM
+    fast_result = fast_path_understanding(state["query"], state.get("messages", []))
+    if fast_result is not None:
+        result = LLMOutput(**fast_result)
+    else:
+        result = cached_invoke("query_understanding", llm, prompt, LLMOutput)
+    return _update(state, config, messages, result)
+
+
+async def aquery_understanding(state: AgentState, config: RunnableConfig) -> AgentState:
+    prompt, messages = _prepare(state)
+    fast_result = fast_path_understanding(state["query"], state.get("messages", []))
+    if fast_result is not None:
+        result = LLMOutput(**fast_result)
+    else:
+        result = await acached_invoke("query_understanding", llm, prompt, LLMOutput)
+    return _update(state, config, messages, result)
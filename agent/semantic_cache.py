@@ -0,0 +1,243 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from data.embeddings import aget_embedding, get_embedding
+from data.catalog_version import get_catalog_version
+
+
+def history_fingerprint(messages: List[BaseMessage], summary: str = "") -> str:
+    """Fingerprint of a conversation history; answers are only reused for the same history."""
+    if not messages and not summary:
+        return ""
+    digest = hashlib.sha256()
+    digest.update(f"{summary}\0".encode("utf-8"))
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SemanticResponseCache:
+    """Cache of final answers, matched by embedding similarity of the query.
+
+    An entry is only reused when the history fingerprint and the catalog
+    version match and the cosine similarity reaches `threshold`. Entries
+    expire after `ttl` seconds and the least recently used entry is evicted
+    beyond `max_entries`.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: Optional[float] = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, embedding, history_key: str, catalog_version) -> Optional[Dict[str, Any]]:
+        """Return the most similar compatible entry, or None."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.time())
+            best_key, best_score = None, self.threshold
+            for key, entry in self._entries.items():
+                if entry["history_key"] != history_key or entry["catalog_version"] != catalog_version:
+                    continue
+                score = float(entry["embedding"] @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return {**self._entries[best_key], "similarity": best_score}
+
+    def store(self, query: str, embedding, history_key: str, catalog_version, final_response: str):
+        key = (history_key, catalog_version, query.strip().lower())
+        with self._lock:
+            self._entries[key] = {
+                "query": query,
+                "embedding": self._normalize(embedding),
+                "history_key": history_key,
+                "catalog_version": catalog_version,
+                "final_response": final_response,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = SemanticResponseCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")) or None,
+)
+
+
+def _semantic_cache_enabled() -> bool:
+    return os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _emit(stream_mode, state):
+    # Mirror the shape graph.stream() produces for the requested stream mode(s)
+    return ("values", state) if isinstance(stream_mode, (list, tuple)) else state
+
+
+def _cached_state(init_state: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+    query = init_state.get("query", "")
+    print(f"Semantic cache hit ({entry['similarity']:.3f}) for '{query}' ~ '{entry['query']}'")
+    return {
+        **init_state,
+        "messages": init_state.get("messages", []) + [HumanMessage(content=query), AIMessage(content=entry["final_response"])],
+        "final_response": entry["final_response"],
+    }
+
+
+def _cacheable(last_state, interrupted: bool) -> bool:
+    # Only cache complete, database-backed answers
+    return bool(last_state and not interrupted and last_state.get("final_response") and not last_state.get("web_search_results"))
+
+
+def _state_of(event, stream_mode):
+    mode, chunk = event if isinstance(stream_mode, (list, tuple)) else ("values", event)
+    return chunk if mode == "values" else None
+
+
+def stream_agent(graph, init_state: Dict[str, Any], config: Dict[str, Any], stream_mode="values",
+                 cache: SemanticResponseCache = None) -> Iterator[Any]:
+    """
+    Stream a new turn through the agent graph, answering from the semantic cache when possible.
+
+    On a hit the graph is not run: the cached answer is written to the
+    thread's checkpoint (so the next turn carries the history over) and
+    yielded as a single state event. On a miss the graph's events are passed
+    through and the final answer is cached when the turn completes.
+
+    Args:
+        graph: Compiled agent graph
+        init_state: Initial state of the turn (query and carried-over messages)
+        config: Run config with the thread_id
+        stream_mode: Stream mode(s) passed to graph.stream()
+        cache: Semantic cache, defaults to the shared response_cache
+    """
+    cache = cache or response_cache
+    if not _semantic_cache_enabled():
+        yield from graph.stream(init_state, config=config, stream_mode=stream_mode)
+        return
+
+    query = init_state.get("query", "")
+    history_key = history_fingerprint(init_state.get("messages", []), init_state.get("history_summary", ""))
+    try:
+        embedding = get_embedding(query)
+        catalog_version = get_catalog_version()
+    except Exception as e:
+        print(f"Semantic cache unavailable: {e}")
+        yield from graph.stream(init_state, config=config, stream_mode=stream_mode)
+        return
+
+    entry = cache.lookup(embedding, history_key, catalog_version)
+    if entry is not None:
+        state = _cached_state(init_state, entry)
+        # Recorded as the last node of a turn, so the thread ends there
+        graph.update_state(config, state, as_node="summarize_history")
+        yield _emit(stream_mode, state)
+        return
+
+    last_state = None
+    interrupted = False
+    for event in graph.stream(init_state, config=config, stream_mode=stream_mode):
+        state = _state_of(event, stream_mode)
+        if state is not None:
+            last_state = state
+            interrupted = interrupted or "__interrupt__" in state
+        yield event
+
+    if _cacheable(last_state, interrupted):
+        cache.store(query, embedding, history_key, catalog_version, last_state["final_response"])
+
+
+async def astream_agent(graph, init_state: Dict[str, Any], config: Dict[str, Any], stream_mode="values",
+                        cache: SemanticResponseCache = None) -> AsyncIterator[Any]:
+    """
+    Async version of stream_agent(), running the graph with astream().
+    """
+    cache = cache or response_cache
+    if not _semantic_cache_enabled():
+        async for event in graph.astream(init_state, config=config, stream_mode=stream_mode):
+            yield event
+        return
+
+    query = init_state.get("query", "")
+    history_key = history_fingerprint(init_state.get("messages", []), init_state.get("history_summary", ""))
+    try:
+        embedding = await aget_embedding(query)
+        catalog_version = await asyncio.to_thread(get_catalog_version)
+    except Exception as e:
+        print(f"Semantic cache unavailable: {e}")
+        embedding = None
+
+    if embedding is None:
+        async for event in graph.astream(init_state, config=config, stream_mode=stream_mode):
+            yield event
+        return
+
+    entry = cache.lookup(embedding, history_key, catalog_version)
+    if entry is not None:
+        state = _cached_state(init_state, entry)
+        await graph.aupdate_state(config, state, as_node="summarize_history")
+        yield _emit(stream_mode, state)
+        return
+
+    last_state = None
+    interrupted = False
+    async for event in graph.astream(init_state, config=config, stream_mode=stream_mode):
+        state = _state_of(event, stream_mode)
+        if state is not None:
+            last_state = state
+            interrupted = interrupted or "__interrupt__" in state
+        yield event
+
+    if _cacheable(last_state, interrupted):
+        cache.store(query, embedding, history_key, catalog_version, last_state["final_response"])
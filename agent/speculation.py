@@ -0,0 +1,349 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from agent.intent import catalog_values
+from data.embedding_cache import normalize_text
+from data.mongodb.connection import get_collection
+from data.mongodb.pipeline import canonicalize, get_guard_settings
+from data.mongodb.search import extract_search_filters
+
+SKU_PATTERN = re.compile(r"\b\d{6}\b")
+# Words that refer back to products of the previous answer
+REFERENCE_WORDS = {"it", "its", "that", "this", "those", "these", "them", "they", "first", "second", "third", "last"}
+# Pipeline stages that can be applied to the speculative documents in-process
+REPLAYABLE_STAGES = {"$project", "$sort", "$skip", "$limit"}
+
+_executor = None
+_executor_lock = threading.Lock()
+_speculations = OrderedDict()
+_lock = threading.Lock()
+speculation_stats = {
+    "mongo_skipped": 0,
+    "mongo_started": 0, "mongo_hits": 0, "mongo_wasted": 0,
+    "vector_started": 0, "vector_hits": 0, "vector_wasted": 0,
+    "errors": 0,
+}
+
+
+def speculation_enabled() -> bool:
+    return os.getenv("SPECULATION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATION_WORKERS", "4")),
+                                               thread_name_prefix="speculation")
+    return _executor
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return re.search(rf"\b{re.escape(phrase.lower())}\b", text) is not None
+
+
+def referenced_skus(query: str, history: List[BaseMessage]) -> List[str]:
+    """SKUs named in the query, or in the last answer when the query refers back to it."""
+    skus = SKU_PATTERN.findall(query)
+    if skus or not history:
+        return skus
+    if not REFERENCE_WORDS & set(re.findall(r"[a-z]+", query.lower())):
+        return []
+    for message in reversed(history):
+        if isinstance(message, AIMessage):
+            return list(dict.fromkeys(SKU_PATTERN.findall(str(message.content))))
+    return []
+
+
+def derive_speculative_match(query: str, history: List[BaseMessage] = None) -> Dict[str, Any]:
+    """
+    Guess the $match the reasoning LLM will write, from cheap signals only.
+
+    Args:
+        query: The user query
+        history: Earlier messages of the conversation
+
+    Returns:
+        A $match condition, empty when there is nothing to go on
+    """
+    text = query.lower()
+    match = {}
+
+    skus = referenced_skus(query, history or [])
+    if skus:
+        match["sku"] = skus[0] if len(skus) == 1 else {"$in": skus}
+
+    brands = [brand for brand in catalog_values("brand") if _contains(text, brand)]
+    if brands:
+        match["brand"] = brands[0] if len(brands) == 1 else {"$in": brands}
+
+    departments = [department for department in catalog_values("department") if _contains(text, department)]
+    if departments:
+        match["department"] = departments[0] if len(departments) == 1 else {"$in": departments}
+
+    # extract_search_filters speaks the vector-metadata dialect; only price and name exist as catalog fields
+    filters = extract_search_filters(query)
+    if "price_each" in filters:
+        match["prices.Each"] = filters["price_each"]
+    if "name" in filters and "sku" not in match:
+        match["name"] = filters["name"]
+    return match
+
+
+def _uses_heavy_fields(stages: List[Dict[str, Any]], heavy_fields: List[str]) -> bool:
+    """Whether a replayed stage needs a heavy field, which the speculative fetch leaves out."""
+    for stage in stages:
+        name, spec = next(iter(stage.items()))
+        if name not in ("$project", "$sort") or not isinstance(spec, dict):
+            continue
+        for field, value in spec.items():
+            if name == "$project" and value in (0, False):
+                continue
+            paths = [field] + (re.findall(r"\$([A-Za-z_][\w.]*)", json.dumps(value)) if name == "$project" else [])
+            if any(path.split(".")[0] in heavy_fields for path in paths):
+                return True
+    return False
+
+
+def _fetch_documents(match: Dict[str, Any], max_docs: int) -> Dict[str, Any]:
+    # Same fields a guarded pipeline would return
+    projection = {"_id": 0, **{field: 0 for field in get_guard_settings()["heavy_fields"]}}
+    docs = list(get_collection().find(match, projection).limit(max_docs + 1))
+    return {"docs": docs[:max_docs], "complete": len(docs) <= max_docs}
+
+
+def _vector_search(query: str):
+    # Imported here: the tool node module imports this one
+    from agent.tool_nodes.pinecone_search import query_vector_index
+    results = query_vector_index(query)
+    return results.to_dict() if hasattr(results, "to_dict") else results
+
+
+def _discard(entry: Dict[str, Any]):
+    # Called with _lock held: whatever was not consumed is wasted work
+    for kind in ("mongo", "vector"):
+        if entry.get(kind) is not None:
+            speculation_stats[f"{kind}_wasted"] += 1
+            entry[kind]["future"].cancel()
+
+
+def start_speculation(thread_id: str, query: str, history: List[BaseMessage] = None):
+    """
+    Start the speculative Mongo and vector searches of a turn in the background.
+
+    Args:
+        thread_id: Conversation thread the results belong to
+        query: The user query
+        history: Earlier messages of the conversation
+    """
+    if not speculation_enabled() or not thread_id:
+        return
+    match = derive_speculative_match(query, history)
+    executor = _get_executor()
+    entry = {"mongo": None, "vector": None}
+    if match:
+        max_docs = int(os.getenv("SPECULATION_MAX_DOCS", "200"))
+        entry["mongo"] = {"match": match, "future": executor.submit(_fetch_documents, match, max_docs)}
+    if os.getenv("SPECULATION_VECTOR", "true").lower() in ("1", "true", "yes"):
+        entry["vector"] = {"query": normalize_text(query), "future": executor.submit(_vector_search, query)}
+    if match or entry["vector"] is not None:
+        print(f"Speculating for thread {thread_id}: $match {json.dumps(match, default=str)}")
+
+    with _lock:
+        if not match:
+            speculation_stats["mongo_skipped"] += 1
+        else:
+            speculation_stats["mongo_started"] += 1
+        if entry["vector"] is not None:
+            speculation_stats["vector_started"] += 1
+        previous = _speculations.pop(thread_id, None)
+        if previous is not None:
+            _discard(previous)
+        if entry["mongo"] is None and entry["vector"] is None:
+            return
+        _speculations[thread_id] = entry
+        while len(_speculations) > int(os.getenv("SPECULATION_MAX_THREADS", "1000")):
+            _discard(_speculations.popitem(last=False)[1])
+
+
+def finish_speculation(thread_id: str):
+    """Discard whatever the searches of this turn did not use."""
+    with _lock:
+        entry = _speculations.pop(thread_id, None)
+        if entry is not None:
+            _discard(entry)
+
+
+def _take(thread_id: str, kind: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        entry = _speculations.get(thread_id)
+        if entry is None or entry.get(kind) is None:
+            return None
+        part = entry[kind]
+        entry[kind] = None
+        if entry["mongo"] is None and entry["vector"] is None:
+            del _speculations[thread_id]
+        return part
+
+
+def _resolve(kind: str, part: Dict[str, Any], hit: bool):
+    with _lock:
+        speculation_stats[f"{kind}_hits" if hit else f"{kind}_wasted"] += 1
+    if not hit:
+        part["future"].cancel()
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _get_path(doc: Dict[str, Any], path: str):
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _set_path(doc: Dict[str, Any], path: str, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        doc = doc.setdefault(key, {})
+    doc[keys[-1]] = value
+
+
+def _project(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    spec = {field: flag for field, flag in spec.items() if field != "_id"}
+    if any(flag not in (0, 1, True, False) for flag in spec.values()):
+        raise ValueError("computed fields in $project")
+    flags = set(bool(flag) for flag in spec.values())
+    if flags == {True}:
+        projected = []
+        for doc in docs:
+            out = {}
+            for field in spec:
+                value = _get_path(doc, field)
+                if value is not None:
+                    _set_path(out, field, value)
+            projected.append(out)
+        return projected
+    if flags == {False}:
+        top_level = {field for field in spec if "." not in field}
+        if len(top_level) != len(spec):
+            raise ValueError("nested exclusion in $project")
+        return [{k: v for k, v in doc.items() if k not in top_level} for doc in docs]
+    if not flags:
+        return docs
+    raise ValueError("mixed inclusion and exclusion in $project")
+
+
+def _sort(docs: List[Dict[str, Any]], spec: Dict[str, int]) -> List[Dict[str, Any]]:
+    docs = list(docs)
+    # Stable sorts from the last key to the first; missing values sort first, as in MongoDB
+    for field, direction in reversed(list(spec.items())):
+        docs.sort(key=lambda doc: (_get_path(doc, field) is not None, _get_path(doc, field)),
+                  reverse=direction == -1)
+    return docs
+
+
+def replay_stages(docs: List[Dict[str, Any]], stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply $project/$sort/$skip/$limit stages to documents in-process."""
+    for stage in stages:
+        (name, spec), = stage.items()
+        if name == "$project":
+            docs = _project(docs, spec)
+        elif name == "$sort":
+            docs = _sort(docs, spec)
+        elif name == "$skip":
+            docs = docs[int(spec):]
+        elif name == "$limit":
+            docs = docs[:int(spec)]
+    return docs
+
+
+def take_speculative_mongo_results(thread_id: str, pipeline: List[Dict[str, Any]]) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """
+    Reuse the speculative Mongo results when they cover the LLM's pipeline.
+
+    The pipeline is covered when its first stage is the speculated $match and
+    every later stage is a $project, $sort, $skip or $limit, which are replayed
+    on the speculative documents. Stages that need a heavy field are not
+    covered: the guarded path keeps a heavy field a $project asks for, but the
+    speculative documents were fetched without it.
+
+    Args:
+        thread_id: Conversation thread
+        pipeline: The parsed aggregation pipeline generated by reasoning
+
+    Returns:
+        The pipeline's results and the number of documents its $match found,
+        or None when the speculation can't be used
+    """
+    part = _take(thread_id, "mongo")
+    if part is None:
+        return None
+    # The same form the guarded query runs, e.g. "desc" / "-1" sort directions as -1
+    stages = canonicalize(pipeline)
+    covered = (stages and "$match" in stages[0]
+               and _canonical(stages[0]["$match"]) == _canonical(part["match"])
+               and all(next(iter(stage)) in REPLAYABLE_STAGES for stage in stages[1:])
+               and not _uses_heavy_fields(stages[1:], get_guard_settings()["heavy_fields"]))
+    if not covered:
+        _resolve("mongo", part, hit=False)
+        return None
+    try:
+        fetched = part["future"].result()
+        if not fetched["complete"]:
+            raise ValueError("more documents than SPECULATION_MAX_DOCS")
+        results = replay_stages(fetched["docs"], stages[1:])
+    except Exception as e:
+        print(f"Speculative Mongo results unusable: {e}")
+        with _lock:
+            speculation_stats["errors"] += 1
+        _resolve("mongo", part, hit=False)
+        return None
+    _resolve("mongo", part, hit=True)
+    print(f"Reusing {len(results)} speculative Mongo results")
+    # The fetch is complete, so its documents are every match, before $skip/$limit cut them
+    return results, len(fetched["docs"])
+
+
+def take_speculative_vector_results(thread_id: str, query: str):
+    """Reuse the speculative vector search when reasoning asks for the user's own query."""
+    part = _take(thread_id, "vector")
+    if part is None:
+        return None
+    if part["query"] != normalize_text(query):
+        _resolve("vector", part, hit=False)
+        return None
+    try:
+        results = part["future"].result()
+    except Exception as e:
+        print(f"Speculative vector search failed: {e}")
+        with _lock:
+            speculation_stats["errors"] += 1
+        _resolve("vector", part, hit=False)
+        return None
+    _resolve("vector", part, hit=True)
+    return results
+
+
+def get_speculation_stats() -> Dict[str, Any]:
+    """Speculation counts with hit rates and the fraction of speculative searches wasted."""
+    with _lock:
+        stats = dict(speculation_stats)
+        stats["pending"] = len(_speculations)
+    for kind in ("mongo", "vector"):
+        started = stats[f"{kind}_started"]
+        stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / started if started else 0.0
+        stats[f"{kind}_waste_rate"] = stats[f"{kind}_wasted"] / started if started else 0.0
+    return stats
@@ -1,11 +1,22 @@
 from typing import Dict, List, Any, TypedDict, Optional, Union,Annotated
 from langchain_core.messages import BaseMessage
-import operator
+
+
+def extend_or_clear(left: Optional[List[Any]], right: Optional[List[Any]]) -> List[Any]:
+    """Concatenate results of parallel search nodes; None clears them once they have been aggregated."""
+    if right is None:
+        return []
+    return (left or []) + right
+
 
 class AgentState(TypedDict, total=False):
     """The state of the cheese shopping agent with improved reasoning architecture."""
     # Core conversation state
-    messages: List[BaseMessage]  # Chat history
+    messages: List[BaseMessage]  # Chat history, the last turns verbatim
+    history_summary: str  # Rolling summary of the turns folded out of messages
+    pinned_skus: List[str]  # SKUs referenced in the conversation, most recent first
+    summarized_message_count: int  # Messages folded into the summary so far
+    pending_history: str  # Folded turns the model has not worked into the summary yet
     query: str  # Current user query
     needs_clarification: bool  # Whether clarification is needed
     reason: str  # Reason for needing clarification
@@ -16,8 +27,10 @@ class AgentState(TypedDict, total=False):
     thought: List[str]  # List of reasoning thoughts
     is_database_searched: bool  # Whether database search has been performed
     searched_result: Dict[str, Any]  # Results from database searches
-    pinecone_results:Annotated[List[Any], operator.add]  # Results from Pinecone search
-    mongo_results:Annotated[List[Any], operator.add]  # Results from MongoDB search
+    searched_result_total: int  # Number of distinct results before the top-N cap
+    pinecone_results:Annotated[List[Any], extend_or_clear]  # Results from Pinecone search
+    mongo_results:Annotated[List[Any], extend_or_clear]  # Bounded sample of the MongoDB results
+    mongo_total: int  # Documents the MongoDB pipeline matched before the result cap
     # Search query state
     mongo_query: str  # MongoDB query string
     pinecone_query: str  # Pinecone query string
@@ -28,3 +41,4 @@ class AgentState(TypedDict, total=False):
     web_search_query: str  # Web search query
     web_search_results:Dict[str,Any]  # Results from web search
     final_response:str  # Final response
+    prompt_tokens_saved: int  # Prompt tokens saved by result compaction this turn
@@ -0,0 +1,25 @@
+from typing import Any, Tuple
+
+from langchain_core.messages import AIMessageChunk
+
+# State snapshots plus the LLM tokens generated inside the nodes
+STREAM_MODES = ["values", "messages"]
+
+# Node whose tokens are shown to the user as they are generated
+ANSWER_NODE = "response"
+
+
+def response_token(chunk: Tuple[Any, dict]) -> str:
+    """
+    Text of a "messages" stream event if it is a token of the final answer.
+
+    Args:
+        chunk: (message, metadata) pair from stream_mode="messages"
+
+    Returns:
+        The token text, or "" for messages of other nodes and whole messages
+    """
+    message, metadata = chunk
+    if metadata.get("langgraph_node") != ANSWER_NODE or not isinstance(message, AIMessageChunk):
+        return ""
+    return message.content if isinstance(message.content, str) else ""
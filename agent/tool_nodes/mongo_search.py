@@ -1,10 +1,135 @@
 import json
+import os
+import threading
+from collections import OrderedDict
 from agent.state import AgentState
 import asyncio
-from typing import Dict, Any, List
-from data.mongodb.connection import get_collection
+from typing import Dict, Any, List, Optional, Tuple
+from data.mongodb.connection import get_async_collection, get_collection
+from data.mongodb.pipeline import canonicalize, guarded_aggregate, aguarded_aggregate, get_guard_settings, take_bounded
+from data.mongodb.local_engine import UnsupportedPipeline, local_aggregate, uses_local_engine
 import json
 from bson import json_util
+from langchain_core.runnables import RunnableConfig
+from agent.speculation import take_speculative_mongo_results
+from data.catalog_version import get_catalog_version
+
+
+class MongoResultCache:
+    """
+    LRU cache of aggregation results bounded by entry count and bytes.
+
+    Results are stored as Extended JSON, so every hit returns fresh objects and
+    the size of an entry is the length of its serialized form.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        results, total = json_util.loads(value)
+        return results, total
+
+    def set(self, key: str, results: List[Dict[str, Any]], total: int):
+        value = json_util.dumps([results, total])
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = value
+            self.bytes += len(value)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+def create_result_cache() -> Optional[MongoResultCache]:
+    """Create the result cache unless MONGO_RESULT_CACHE_ENABLED is false."""
+    if os.getenv("MONGO_RESULT_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    return MongoResultCache(
+        max_entries=int(os.getenv("MONGO_RESULT_CACHE_SIZE", "256")),
+        max_bytes=int(os.getenv("MONGO_RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    )
+
+
+result_cache = create_result_cache()
+
+
+def _sort_query(query: Any) -> Any:
+    """A $match filter with its fields and operators sorted; embedded documents keep their order."""
+    if not isinstance(query, dict):
+        return query
+    return {field: _sort_condition(field, query[field]) for field in sorted(query)}
+
+
+def _sort_condition(field: str, condition: Any) -> Any:
+    if field in ("$and", "$or", "$nor") and isinstance(condition, list):
+        return [_sort_query(clause) for clause in condition]
+    if field == "$elemMatch":
+        return _sort_query(condition)
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return {operator: _sort_condition(operator, condition[operator]) for operator in sorted(condition)}
+    # An embedded document matches by exact equality, so its key order is significant
+    return condition
+
+
+def _cache_form(pipeline: Any) -> List[Dict[str, Any]]:
+    # Only filters are order-free; $sort, $project and $group keys are kept in the order given
+    stages = []
+    for stage in canonicalize(pipeline):
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            spec = _sort_query(spec)
+        elif name == "$facet" and isinstance(spec, dict):
+            spec = {facet: _cache_form(sub_pipeline) for facet, sub_pipeline in spec.items()}
+        stages.append({name: spec})
+    return stages
+
+
+def result_cache_key(pipeline: Any, catalog_version: int) -> str:
+    """Canonical pipeline JSON plus the catalog version it was answered from."""
+    canonical = json.dumps(_cache_form(pipeline), separators=(",", ":"), default=json_util.default)
+    return f"{catalog_version}:{canonical}"
+
+
+def get_mongo_result_cache_stats() -> Dict[str, Any]:
+    """Hit rate, bytes held and evictions of the aggregation result cache."""
+    return result_cache.stats() if result_cache is not None else {}
 
 def parse_mongo_aggregation(agg_string):
     """
@@ -47,23 +172,78 @@ def parse_mongo_aggregation(agg_string):
         
         # If we can't automatically fix it, return a simple query
         return [{"$match": {}}]
-async def execute_mongo_query(query_str: str) -> List[Dict[str, Any]]:
+def run_local_query(pipeline: Any) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """
+    Run a pipeline on the in-memory catalog when MONGO_BACKEND=local.
+
+    Returns:
+        Tuple of (documents, total), or None when MongoDB has to run it
+    """
+    if not uses_local_engine():
+        return None
+    try:
+        return local_aggregate(pipeline)
+    except UnsupportedPipeline as e:
+        print(f"Local engine can't run the pipeline ({e}); using MongoDB")
+        return None
+
+def run_mongo_query(query_str: str) -> Tuple[List[Dict[str, Any]], int]:
     """
-    Execute a MongoDB query.
-    This is a placeholder function that would be replaced with actual MongoDB client code.
+    Execute a MongoDB aggregation pipeline with the shared sync client.
+
+    The pipeline is rewritten and bounded by data.mongodb.pipeline first and
+    runs on the local engine when it is enabled and supports it.
+    Results are served from the result cache while the catalog version is unchanged.
+
+    Returns:
+        Tuple of (documents, total number of documents the pipeline matches)
+    """
+    pipeline = parse_mongo_aggregation(query_str)
+    key = result_cache_key(pipeline, get_catalog_version()) if result_cache is not None else None
+    cached = result_cache.get(key) if key else None
+    if cached is not None:
+        return cached
+    outcome = run_local_query(pipeline)
+    if outcome is None:
+        outcome = guarded_aggregate(get_collection(), pipeline)
+    if key:
+        result_cache.set(key, *outcome)
+    return outcome
+
+async def execute_mongo_query(query_str: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Execute a MongoDB aggregation pipeline with the async client of the running event loop.
     """
-    # Placeholder implementation - in a real system, you would:
-    collection = get_collection()
-    results = list(collection.aggregate(parse_mongo_aggregation(query_str)))
-    return results
+    collection = get_async_collection()
+    if collection is None:
+        # mongomock has no async client
+        return await asyncio.to_thread(run_mongo_query, query_str)
+    pipeline = parse_mongo_aggregation(query_str)
+    # The version is usually cached in-process, but a refresh is a blocking round trip
+    key = result_cache_key(pipeline, await asyncio.to_thread(get_catalog_version)) if result_cache is not None else None
+    cached = result_cache.get(key) if key else None
+    if cached is not None:
+        return cached
+    # Loading or reloading the local catalog blocks, so it runs off the event loop
+    outcome = await asyncio.to_thread(run_local_query, pipeline) if uses_local_engine() else None
+    if outcome is None:
+        outcome = await aguarded_aggregate(collection, pipeline)
+    if key:
+        result_cache.set(key, *outcome)
+    return outcome
+
+
+def _speculative_hit(speculative: Tuple[List[Dict[str, Any]], int]) -> Tuple[List[Dict[str, Any]], int]:
+    """Bound speculative results like a guarded pipeline would; the total is the count of matching documents."""
+    results, matched = speculative
+    documents, _ = take_bounded(results, get_guard_settings())
+    return documents, matched
     
 
-def mongo_search(state: AgentState) -> AgentState:
+def mongo_search(state: AgentState, config: RunnableConfig) -> AgentState:
     """
     MongoDB search node that executes the query generated by the reasoning node
     """
-    new_state = {**state}
-    
     # Get the MongoDB query from state
     mongo_query = state.get("mongo_query", "")
     
@@ -71,11 +251,37 @@ def mongo_search(state: AgentState) -> AgentState:
         # If no MongoDB query is provided, return empty results
         return
     
-    # In a real implementation, you would execute the query asynchronously
     try:
-        results = asyncio.run(execute_mongo_query(mongo_query))
-        return {"mongo_results": results}
+        # Reuse the speculative search started after query understanding when it covers this pipeline
+        thread_id = config.get("configurable", {}).get("thread_id")
+        speculative = take_speculative_mongo_results(thread_id, parse_mongo_aggregation(mongo_query))
+        if speculative is None:
+            results, total = run_mongo_query(mongo_query)
+        else:
+            results, total = _speculative_hit(speculative)
+        return {"mongo_results": results, "mongo_total": total}
+    except Exception as e:
+        print(f"MongoDB search failed: {e}")
+        return {"mongo_results": [], "mongo_total": 0}
+
+async def amongo_search(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Async version of mongo_search().
+    """
+    mongo_query = state.get("mongo_query", "")
+    
+    if not mongo_query:
+        return
+    
+    try:
+        thread_id = config.get("configurable", {}).get("thread_id")
+        # Waiting for an in-flight speculation blocks, so it happens off the event loop
+        speculative = await asyncio.to_thread(take_speculative_mongo_results, thread_id, parse_mongo_aggregation(mongo_query))
+        if speculative is None:
+            results, total = await execute_mongo_query(mongo_query)
+        else:
+            results, total = _speculative_hit(speculative)
+        return {"mongo_results": results, "mongo_total": total}
     except Exception as e:
-        return {"mongo_results": []}
-       
-    
\ No newline at end of file
+        print(f"MongoDB search failed: {e}")
+        return {"mongo_results": [], "mongo_total": 0}
@@ -3,23 +3,74 @@ from agent.state import AgentState
 import asyncio
 from typing import Dict, Any, List
 
-from data.embeddings import get_embedding
-from data.pinecone.connection import get_index, init_pinecone
+from data.embeddings import aget_embedding, get_embedding
+from data.pinecone.connection import get_cached_index, invalidate_index_cache
+from data.local_index.index import uses_local_index, local_search
+from agent.speculation import take_speculative_vector_results
+from langchain_core.runnables import RunnableConfig
 
-async def execute_pinecone_query(query: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+def query_pinecone(query: str, filters: Dict[str, Any] = None):
     """
     Execute a Pinecone vector search query.
-    This is a placeholder function that would be replaced with actual Pinecone client code.
     """
-    # Placeholder implementation - in a real system, you would:
-    pc = init_pinecone()
-    index = get_index(pc)
+    index = get_cached_index()
     query_vector = get_embedding(query)
-    results = index.query(query_vector, top_k=10, include_metadata=True)
+    try:
+        results = index.query(vector=query_vector, top_k=10, include_metadata=True, filter=filters)
+    except Exception:
+        # The index may have been deleted or recreated; re-check it on the next call
+        invalidate_index_cache()
+        raise
     return results
+
+def query_vector_index(query: str, filters: Dict[str, Any] = None):
+    """
+    Execute a vector search on the backend selected by VECTOR_BACKEND.
+    """
+    if uses_local_index():
+        return local_search(query, top_k=10, filter=filters)
+    return query_pinecone(query, filters)
+
+async def execute_pinecone_query(query: str, filters: Dict[str, Any] = None):
+    """
+    Execute a Pinecone vector search query without blocking the event loop.
+    """
+    index = get_cached_index()
+    query_vector = await aget_embedding(query)
+    try:
+        # The Pinecone client is synchronous; its HTTP call runs in a worker thread
+        results = await asyncio.to_thread(index.query, vector=query_vector, top_k=10, include_metadata=True, filter=filters)
+    except Exception:
+        invalidate_index_cache()
+        raise
+    return results
+
+async def execute_local_vector_query(query: str, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Execute a vector search against the in-process NumPy (exact or IVF) index instead of Pinecone.
+    """
+    query_vector = await aget_embedding(query)
+    # The NumPy search is CPU-bound, so it runs in a worker thread
+    return await asyncio.to_thread(local_search, query, 10, filters, query_vector)
+
+async def execute_vector_query(query: str, filters: Dict[str, Any] = None):
+    """
+    Execute a vector search on the backend selected by VECTOR_BACKEND.
+    """
+    if uses_local_index():
+        return await execute_local_vector_query(query, filters)
+    return await execute_pinecone_query(query, filters)
+    
+
+def _store(results) -> AgentState:
+    print(results)
+    # Store the results in the state as a plain dict; the reducer concatenates lists
+    if hasattr(results, "to_dict"):
+        results = results.to_dict()
     
+    return {"pinecone_results": [results]}
 
-def pinecone_search(state: AgentState) -> AgentState:
+def pinecone_search(state: AgentState, config: RunnableConfig) -> AgentState:
     """
     Pinecone search node that executes the query generated by the reasoning node
     """
@@ -30,9 +81,22 @@ def pinecone_search(state: AgentState) -> AgentState:
         # If no Pinecone query is provided, return empty results
         return
     
-    # In a real implementation, you would execute the query asynchronously
-    results = asyncio.run(execute_pinecone_query(pinecone_query))
-    print(results)
-    # Store the results in the state
+    results = take_speculative_vector_results(config.get("configurable", {}).get("thread_id"), pinecone_query)
+    if results is None:
+        results = query_vector_index(pinecone_query)
+    return _store(results)
+
+async def apinecone_search(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Async version of pinecone_search().
+    """
+    pinecone_query = state.get("pinecone_query", "")
+    
+    if not pinecone_query:
+        return
     
-    return {"pinecone_results": results}
+    results = await asyncio.to_thread(take_speculative_vector_results,
+                                      config.get("configurable", {}).get("thread_id"), pinecone_query)
+    if results is None:
+        results = await execute_vector_query(pinecone_query)
+    return _store(results)
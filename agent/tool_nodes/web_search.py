@@ -5,8 +5,8 @@ from dotenv import load_dotenv
 import os
 load_dotenv()
 os.environ["TAVILY_API_KEY"] = os.getenv("TAVILY_API_KEY")
-def web_search(state: AgentState) -> AgentState:
-    tool = TavilySearch(
+def _tool() -> TavilySearch:
+    return TavilySearch(
         max_results=5,
         topic="general",
         include_answer=True,
@@ -19,6 +19,13 @@ def web_search(state: AgentState) -> AgentState:
         # exclude_domains=None
         
     )
-    web_search_results = tool.invoke(state["web_search_query"])
+
+def web_search(state: AgentState) -> AgentState:
+    web_search_results = _tool().invoke(state["web_search_query"])
+    print(web_search_results)
+    return {"web_search_results": web_search_results}
+
+async def aweb_search(state: AgentState) -> AgentState:
+    web_search_results = await _tool().ainvoke(state["web_search_query"])
     print(web_search_results)
     return {"web_search_results": web_search_results}
\ No newline at end of file
@@ -7,12 +7,28 @@ st.set_page_config(page_title="Cheese Chatbot", layout="wide")
 
 # --- Agent and LangGraph Setup ---
 from agent.graph import agent_graph # Use your actual agent graph
+from agent.semantic_cache import stream_agent
+from agent.history import HISTORY_FIELDS
+from agent.streaming import STREAM_MODES, response_token
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage # Import message types
 from langgraph.types import Command, Interrupt # Ensure Interrupt is available if needed for type checking, though not directly sent by UI
 from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables if you have a .env file
 
+from data.mongodb.connection import warm_up_mongodb
+
+@st.cache_resource
+def init_database_connections():
+    """Warm up the shared MongoDB pool once per server process."""
+    try:
+        warm_up_mongodb()
+    except Exception as e:
+        print(f"MongoDB warm-up failed: {e}")
+    return True
+
+init_database_connections()
+
 # --- Session State Initialization ---
 if "messages" not in st.session_state:
     st.session_state.messages = [] # For UI display: List[Dict{"role": str, "content": str, ...}]
@@ -27,6 +43,8 @@ if "last_config_for_carry_over" not in st.session_state:
 # For actual agent state carry-over
 if "carried_over_messages_from_graph" not in st.session_state:
     st.session_state.carried_over_messages_from_graph = [] # List[BaseMessage]
+if "carried_over_history" not in st.session_state:
+    st.session_state.carried_over_history = {} # Summary and pinned SKUs of the folded turns
 if "current_thoughts_displayed" not in st.session_state:
     st.session_state.current_thoughts_displayed = set()
 if "last_event_messages_count" not in st.session_state:
@@ -63,6 +81,7 @@ with st.sidebar:
         st.session_state.current_config = {"configurable": {"thread_id": st.session_state.thread_id}}
         st.session_state.last_config_for_carry_over = None
         st.session_state.carried_over_messages_from_graph = []
+        st.session_state.carried_over_history = {}
         st.session_state.current_thoughts_displayed = set()
         st.session_state.last_event_messages_count = 0
         st.session_state.active_interrupt_info = None
@@ -153,7 +172,7 @@ if prompt: # This will be true if chat_input has value OR if a button set the pr
                 events_iterable = agent_graph.stream(
                     actual_command,
                     config=st.session_state.current_config,
-                    stream_mode="values"
+                    stream_mode=STREAM_MODES
                 )
                 st.session_state.interrupted_state = False 
                 st.session_state.active_interrupt_info = None
@@ -167,10 +186,15 @@ if prompt: # This will be true if chat_input has value OR if a button set the pr
                 
                 # --- Message Carry-Over ---
                 st.session_state.carried_over_messages_from_graph = [] # Reset
+                st.session_state.carried_over_history = {}
                 if st.session_state.last_config_for_carry_over:
                     try:
                         previous_state_snapshot = agent_graph.get_state(st.session_state.last_config_for_carry_over)
                         if previous_state_snapshot and previous_state_snapshot.values:
+                            st.session_state.carried_over_history = {
+                                field: previous_state_snapshot.values[field]
+                                for field in HISTORY_FIELDS if field in previous_state_snapshot.values
+                            }
                             retrieved_messages = previous_state_snapshot.values.get("messages", [])
                             if retrieved_messages: # retrieved_messages are List[BaseMessage]
                                 st.session_state.carried_over_messages_from_graph = [m for m in retrieved_messages if isinstance(m, BaseMessage)]
@@ -181,10 +205,12 @@ if prompt: # This will be true if chat_input has value OR if a button set the pr
                     except Exception as e:
                         st.warning(f"Info: Could not retrieve state from previous session ({st.session_state.last_config_for_carry_over.get('configurable',{}).get('thread_id', '')[-6:]}): {e}. Starting fresh.")
                         st.session_state.carried_over_messages_from_graph = []
+                        st.session_state.carried_over_history = {}
                 
                 init_state = {
                     "query": prompt, # Current user query
                     "messages": st.session_state.carried_over_messages_from_graph, # List[BaseMessage]
+                    **st.session_state.carried_over_history,
                     "needs_clarification": False, # Defaults for a new run
                     "reason": "",
                     "suggested_clarifying_question": "",
@@ -192,23 +218,39 @@ if prompt: # This will be true if chat_input has value OR if a button set the pr
                     "thought": [],
                     "is_database_searched": False,
                     "searched_result": {},
+                    "searched_result_total": 0,
+                    "prompt_tokens_saved": 0,
                     "pinecone_results": [],
                     "mongo_results": [],
+                    "mongo_total": 0,
                     "mongo_query": "",
                     "pinecone_query": "",
                     "is_result_sufficient": False,
                     "needs_web_search": False,
                     "web_search_query": ""
                 }
-                events_iterable = agent_graph.stream(
+                events_iterable = stream_agent(
+                    agent_graph,
                     init_state,
                     config=st.session_state.current_config,
-                    stream_mode="values"
+                    stream_mode=STREAM_MODES
                 )
 
             # --- Process events from the stream ---
             if events_iterable:
-                for event_idx, event_state in enumerate(events_iterable): # event_state is AgentState
+                answer_placeholder = None # Chat bubble the answer tokens are rendered into
+                streamed_answer = ""
+                for event_idx, (stream_mode, event_state) in enumerate(events_iterable): # event_state is AgentState
+                    # --- Render answer tokens as they are generated ---
+                    if stream_mode == "messages":
+                        token = response_token(event_state)
+                        if token:
+                            if answer_placeholder is None:
+                                answer_placeholder = st.chat_message("assistant").empty()
+                            streamed_answer += token
+                            answer_placeholder.markdown(streamed_answer + "▌")
+                        continue
+
                     # --- Handle Interrupts ---
                     if "__interrupt__" in event_state:
                         interrupt_obj = event_state["__interrupt__"][0] # This is an Interrupt object
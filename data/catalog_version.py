@@ -0,0 +1,46 @@
+import os
+import time
+import threading
+from pymongo import ReturnDocument
+from data.mongodb.connection import get_database
+
+# Document in the catalog_meta collection that holds the catalog version
+CATALOG_VERSION_ID = "catalog"
+
+_cached_version = None
+_cached_at = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog_version() -> int:
+    """Get the current catalog version.
+
+    The version is bumped by the loader every time the catalog changes; caches
+    keyed by it are invalidated across processes. The value is re-read at most
+    every CATALOG_VERSION_TTL seconds.
+    """
+    global _cached_version, _cached_at
+    ttl = float(os.getenv("CATALOG_VERSION_TTL", "30"))
+    if _cached_version is not None and time.monotonic() - _cached_at < ttl:
+        return _cached_version
+    with _lock:
+        doc = get_database()["catalog_meta"].find_one({"_id": CATALOG_VERSION_ID})
+        _cached_version = doc["version"] if doc else 0
+        _cached_at = time.monotonic()
+        return _cached_version
+
+
+def bump_catalog_version() -> int:
+    """Increment the catalog version after the catalog changed."""
+    global _cached_version, _cached_at
+    doc = get_database()["catalog_meta"].find_one_and_update(
+        {"_id": CATALOG_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    with _lock:
+        _cached_version = doc["version"]
+        _cached_at = time.monotonic()
+    print(f"Catalog version is now {_cached_version}")
+    return _cached_version
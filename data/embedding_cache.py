@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def make_cache_key(model: str, text: str) -> str:
+    """Build the cache key for an embedding of `text` produced by `model`."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class MemoryEmbeddingCache:
+    """Bounded in-process LRU cache with a time-to-live for embeddings."""
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, vector = entry
+                if self.ttl is None or time.time() - created_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = (time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteEmbeddingCache:
+    """LRU + TTL embedding cache persisted in SQLite so it survives restarts."""
+
+    def __init__(self, path: str = "data/embedding_cache.sqlite", max_size: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                blob, created_at = row
+                if self.ttl is None or now - created_at <= self.ttl:
+                    self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self.hits += 1
+                    return array("f", blob).tolist()
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, vector: List[float]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, array("f", vector).tobytes(), now, now),
+            )
+            overflow = self._count() - self.max_size
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_embedding_cache():
+    """Create the query-embedding cache selected by environment variables.
+
+    EMBEDDING_CACHE_BACKEND: "memory" (default), "sqlite" or "none"
+    EMBEDDING_CACHE_SIZE: Maximum number of cached embeddings
+    EMBEDDING_CACHE_TTL: Seconds before an entry expires (0 disables expiry)
+    EMBEDDING_CACHE_PATH: SQLite database file for the sqlite backend
+    """
+    backend = os.getenv("EMBEDDING_CACHE_BACKEND", "memory").lower()
+    max_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    ttl = float(os.getenv("EMBEDDING_CACHE_TTL", "86400")) or None
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        path = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+        return SQLiteEmbeddingCache(path, max_size=max_size, ttl=ttl)
+    if backend == "memory":
+        return MemoryEmbeddingCache(max_size=max_size, ttl=ttl)
+    raise ValueError(f"Unknown EMBEDDING_CACHE_BACKEND: {backend}")
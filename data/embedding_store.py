@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from data.embeddings import get_batch_embeddings
+
+DEFAULT_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "data/embedding_store")
+
+
+def content_key(model: str, text: str) -> str:
+    """Content address of an embedding: hash of the model and the exact text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding store.
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`), one row per
+    key; the sidecar `keys.json` maps content keys to row numbers.
+
+    Readers never take the lock: the row map and the matrix are published
+    together as one tuple, after the file holds every row the map refers to.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, dimension: int = 1536):
+        self.path = path
+        self.dimension = dimension
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.keys_path = os.path.join(path, "keys.json")
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        rows = {}
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as f:
+                sidecar = json.load(f)
+            self.dimension = sidecar["dimension"]
+            rows = {key: row for row, key in enumerate(sidecar["keys"])}
+        self._index = (rows, self._map_vectors(len(rows)))
+
+    def _map_vectors(self, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+
+    def _write_sidecar(self, rows):
+        keys = sorted(rows, key=rows.get)
+        tmp_path = self.keys_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dimension": self.dimension, "keys": keys}, f)
+        os.replace(tmp_path, self.keys_path)
+
+    def __len__(self):
+        return len(self._index[0])
+
+    def __contains__(self, key: str):
+        return key in self._index[0]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        rows, vectors = self._index
+        row = rows.get(key)
+        return None if row is None else vectors[row]
+
+    def add_many(self, keys: List[str], vectors: List[List[float]]):
+        """Append vectors for keys that are not stored yet."""
+        if len(keys) != len(vectors):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(keys)} keys")
+        with self._lock:
+            rows = self._index[0]
+            new_keys, new_vectors, seen = [], [], set()
+            for key, vector in zip(keys, vectors):
+                if key in rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(vector)
+            if not new_keys:
+                return 0
+
+            matrix = np.asarray(new_vectors, dtype=np.float32).reshape(len(new_keys), self.dimension)
+            # Keep the file and the sidecar consistent: drop any rows written after the last sidecar save
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(rows) * self.dimension * 4)
+                f.write(matrix.tobytes())
+            rows = {**rows, **{key: len(rows) + offset for offset, key in enumerate(new_keys)}}
+            self._write_sidecar(rows)
+            self._index = (rows, self._map_vectors(len(rows)))
+            return len(new_keys)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Get the shared embedding store at EMBEDDING_STORE_PATH."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EmbeddingStore(DEFAULT_STORE_PATH)
+    return _store
+
+
+def get_stored_embeddings(texts: List[str], model="text-embedding-ada-002", store: EmbeddingStore = None) -> List[List[float]]:
+    """
+    Embed texts, only calling the embedding API for texts not in the store.
+
+    Args:
+        texts: List of texts to embed
+        model: The OpenAI embedding model to use
+        store: Embedding store, defaults to the shared store
+
+    Returns:
+        List of embedding vectors, aligned with `texts`; None for empty texts
+    """
+    if store is None:
+        store = get_embedding_store()
+    # The embedding API takes no empty input, so empty texts get no key and no vector
+    keys = [content_key(model, text) if isinstance(text, str) and text.strip() else None for text in texts]
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key is not None and key not in store and key not in missing:
+            missing[key] = text
+
+    if missing:
+        embeddings = get_batch_embeddings(list(missing.values()), model=model)
+        store.add_many(list(missing), embeddings)
+
+    empty = keys.count(None)
+    print(f"Embedding store: {len(texts) - len(missing) - empty} cached, {len(missing)} embedded, {empty} empty")
+    vectors = [store.get(key) if key is not None else None for key in keys]
+    return [None if vector is None else vector.tolist() for vector in vectors]
@@ -1,13 +1,145 @@
 import os
+import time
+import atexit
+import random
+import asyncio
+import threading
 from typing import List
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from data.embedding_cache import create_embedding_cache, make_cache_key
 # Load environment variables
 load_dotenv()
+
+_client = None
+_client_lock = threading.Lock()
+# AsyncOpenAI's HTTP pool belongs to one event loop, so there is one client per loop.
+# Each is closed with its loop (see aclose_openai_client), when the next loop finds its loop closed, or at exit
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+_embedding_cache = None
+_cache_initialized = False
+
+
+def get_openai_client() -> OpenAI:
+    """Get the shared OpenAI client (and its HTTP connection pool)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get the AsyncOpenAI client of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is not None:
+            return client
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        _async_clients[loop] = client
+        # A new loop usually means an earlier asyncio.run() has finished; release the pools of closed loops
+        stale = [(other, other_client) for other, other_client in _async_clients.items() if other.is_closed()]
+        for other, _ in stale:
+            del _async_clients[other]
+    for other, stale_client in stale:
+        _close_async_client(other, stale_client, wait=False)
+    return client
+
+
+def _close_async_client(loop, client: AsyncOpenAI, wait: bool = True):
+    """Close the AsyncOpenAI client of a loop that is not running, from a helper thread."""
+    def close():
+        try:
+            if loop.is_closed():
+                asyncio.run(client.close())
+            else:
+                loop.run_until_complete(client.close())
+        except Exception as e:
+            print(f"Could not close async OpenAI client: {e}")
+
+    thread = threading.Thread(target=close, name="openai-async-close", daemon=True)
+    thread.start()
+    if wait:
+        thread.join(timeout=10)
+
+
+def close_openai_client():
+    """Close the shared OpenAI client and the async clients of loops that are not running."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    with _async_clients_lock:
+        idle = [(loop, client) for loop, client in _async_clients.items() if not loop.is_running()]
+        for loop, _ in idle:
+            del _async_clients[loop]
+    for loop, client in idle:
+        _close_async_client(loop, client)
+
+
+async def aclose_openai_client():
+    """Close the async client of the running event loop; call it before the loop ends."""
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+atexit.register(close_openai_client)
+
+
+def get_embedding_cache():
+    """Get the query-embedding cache configured by EMBEDDING_CACHE_* variables."""
+    global _embedding_cache, _cache_initialized
+    if not _cache_initialized:
+        with _client_lock:
+            if not _cache_initialized:
+                _embedding_cache = create_embedding_cache()
+                _cache_initialized = True
+    return _embedding_cache
+
+
+def get_embedding_cache_stats():
+    """Return hit/miss counters of the query-embedding cache."""
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {"backend": "none"}
+
+
 def get_embedding(text: str, model="text-embedding-ada-002") -> List[float]:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    cache = get_embedding_cache()
+    key = make_cache_key(model, text)
+    if cache is not None:
+        embedding = cache.get(key)
+        if embedding is not None:
+            return embedding
+
+    client = get_openai_client()
+    # Only the cache key is normalized; catalog vectors are embedded from the original-case text too
     response = client.embeddings.create(input=text, model=model)
-    return response.data[0].embedding
+    embedding = response.data[0].embedding
+    if cache is not None:
+        cache.set(key, embedding)
+    return embedding
+
+async def aget_embedding(text: str, model="text-embedding-ada-002") -> List[float]:
+    """Async version of get_embedding, sharing its cache."""
+    cache = get_embedding_cache()
+    key = make_cache_key(model, text)
+    if cache is not None:
+        embedding = cache.get(key)
+        if embedding is not None:
+            return embedding
+
+    client = get_async_openai_client()
+    response = await client.embeddings.create(input=text, model=model)
+    embedding = response.data[0].embedding
+    if cache is not None:
+        cache.set(key, embedding)
+    return embedding
 
 def get_batch_embeddings(texts: List[str], model="text-embedding-ada-002", batch_size=100) -> List[List[float]]:
     """
@@ -22,7 +154,7 @@ def get_batch_embeddings(texts: List[str], model="text-embedding-ada-002", batch
         List of embedding vectors
     """
     all_embeddings = []
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = get_openai_client()
 
     # Process in batches to avoid API limits
     for i in range(0, len(texts), batch_size):
@@ -33,20 +165,104 @@ def get_batch_embeddings(texts: List[str], model="text-embedding-ada-002", batch
         
         if not cleaned_batch:
             continue
-        # print(cleaned_batch)
-        try:
-            # Call OpenAI's embedding API
-            response = client.embeddings.create(input=cleaned_batch, model=model)
-            # Extract embeddings
-            batch_embeddings = [item.embedding for item in response.data]
-            # print(batch_embeddings)
-            all_embeddings.extend(batch_embeddings)
-            
-            print(f"Generated embeddings for batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
-            
-        except Exception as e:
-            print(f"Error generating batch embeddings: {str(e)}")
-            # Add zero vectors as fallback
-            all_embeddings.extend([[0.0] * 1536] * len(cleaned_batch))
+        # Call OpenAI's embedding API, retrying transient failures
+        batch_embeddings = embed_batch_with_retry(cleaned_batch, model=model, client=client)
+        all_embeddings.extend(batch_embeddings)
+        
+        print(f"Generated embeddings for batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
     
     return all_embeddings
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    """Rough token count of texts (about four characters per token)."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+    
+    acquire() blocks until both budgets allow the request; it is shared by all
+    embedding worker threads.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = requests_per_minute
+        self._token_allowance = tokens_per_minute
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._request_allowance = min(self.requests_per_minute, self._request_allowance + elapsed * self.requests_per_minute / 60)
+        self._token_allowance = min(self.tokens_per_minute, self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        # A single request larger than the whole budget would never fit; cap it
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._request_allowance >= 1 and self._token_allowance >= tokens:
+                    self._request_allowance -= 1
+                    self._token_allowance -= tokens
+                    return
+                wait = max(
+                    (1 - self._request_allowance) * 60 / self.requests_per_minute,
+                    (tokens - self._token_allowance) * 60 / self.tokens_per_minute,
+                )
+            time.sleep(max(wait, 0.001))
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the shared limiter configured by EMBEDDING_RPM and EMBEDDING_TPM."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _client_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(
+                    requests_per_minute=float(os.getenv("EMBEDDING_RPM", "3000")),
+                    tokens_per_minute=float(os.getenv("EMBEDDING_TPM", "1000000")),
+                )
+    return _rate_limiter
+
+
+def embed_batch_with_retry(texts: List[str], model="text-embedding-ada-002", client=None,
+                           rate_limiter: RateLimiter = None, max_retries: int = 5,
+                           base_delay: float = 1.0, max_delay: float = 30.0) -> List[List[float]]:
+    """
+    Embed one batch of texts within the rate limit, retrying with exponential backoff.
+    
+    Args:
+        texts: Cleaned, non-empty texts to embed in one API call
+        model: The OpenAI embedding model to use
+        client: OpenAI client, defaults to the shared client
+        rate_limiter: Rate limiter, defaults to the shared limiter
+        max_retries: Number of retries before the error is raised
+        base_delay: Delay before the first retry in seconds
+        max_delay: Upper bound of the delay between retries in seconds
+        
+    Returns:
+        List of embedding vectors
+    """
+    client = client or get_openai_client()
+    rate_limiter = rate_limiter or get_rate_limiter()
+    tokens = estimate_tokens(texts)
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire(tokens)
+        try:
+            response = client.embeddings.create(input=texts, model=model)
+            return [item.embedding for item in response.data]
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(base_delay * 2 ** attempt, max_delay) * random.uniform(0.5, 1.0)
+            print(f"Error generating batch embeddings (attempt {attempt + 1}/{max_retries + 1}): {e}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
@@ -1,27 +1,81 @@
 import os
 import json
+import argparse
 from pathlib import Path
-from data.mongodb.schemas import import_products_to_mongodb
-from data.pinecone.index import index_cheese_products
+from data.mongodb.schemas import bulk_import_products, setup_mongodb, diff_products, apply_product_changes, summarize_changes
+from data.pinecone.index import index_cheese_products, delete_cheese_products
+from data.local_index.index import uses_local_index, index_cheese_products_locally
+from data.catalog_version import bump_catalog_version
 
 # Google Drive file ID for the pre-scraped data
 GDRIVE_FILE_ID = "13HNQaUwNdOjdcjNtz-Yf-7l-yqH0UKJT"
 DATA_PATH = Path("data/cheese_data.json")
 
 
-def process_and_store_data():
-    """Process the cheese data and store it in MongoDB and Pinecone."""
+def sync_catalog(cheese_data):
+    """Apply only the inserts, updates and deletes needed to match `cheese_data`.
+    
+    The collection is never emptied, so the live agent keeps seeing the
+    catalog while the sync runs.
+    
+    Returns:
+        Change summary with inserted/updated/deleted/unchanged counts
+    """
+    setup_mongodb()
+    changes = diff_products(cheese_data)
+    summary = summarize_changes(changes)
+    print(f"Catalog changes: {summary}")
+    
+    apply_product_changes(changes)
+    
+    if uses_local_index():
+        # Rebuilding is cheap: unchanged products come from the embedding store
+        if changes["inserts"] or changes["updates"] or changes["deletes"]:
+            index_cheese_products_locally(cheese_data)
+        return summary
+    
+    changed = changes["inserts"] + changes["updates"]
+    if changed:
+        index_cheese_products(changed)
+    delete_cheese_products(changes["deletes"])
+    
+    return summary
+
+
+def process_and_store_data(mode="full"):
+    """Process the cheese data and store it in MongoDB and Pinecone.
+    
+    Args:
+        mode: "full" re-imports and re-indexes the whole catalog, "delta"
+            only applies the changes since the last load
+    """
     # Load the data
     cheese_data = json.load(open("data/cheese_data_numeric.json"))
     
-    # Import to MongoDB
-    import_products_to_mongodb(cheese_data)
+    if mode == "delta":
+        summary = sync_catalog(cheese_data)
+        if summary["inserted"] or summary["updated"] or summary["deleted"]:
+            bump_catalog_version()
+        return cheese_data
+    
+    # Import to MongoDB (provisions the schema and indexes first)
+    bulk_import_products(cheese_data)
+    
+    # Index in the configured vector backend
+    if uses_local_index():
+        index_cheese_products_locally(cheese_data)
+    else:
+        index_cheese_products(cheese_data)
     
-    # Index in Pinecone
-    index_cheese_products(cheese_data)
+    # Invalidate caches keyed by the catalog version
+    bump_catalog_version()
     
     return cheese_data
 
 if __name__ == "__main__":
     # This allows running the script directly to load data
-    process_and_store_data()
+    parser = argparse.ArgumentParser(description="Load the cheese catalog into MongoDB and Pinecone")
+    parser.add_argument("--mode", choices=["full", "delta"], default="full",
+                        help="full: replace the whole catalog, delta: apply only changed products")
+    args = parser.parse_args()
+    process_and_store_data(mode=args.mode)
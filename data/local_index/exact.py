@@ -0,0 +1,83 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from data.local_index.filters import filter_mask
+
+DEFAULT_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/local_vectors")
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize vectors so a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the `top_k` highest scores, best first."""
+    if top_k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class ExactVectorIndex:
+    """In-process cosine-similarity index over a float32 matrix of normalized embeddings.
+
+    query() mirrors Pinecone's Index.query(): exact top-k by matrix product,
+    with optional metadata pre-filtering.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]):
+        self.ids = ids
+        self.vectors = vectors
+        self.metadata = metadata
+
+    @classmethod
+    def build(cls, ids: List[str], vectors, metadata: List[Dict[str, Any]]):
+        return cls(list(ids), normalize_rows(vectors), list(metadata))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump({"ids": self.ids, "metadata": self.metadata}, f)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH, mmap: bool = True):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, "metadata.json")) as f:
+            sidecar = json.load(f)
+        return cls(sidecar["ids"], vectors, sidecar["metadata"])
+
+    def search(self, vector, top_k: int = 10, filter: Optional[Dict[str, Any]] = None):
+        """Return (row indices, scores) of the best matches."""
+        query = normalize_rows(vector)
+        if filter:
+            rows = np.flatnonzero(filter_mask(self.metadata, filter))
+            if len(rows) == 0:
+                return rows, np.zeros(0, dtype=np.float32)
+            scores = self.vectors[rows] @ query
+            best = top_k_indices(scores, top_k)
+            return rows[best], scores[best]
+        scores = self.vectors @ query
+        best = top_k_indices(scores, top_k)
+        return best, scores[best]
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        rows, scores = self.search(vector, top_k=top_k, filter=filter)
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {"id": self.ids[row], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+_COMPARISONS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+    "$exists": lambda value, target: (value is not None) == target,
+}
+
+
+def _matches_condition(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, target in condition.items():
+        if operator not in _COMPARISONS:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        try:
+            if not _COMPARISONS[operator](value, target):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """
+    Evaluate a Pinecone-style metadata filter against one record.
+
+    Supports field conditions with $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin
+    and $exists, combined with $and / $or.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif not _matches_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+def filter_mask(metadata: List[Dict[str, Any]], filter: Dict[str, Any]) -> np.ndarray:
+    """Boolean mask of the records that match a metadata filter."""
+    return np.fromiter((matches_filter(record, filter) for record in metadata), dtype=bool, count=len(metadata))
@@ -0,0 +1,95 @@
+import os
+import threading
+from typing import List, Dict, Any
+
+from data.embeddings import get_embedding
+from data.embedding_store import get_stored_embeddings
+from data.pinecone.index import build_product_text, build_product_metadata
+from data.local_index.exact import ExactVectorIndex, DEFAULT_INDEX_PATH
+from data.local_index.ivf import IVFVectorIndex
+
+_local_index = None
+_loaded_mtime = None
+_lock = threading.Lock()
+
+
+def get_vector_backend() -> str:
+    """Vector search backend selected by VECTOR_BACKEND.
+
+    "pinecone" (default), "local" (exact NumPy index) or "ivf" (approximate
+    IVF index, tuned with IVF_NLIST, IVF_NPROBE and VECTOR_QUANTIZATION).
+    """
+    return os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+
+def uses_local_index() -> bool:
+    """Whether vector search is served by an in-process index."""
+    return get_vector_backend() in ("local", "ivf")
+
+
+def index_cheese_products_locally(products: List[Dict[str, Any]], path: str = DEFAULT_INDEX_PATH):
+    """
+    Build the local vector index for cheese products and save it to disk.
+
+    Embeddings come from the on-disk embedding store, so rebuilding only
+    embeds products whose text changed.
+
+    Args:
+        products: List of cheese product dictionaries
+        path: Directory of the saved index
+    """
+    products = [product for product in products if product.get("sku")]
+    embeddings = get_stored_embeddings([build_product_text(product) for product in products])
+    ids = [product["sku"] for product in products]
+    metadata = [build_product_metadata(product) for product in products]
+    if get_vector_backend() == "ivf":
+        index = IVFVectorIndex.build(
+            ids, embeddings, metadata,
+            n_lists=int(os.getenv("IVF_NLIST", "0")) or None,
+            nprobe=int(os.getenv("IVF_NPROBE", "16")),
+            quantization=os.getenv("VECTOR_QUANTIZATION", "int8"),
+        )
+    else:
+        index = ExactVectorIndex.build(ids, embeddings, metadata)
+    # Drop files of a previously saved index of the other kind
+    for stale in ("vectors.npy", "ivf.json"):
+        if os.path.exists(os.path.join(path, stale)):
+            os.remove(os.path.join(path, stale))
+    index.save(path)
+    print(f"Saved local vector index with {len(index)} cheese products to {path}")
+    return index
+
+
+def load_local_index(path: str = DEFAULT_INDEX_PATH):
+    """Load a saved exact or IVF index from disk."""
+    if os.path.exists(os.path.join(path, "ivf.json")):
+        return IVFVectorIndex.load(path)
+    return ExactVectorIndex.load(path)
+
+
+def get_local_index(path: str = DEFAULT_INDEX_PATH):
+    """Get the memory-mapped local index, reloading it when it is rebuilt on disk."""
+    global _local_index, _loaded_mtime
+    mtime = os.path.getmtime(os.path.join(path, "metadata.json"))
+    if _local_index is None or mtime != _loaded_mtime:
+        with _lock:
+            if _local_index is None or mtime != _loaded_mtime:
+                _local_index = load_local_index(path)
+                _loaded_mtime = mtime
+    return _local_index
+
+
+def local_search(query: str, top_k: int = 10, filter: Dict = None, query_vector: List[float] = None) -> Dict[str, Any]:
+    """
+    Search the local vector index; returns matches shaped like a Pinecone query response.
+
+    Args:
+        query: Search query
+        top_k: Number of results to return
+        filter: Optional Pinecone-style metadata filter
+        query_vector: Embedding of the query, if the caller already has it
+    """
+    index = get_local_index()
+    if query_vector is None:
+        query_vector = get_embedding(query)
+    return index.query(query_vector, top_k=top_k, include_metadata=True, filter=filter)
@@ -0,0 +1,178 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from data.local_index.exact import normalize_rows, top_k_indices
+from data.local_index.filters import matches_filter
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every vector."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, iterations: int = 20, sample_size: int = 64,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of normalized vectors."""
+    rng = np.random.default_rng(seed)
+    sample_count = min(len(vectors), n_lists * sample_size)
+    sample = vectors[rng.choice(len(vectors), sample_count, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=n_lists)
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        # Re-seed empty lists with random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def quantize(vectors: np.ndarray, quantization: str):
+    """Encode normalized vectors; returns (codes, per-vector scales or None)."""
+    if quantization == "float32":
+        return vectors.astype(np.float32), None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+class IVFVectorIndex:
+    """Approximate cosine-similarity index with an inverted file (IVF) layout.
+
+    Vectors are clustered around `n_lists` centroids and stored contiguously
+    per list, optionally quantized to float16 or int8. A query only scans the
+    `nprobe` lists whose centroids are closest, trading recall for latency.
+    """
+
+    def __init__(self, ids: List[str], metadata: List[Dict[str, Any]], centroids: np.ndarray, codes: np.ndarray,
+                 scales: Optional[np.ndarray], offsets: np.ndarray, rows: np.ndarray, quantization: str,
+                 nprobe: int = 16):
+        self.ids = ids
+        self.metadata = metadata
+        self.centroids = centroids
+        self.codes = codes
+        self.scales = scales
+        self.offsets = offsets
+        self.rows = rows
+        self.quantization = quantization
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, ids: List[str], vectors, metadata: List[Dict[str, Any]], n_lists: int = None,
+              quantization: str = "float32", nprobe: int = 16, iterations: int = 20, seed: int = 0):
+        """
+        Train the coarse quantizer and build the inverted lists.
+
+        Args:
+            ids: Vector IDs
+            vectors: Embeddings, one row per ID
+            metadata: Metadata for each ID
+            n_lists: Number of inverted lists, defaults to about 4 * sqrt(n)
+            quantization: Storage type of the vectors: float32, float16 or int8
+            nprobe: Default number of lists scanned per query
+            iterations: k-means iterations
+            seed: Random seed for training
+        """
+        vectors = normalize_rows(vectors)
+        n_lists = n_lists or max(1, min(len(vectors), int(4 * np.sqrt(len(vectors)))))
+        centroids = train_centroids(vectors, n_lists, iterations=iterations, seed=seed)
+        assignments = _assign(vectors, centroids)
+
+        # Store the vectors of each list contiguously; rows maps storage order to the original row
+        rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        codes, scales = quantize(vectors[rows], quantization)
+        return cls(list(ids), list(metadata), centroids, codes, scales, offsets, rows, quantization, nprobe)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "codes.npy"), self.codes)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "rows.npy"), self.rows)
+        if self.scales is not None:
+            np.save(os.path.join(path, "scales.npy"), self.scales)
+        with open(os.path.join(path, "ivf.json"), "w") as f:
+            json.dump({"quantization": self.quantization, "nprobe": self.nprobe}, f)
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump({"ids": self.ids, "metadata": self.metadata}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "ivf.json")) as f:
+            config = json.load(f)
+        with open(os.path.join(path, "metadata.json")) as f:
+            sidecar = json.load(f)
+        scales_path = os.path.join(path, "scales.npy")
+        return cls(
+            sidecar["ids"],
+            sidecar["metadata"],
+            centroids=np.load(os.path.join(path, "centroids.npy")),
+            codes=np.load(os.path.join(path, "codes.npy"), mmap_mode=mode),
+            scales=np.load(scales_path, mmap_mode=mode) if os.path.exists(scales_path) else None,
+            offsets=np.load(os.path.join(path, "offsets.npy")),
+            rows=np.load(os.path.join(path, "rows.npy"), mmap_mode=mode),
+            quantization=config["quantization"],
+            nprobe=config["nprobe"],
+        )
+
+    def search(self, vector, top_k: int = 10, filter: Optional[Dict[str, Any]] = None, nprobe: int = None):
+        """Return (row indices, scores) of the approximate best matches."""
+        query = normalize_rows(vector)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = top_k_indices(self.centroids @ query, nprobe)
+
+        positions = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+        if filter:
+            keep = [matches_filter(self.metadata[self.rows[position]], filter) for position in positions]
+            positions = positions[np.asarray(keep, dtype=bool)]
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if filter:
+            codes = self.codes[positions]
+            scales = self.scales[positions] if self.scales is not None else None
+        else:
+            # Lists are contiguous, so unfiltered candidates are read as slices
+            codes = np.concatenate([self.codes[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+            scales = (np.concatenate([self.scales[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+                      if self.scales is not None else None)
+        if self.quantization == "int8":
+            scores = (codes.astype(np.float32) @ query) * scales
+        else:
+            scores = codes.astype(np.float32, copy=False) @ query
+        best = top_k_indices(scores, top_k)
+        return self.rows[positions[best]], scores[best]
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, nprobe: int = None, **kwargs) -> Dict[str, Any]:
+        rows, scores = self.search(vector, top_k=top_k, filter=filter, nprobe=nprobe)
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {"id": self.ids[row], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
@@ -1,17 +1,265 @@
 import os
-from pymongo import MongoClient
+import atexit
+import asyncio
+import threading
+from pymongo import AsyncMongoClient, MongoClient, monitoring
 from dotenv import load_dotenv
 from pymongo.server_api import ServerApi
 # Load environment variables
 load_dotenv()
 
+# Connection strings with this scheme are served by mongomock (useful for local benchmarks)
+MONGOMOCK_SCHEME = "mongomock://"
+
+# Process-wide client shared by every node, tool and loader
+_client = None
+_client_lock = threading.Lock()
+# Async clients are bound to the event loop they were created in, so there is one per loop.
+# Each is closed with its loop (see aclose_mongodb_client), when the next loop finds its loop closed, or at exit
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collect connection pool statistics from pymongo pool events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkins = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.total_wait_time = 0.0
+            self.max_wait_time = 0.0
+            self.pools_cleared = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkins": self.checkins,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "open_connections": self.connections_created - self.connections_closed,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "total_wait_time": self.total_wait_time,
+                "avg_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+                "max_wait_time": self.max_wait_time,
+                "pools_cleared": self.pools_cleared,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        # `duration` (seconds spent waiting for the connection) is available since pymongo 4.7
+        wait_time = getattr(event, "duration", 0.0) or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+
+pool_stats = PoolStatsListener()
+
+
+def get_pool_options():
+    """Read connection pool settings from environment variables."""
+    return {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "2")),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    }
+
+
+def create_mongodb_client(connection_string=None, listener=None, **pool_options):
+    """Create a new MongoDB client.
+
+    Args:
+        connection_string: MongoDB URI, defaults to MONGODB_CONNECTION_STRING
+        listener: Pool event listener, defaults to the shared pool_stats
+        pool_options: Overrides for the pool settings from get_pool_options()
+
+    Returns:
+        A pymongo MongoClient, or a mongomock client for mongomock:// URIs
+    """
+    connection_string = connection_string or os.getenv("MONGODB_CONNECTION_STRING")
+    if not connection_string:
+        raise ValueError("MONGODB_CONNECTION_STRING environment variable not set")
+
+    if connection_string.startswith(MONGOMOCK_SCHEME):
+        import mongomock
+        return mongomock.MongoClient()
+
+    options = {**get_pool_options(), **pool_options}
+    return MongoClient(connection_string, event_listeners=[listener or pool_stats], **options)
+
+
 def get_mongodb_client():
-    """Get MongoDB client using connection string from environment variables."""
+    """Get the shared MongoDB client, creating it on first use.
+
+    The client is thread-safe and owns the connection pool, so it is created
+    once per process and reused by every caller.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_mongodb_client()
+    return _client
+
+
+def warm_up_mongodb(db_name="Cheese", collection_name="cheese"):
+    """Create the shared client and open its first connections eagerly.
+
+    Runs server discovery and a ping so the first user query does not pay for
+    the TCP/TLS handshake. Safe to call more than once.
+    """
+    client = get_mongodb_client()
+    client.admin.command("ping")
+    # Touch the collection so the first real query finds a connection checked in
+    client[db_name][collection_name].find_one({}, {"_id": 1})
+    return client
+
+
+def _close_async_client(loop, client, wait: bool = True):
+    """Close the async client of a loop that is not running.
+
+    Runs on a helper thread, so it also works when the caller is inside an
+    event loop: on the client's own loop while it is open, else on a new one.
+    """
+    def close():
+        try:
+            if loop.is_closed():
+                asyncio.run(client.close())
+            else:
+                loop.run_until_complete(client.close())
+        except Exception as e:
+            print(f"Could not close async MongoDB client: {e}")
+
+    thread = threading.Thread(target=close, name="mongodb-async-close", daemon=True)
+    thread.start()
+    if wait:
+        thread.join(timeout=10)
+
+
+def close_mongodb_client():
+    """Close the shared MongoDB client and the async clients of loops that are not running."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    with _async_clients_lock:
+        idle = [(loop, client) for loop, client in _async_clients.items() if not loop.is_running()]
+        for loop, _ in idle:
+            del _async_clients[loop]
+    for loop, client in idle:
+        _close_async_client(loop, client)
+
+
+async def aclose_mongodb_client():
+    """Close the async client of the running event loop; call it before the loop ends."""
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def get_pool_stats():
+    """Return connection pool statistics for the shared client."""
+    stats = pool_stats.snapshot()
+    stats["pool_options"] = get_pool_options()
+    stats["connected"] = _client is not None
+    return stats
+
+
+atexit.register(close_mongodb_client)
+
+
+def uses_mongomock() -> bool:
+    """Whether MONGODB_CONNECTION_STRING points at mongomock, which has no async client."""
+    return (os.getenv("MONGODB_CONNECTION_STRING") or "").startswith(MONGOMOCK_SCHEME)
+
+
+def get_async_mongodb_client():
+    """Get the AsyncMongoClient of the running event loop, creating it on first use.
+
+    Returns:
+        A pymongo AsyncMongoClient with the same pool settings as the sync
+        client, or None for mongomock:// URIs
+    """
+    if uses_mongomock():
+        return None
     connection_string = os.getenv("MONGODB_CONNECTION_STRING")
     if not connection_string:
         raise ValueError("MONGODB_CONNECTION_STRING environment variable not set")
-    
-    return MongoClient(connection_string)
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is not None:
+            return client
+        client = AsyncMongoClient(connection_string, event_listeners=[pool_stats], **get_pool_options())
+        _async_clients[loop] = client
+        # A new loop usually means an earlier asyncio.run() has finished; release the pools of closed loops
+        stale = [(other, other_client) for other, other_client in _async_clients.items() if other.is_closed()]
+        for other, _ in stale:
+            del _async_clients[other]
+    for other, stale_client in stale:
+        _close_async_client(other, stale_client, wait=False)
+    return client
+
+
+def get_async_collection(collection_name="cheese", db_name="Cheese"):
+    """Get a collection of the async client, or None when only the sync client is available."""
+    client = get_async_mongodb_client()
+    return client[db_name][collection_name] if client is not None else None
+
 
 def get_database(db_name="Cheese"):
     """Get MongoDB database."""
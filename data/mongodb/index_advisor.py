@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from data.mongodb.connection import get_collection, get_database
+
+# Operators an index can answer with an equality seek
+EQUALITY_OPERATORS = {"$eq", "$in"}
+# Operators an index can answer with a range scan
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists"}
+# Longest compound index the advisor recommends
+MAX_INDEX_FIELDS = 4
+
+_pending = {}
+_pending_lock = threading.Lock()
+# Flushes run on one background thread, never inside a request
+_flush_requested = threading.Event()
+_flusher = None
+
+
+def shape_logging_enabled() -> bool:
+    return os.getenv("QUERY_SHAPE_LOGGING", "true").lower() == "true"
+
+
+def _condition_kind(value: Any) -> str:
+    """How a $match condition on one field can use an index: "eq", "range" or "regex"."""
+    if isinstance(value, dict) and value and all(key.startswith("$") for key in value):
+        operators = set(value) - {"$options"}
+        if "$regex" in operators:
+            # Only a case-sensitive ^prefix regex is a bounded range scan
+            pattern = value["$regex"] if isinstance(value["$regex"], str) else ""
+            return "range" if pattern.startswith("^") and "i" not in value.get("$options", "") else "regex"
+        if operators and operators <= EQUALITY_OPERATORS:
+            return "eq"
+        return "range" if operators & RANGE_OPERATORS else "other"
+    if hasattr(value, "pattern"):
+        return "regex"
+    return "eq"
+
+
+def _match_shape(condition: Dict[str, Any]) -> Dict[str, str]:
+    """Field -> condition kind of a $match, with literal values stripped."""
+    shape = {}
+    for key, value in condition.items():
+        if key == "$and":
+            for clause in value:
+                shape.update(_match_shape(clause))
+        elif key.startswith("$"):
+            # $or, $expr, $text, ... are recorded but not indexed by the advisor
+            shape[key] = "other"
+        else:
+            shape[key] = _condition_kind(value)
+    return shape
+
+
+def normalize_shape(pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduce a pipeline to its query shape.
+
+    $match stages keep their fields and condition kinds, $sort stages their
+    keys and directions; every other stage keeps only its name.
+    """
+    shape = []
+    for stage in pipeline:
+        name = next(iter(stage))
+        if name == "$match":
+            shape.append({"$match": _match_shape(stage["$match"])})
+        elif name == "$sort":
+            shape.append({"$sort": stage["$sort"]})
+        else:
+            shape.append({name: "?"})
+    return shape
+
+
+def shape_key(shape: List[Dict[str, Any]]) -> str:
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def summarize_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Whether the winning plan scans the collection and which indexes it uses."""
+    stages, indexes = [], []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.append(node["stage"])
+            if node.get("indexName"):
+                indexes.append(node["indexName"])
+            for key, value in node.items():
+                # Rejected plans say nothing about what actually runs
+                if key != "rejectedPlans":
+                    walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(explain)
+    return {"collscan": "COLLSCAN" in stages, "indexes": sorted(set(indexes))}
+
+
+def record_query_shape(pipeline: List[Dict[str, Any]], plan: Optional[Dict[str, Any]]):
+    """
+    Count one execution of a pipeline's query shape together with its plan.
+
+    Executions are buffered and upserted into the query_shapes collection by
+    a background thread every QUERY_SHAPE_FLUSH_EVERY records, and at exit.
+    Recording never does I/O, so it is safe on the event loop.
+
+    Args:
+        pipeline: The pipeline as sent to the server
+        plan: summarize_plan() of its explain output, or None when it couldn't be explained
+    """
+    if not shape_logging_enabled():
+        return
+    shape = normalize_shape(pipeline)
+    key = shape_key(shape)
+    with _pending_lock:
+        entry = _pending.setdefault(key, {"shape": shape, "count": 0, "explained": 0, "collscans": 0, "indexes": set()})
+        entry["count"] += 1
+        if plan:
+            entry["explained"] += 1
+            entry["collscans"] += int(bool(plan["collscan"]))
+            entry["indexes"].update(plan["indexes"])
+        buffered = sum(item["count"] for item in _pending.values())
+    if buffered >= int(os.getenv("QUERY_SHAPE_FLUSH_EVERY", "20")):
+        _request_flush()
+
+
+def _flush_in_background():
+    while True:
+        _flush_requested.wait()
+        _flush_requested.clear()
+        flush_query_shapes()
+
+
+def _request_flush():
+    global _flusher
+    with _pending_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_in_background, name="query-shape-flush", daemon=True)
+            _flusher.start()
+    _flush_requested.set()
+
+
+def flush_query_shapes():
+    """Upsert the buffered query shapes into the query_shapes collection."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    now = time.time()
+    operations = [
+        UpdateOne(
+            {"_id": key},
+            {
+                # Stored as JSON: shapes have "$" and dotted keys
+                "$set": {"shape": json.dumps(entry["shape"], sort_keys=True), "last_seen": now},
+                "$inc": {"count": entry["count"], "explained": entry["explained"], "collscans": entry["collscans"]},
+                "$addToSet": {"indexes": {"$each": sorted(entry["indexes"])}},
+            },
+            upsert=True,
+        )
+        for key, entry in pending.items()
+    ]
+    try:
+        get_database()["query_shapes"].bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Could not store query shapes: {e}")
+
+
+atexit.register(flush_query_shapes)
+
+
+def recommend_index(shape: List[Dict[str, Any]]) -> Optional[List[Tuple[str, int]]]:
+    """
+    Compound index for a query shape following the Equality, Sort, Range rule.
+
+    Only the leading $match (and a $sort right after it) can use an index.
+
+    Returns:
+        Index keys, or None when the shape can't use one
+    """
+    if not shape or "$match" not in shape[0]:
+        first = shape[0] if shape else {}
+        if "$sort" in first:
+            return list(first["$sort"].items())[:MAX_INDEX_FIELDS]
+        return None
+    conditions = shape[0]["$match"]
+    sort = shape[1]["$sort"] if len(shape) > 1 and "$sort" in shape[1] else {}
+    equality = [field for field, kind in conditions.items() if kind == "eq"]
+    # An unanchored or case-insensitive regex has to read every index key, so it gets none
+    ranges = [field for field, kind in conditions.items() if kind == "range" and field not in sort]
+    keys = [(field, ASCENDING) for field in equality]
+    keys += [(field, direction) for field, direction in sort.items() if field not in equality]
+    keys += [(field, ASCENDING) for field in ranges]
+    return keys[:MAX_INDEX_FIELDS] or None
+
+
+def _serves(index_keys: List[Tuple[str, int]], keys: List[Tuple[str, int]]) -> bool:
+    """Whether an index with `index_keys` answers queries that want `keys` (same prefix, or reversed)."""
+    if len(index_keys) < len(keys):
+        return False
+    prefix = index_keys[:len(keys)]
+    reversed_keys = [(field, -direction) for field, direction in keys]
+    return prefix == keys or prefix == reversed_keys
+
+
+def existing_indexes(collection) -> Dict[str, List[Tuple[str, int]]]:
+    """Index name -> keys; text indexes are left out since they don't serve ESR shapes."""
+    indexes = {}
+    for name, info in collection.index_information().items():
+        keys = info["key"]
+        if all(isinstance(direction, (int, float)) for _, direction in keys):
+            indexes[name] = [(field, int(direction)) for field, direction in keys]
+    return indexes
+
+
+def index_usage(collection) -> Optional[Dict[str, int]]:
+    """Index name -> operations since the server started, from $indexStats."""
+    try:
+        return {stats["name"]: stats["accesses"]["ops"] for stats in collection.aggregate([{"$indexStats": {}}])}
+    except Exception as e:
+        print(f"Could not read $indexStats: {e}")
+        return None
+
+
+def analyze_workload(collection=None, min_count: int = 1) -> Dict[str, Any]:
+    """
+    Compare the recorded query shapes with the collection's indexes.
+
+    Args:
+        collection: Products collection, defaults to get_collection()
+        min_count: Ignore shapes seen fewer times than this
+
+    Returns:
+        Dict with the analyzed "shapes", the "missing" compound indexes
+        (keys plus the number of executions they'd serve) and "unused" index names
+    """
+    collection = collection if collection is not None else get_collection()
+    flush_query_shapes()
+    indexes = existing_indexes(collection)
+    shapes = list(get_database()["query_shapes"].find({"count": {"$gte": min_count}}).sort("count", DESCENDING))
+
+    wanted = defaultdict(int)
+    for shape in shapes:
+        shape["shape"] = json.loads(shape["shape"])
+        keys = recommend_index(shape["shape"])
+        shape["recommended"] = keys
+        shape["served_by"] = [name for name, index_keys in indexes.items() if keys and _serves(index_keys, keys)]
+        if keys and not shape["served_by"]:
+            wanted[tuple(keys)] += shape["count"]
+
+    # A candidate that is a prefix of a longer one is served by it
+    missing = []
+    for keys, count in sorted(wanted.items(), key=lambda item: -len(item[0])):
+        for candidate in missing:
+            if _serves(list(candidate["keys"]), list(keys)):
+                candidate["count"] += count
+                break
+        else:
+            missing.append({"keys": list(keys), "count": count})
+    missing.sort(key=lambda candidate: -candidate["count"])
+
+    usage = index_usage(collection)
+    unused = [name for name in indexes if name != "_id_" and usage is not None and usage.get(name, 0) == 0]
+    return {"shapes": shapes, "missing": missing, "unused": unused, "usage": usage}
+
+
+def format_keys(keys: List[Tuple[str, int]]) -> str:
+    return "{" + ", ".join(f"{field}: {direction}" for field, direction in keys) + "}"
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{len(report['shapes'])} query shapes")
+    for shape in report["shapes"]:
+        explained = shape.get("explained", 0)
+        collscan_rate = f"{shape.get('collscans', 0) / explained:4.0%}" if explained else "   ?"
+        print(f"  {shape['count']:>6}x  COLLSCAN {collscan_rate}  indexes {shape.get('indexes') or '-'}")
+        print(f"          {json.dumps(shape['shape'])}")
+        if shape["recommended"]:
+            served = ", ".join(shape["served_by"]) or "MISSING"
+            print(f"          wants {format_keys(shape['recommended'])}  served by {served}")
+
+    print("\nMissing indexes:" if report["missing"] else "\nNo missing indexes")
+    for candidate in report["missing"]:
+        print(f"  {format_keys(candidate['keys'])}  serves {candidate['count']} executions")
+
+    if report["usage"] is None:
+        print("\nIndex usage unavailable")
+    else:
+        print("\nUnused indexes:" if report["unused"] else "\nNo unused indexes")
+        for name in report["unused"]:
+            print(f"  {name}")
+
+
+def apply_recommendations(report: Dict[str, Any], collection=None) -> List[str]:
+    """Create the missing compound indexes of an analyze_workload() report."""
+    collection = collection if collection is not None else get_collection()
+    created = []
+    for candidate in report["missing"]:
+        name = collection.create_index(candidate["keys"])
+        print(f"Created index {name}")
+        created.append(name)
+    return created
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Recommend MongoDB indexes for the recorded query shapes")
+    parser.add_argument("--apply", action="store_true", help="Create the recommended compound indexes")
+    parser.add_argument("--min-count", type=int, default=1, help="Ignore shapes seen fewer times than this")
+    args = parser.parse_args()
+    report = analyze_workload(min_count=args.min_count)
+    print_report(report)
+    if args.apply:
+        apply_recommendations(report)
@@ -0,0 +1,476 @@
+import os
+import re
+import copy
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data.catalog_version import get_catalog_version
+from data.mongodb.connection import get_collection
+from data.mongodb.pipeline import count_pipeline, get_guard_settings, needs_count, optimize_pipeline, take_bounded
+
+
+class UnsupportedPipeline(Exception):
+    """Raised for stages or operators the local engine doesn't implement; the pipeline goes to MongoDB instead."""
+
+
+class _Missing:
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _bracket(value: Any) -> int:
+    """BSON comparison order of the value's type: null, numbers, strings, objects, arrays, booleans."""
+    if value is MISSING or value is None:
+        return 0
+    if _is_number(value):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, bool):
+        return 5
+    raise UnsupportedPipeline(f"values of type {type(value).__name__}")
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    bracket = _bracket(value)
+    if bracket in (3, 4):
+        raise UnsupportedPipeline("sorting on objects or arrays")
+    return bracket, value if bracket else 0
+
+
+def _equal(value: Any, target: Any) -> bool:
+    if target is None:
+        return value is MISSING or value is None
+    if hasattr(target, "pattern"):
+        return isinstance(value, str) and _compile(target).search(value) is not None
+    return _bracket(value) == _bracket(target) and value == target
+
+
+def _compile(regex: Any, options: str = "") -> re.Pattern:
+    """Compile a pattern string or a bson Regex with MongoDB $options."""
+    if hasattr(regex, "try_compile"):
+        return regex.try_compile()
+    if isinstance(regex, re.Pattern):
+        return regex
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(regex, flags)
+
+
+def get_path(document: Dict[str, Any], path: str) -> Any:
+    """Value at a dotted path, or MISSING."""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, list):
+            raise UnsupportedPipeline(f"path {path} through an array")
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def _set_path(document: Dict[str, Any], path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def _delete_path(document: Dict[str, Any], path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+
+class Column:
+    """One flattened field of the catalog: the raw values plus NumPy arrays for filtering and sorting."""
+
+    def __init__(self, raw: List[Any]):
+        self.raw = np.empty(len(raw), dtype=object)
+        for i, value in enumerate(raw):
+            self.raw[i] = value
+        self.present = np.fromiter((value is not MISSING for value in raw), bool, len(raw))
+        self.has_arrays = any(isinstance(value, (list, dict)) for value in raw)
+        values = [value for value in raw if value is not MISSING and value is not None]
+        self.numeric = bool(values) and all(_is_number(value) for value in values)
+        self.integral = self.numeric and all(isinstance(value, int) for value in values)
+        # Missing and null become NaN, which no comparison matches
+        self.numbers = np.array([float(value) if _is_number(value) else np.nan for value in raw]) if self.numeric else None
+
+    def _scalar(self, predicate) -> np.ndarray:
+        return np.fromiter((predicate(value) for value in self.raw), bool, len(self.raw))
+
+    def equals(self, target: Any) -> np.ndarray:
+        if self.numeric and _is_number(target):
+            return self.numbers == target
+        return self._scalar(lambda value: _equal(value, target))
+
+    def compare(self, operator: str, target: Any) -> np.ndarray:
+        compare = COMPARISONS[operator]
+        if self.numeric and _is_number(target):
+            with np.errstate(invalid="ignore"):
+                return compare(self.numbers, target)
+        bracket = _bracket(target)
+        return self._scalar(lambda value: _bracket(value) == bracket and bracket != 0 and compare(value, target))
+
+    def regex(self, pattern: re.Pattern) -> np.ndarray:
+        return self._scalar(lambda value: isinstance(value, str) and pattern.search(value) is not None)
+
+    def sort_key(self) -> np.ndarray:
+        """Ascending rank of every row; missing and null sort first."""
+        if self.numeric:
+            return np.where(np.isnan(self.numbers), -np.inf, self.numbers)
+        keys = [_sort_key(value) for value in self.raw]
+        ranks = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+        return np.array([ranks[key] for key in keys], dtype=float)
+
+
+class LocalCatalogEngine:
+    """
+    In-memory columnar copy of the catalog that runs aggregation pipelines.
+
+    Filters, sorts, skips and limits work on row indices over NumPy columns;
+    documents are only built by $project, $group, $count or at the end.
+    Supported: $match (comparisons, $in/$nin, $ne, $regex, $exists, $and/$or/$nor),
+    $project (inclusion, exclusion, "$field" references), $sort, $skip, $limit,
+    $count, $group ($sum/$avg/$min/$max) and $facet over those.
+    """
+
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self.documents = documents
+        self.size = len(documents)
+        self._columns = {}
+        self._containers = set()
+        paths = OrderedDict()
+        for document in documents:
+            self._collect_paths(document, "", paths)
+        for path in paths:
+            self._columns[path] = Column([get_path(document, path) for document in documents])
+
+    def _collect_paths(self, document: Dict[str, Any], prefix: str, paths: OrderedDict):
+        for key, value in document.items():
+            path = prefix + key
+            if isinstance(value, dict) and value:
+                self._containers.add(path)
+                self._collect_paths(value, path + ".", paths)
+            else:
+                paths[path] = True
+
+    def column(self, path: str) -> Column:
+        if path in self._columns:
+            return self._columns[path]
+        if path in self._containers:
+            raise UnsupportedPipeline(f"matching or sorting on the object {path}")
+        parts = path.split(".")
+        if any(".".join(parts[:i]) in self._columns and self._columns[".".join(parts[:i])].has_arrays
+               for i in range(1, len(parts))):
+            raise UnsupportedPipeline(f"path {path} through an array")
+        # A field no document has
+        column = Column([MISSING] * self.size)
+        self._columns[path] = column
+        return column
+
+    # $match
+
+    def match_mask(self, condition: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self.size, dtype=bool)
+        for key, value in condition.items():
+            if key == "$and":
+                for clause in value:
+                    mask &= self.match_mask(clause)
+            elif key in ("$or", "$nor"):
+                any_clause = np.zeros(self.size, dtype=bool)
+                for clause in value:
+                    any_clause |= self.match_mask(clause)
+                mask &= any_clause if key == "$or" else ~any_clause
+            elif key.startswith("$"):
+                raise UnsupportedPipeline(f"query operator {key}")
+            else:
+                mask &= self._field_mask(key, value)
+        return mask
+
+    def _field_mask(self, path: str, condition: Any) -> np.ndarray:
+        column = self.column(path)
+        if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+            if isinstance(condition, (dict, list)):
+                raise UnsupportedPipeline(f"exact object or array match on {path}")
+            if column.has_arrays:
+                raise UnsupportedPipeline(f"matching the array field {path}")
+            return column.equals(condition)
+
+        if column.has_arrays and set(condition) != {"$exists"}:
+            raise UnsupportedPipeline(f"matching the array field {path}")
+        mask = np.ones(self.size, dtype=bool)
+        for operator, target in condition.items():
+            if operator == "$eq":
+                mask &= column.equals(target)
+            elif operator == "$ne":
+                mask &= ~column.equals(target)
+            elif operator in ("$in", "$nin"):
+                any_value = np.zeros(self.size, dtype=bool)
+                for value in target:
+                    any_value |= column.equals(value)
+                mask &= any_value if operator == "$in" else ~any_value
+            elif operator in COMPARISONS:
+                mask &= column.compare(operator, target)
+            elif operator == "$regex":
+                mask &= column.regex(_compile(target, condition.get("$options", "")))
+            elif operator == "$options":
+                continue
+            elif operator == "$exists":
+                mask &= column.present if target else ~column.present
+            else:
+                raise UnsupportedPipeline(f"query operator {operator}")
+        return mask
+
+    # $sort
+
+    def sort_rows(self, rows: np.ndarray, spec: Dict[str, int]) -> np.ndarray:
+        keys = [direction * self.column(path).sort_key()[rows] for path, direction in reversed(list(spec.items()))]
+        # lexsort is stable, like the server's order for ties on mongomock
+        return rows[np.lexsort(keys)]
+
+    # $group
+
+    def group_rows(self, rows: np.ndarray, spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+        id_spec = spec.get("_id")
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault(self._group_key(id_spec, row), []).append(row)
+
+        results = []
+        for key, members in groups.items():
+            members = np.array(members, dtype=int)
+            result = {"_id": self._group_id(id_spec, key)}
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                if not isinstance(accumulator, dict) or len(accumulator) != 1:
+                    raise UnsupportedPipeline(f"accumulator {accumulator}")
+                operator, expression = next(iter(accumulator.items()))
+                result[field] = self._accumulate(operator, expression, members)
+            results.append(result)
+        return results
+
+    def _group_key(self, id_spec: Any, row: int) -> Any:
+        if isinstance(id_spec, dict):
+            return tuple(self._expression_value(expression, row) for expression in id_spec.values())
+        return self._expression_value(id_spec, row)
+
+    @staticmethod
+    def _group_id(id_spec: Any, key: Any) -> Any:
+        if isinstance(id_spec, dict):
+            return {name: value for name, value in zip(id_spec, key) if value is not MISSING}
+        return None if key is MISSING else key
+
+    def _expression_value(self, expression: Any, row: int) -> Any:
+        if isinstance(expression, str) and expression.startswith("$"):
+            column = self.column(expression[1:])
+            if column.has_arrays:
+                raise UnsupportedPipeline(f"grouping on the array field {expression}")
+            value = column.raw[row]
+            return None if value is MISSING else value
+        if isinstance(expression, (dict, list)):
+            raise UnsupportedPipeline(f"expression {expression}")
+        return expression
+
+    def _accumulate(self, operator: str, expression: Any, members: np.ndarray) -> Any:
+        if operator not in ("$sum", "$avg", "$min", "$max"):
+            raise UnsupportedPipeline(f"accumulator {operator}")
+        if _is_number(expression):
+            constant = {"$sum": expression * len(members), "$avg": float(expression)}
+            return constant.get(operator, expression)
+        if not (isinstance(expression, str) and expression.startswith("$")):
+            raise UnsupportedPipeline(f"accumulator expression {expression}")
+
+        column = self.column(expression[1:])
+        if column.has_arrays:
+            raise UnsupportedPipeline(f"accumulating the array field {expression}")
+        if column.numeric:
+            numbers = column.numbers[members]
+            numbers = numbers[~np.isnan(numbers)]
+            # fsum is exactly rounded, like the server's double-double summation
+            if operator == "$sum":
+                return int(numbers.sum()) if column.integral else math.fsum(numbers)
+            if not len(numbers):
+                return None
+            if operator == "$avg":
+                return math.fsum(numbers) / len(numbers)
+            value = numbers.min() if operator == "$min" else numbers.max()
+            return int(value) if column.integral else float(value)
+
+        values = [value for value in column.raw[members] if value is not MISSING and value is not None]
+        numbers = [value for value in values if _is_number(value)]
+        if operator == "$sum":
+            return math.fsum(numbers) if any(isinstance(value, float) for value in numbers) else sum(numbers)
+        if operator == "$avg":
+            return math.fsum(numbers) / len(numbers) if numbers else None
+        if not values:
+            return None
+        pick = min if operator == "$min" else max
+        return pick(values, key=_sort_key)
+
+    # Pipeline
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run an aggregation pipeline against the local catalog.
+
+        Raises:
+            UnsupportedPipeline: The pipeline uses something this engine doesn't implement
+        """
+        return self._run(pipeline, rows=np.arange(self.size), documents=None)
+
+    def _run(self, pipeline: List[Dict[str, Any]], rows: Optional[np.ndarray],
+             documents: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Run stages on row indices until a stage builds documents, then on the documents."""
+        for i, stage in enumerate(pipeline):
+            if not isinstance(stage, dict) or len(stage) != 1:
+                raise UnsupportedPipeline(f"malformed stage {stage}")
+            name, spec = next(iter(stage.items()))
+
+            if name == "$facet":
+                if i != len(pipeline) - 1:
+                    raise UnsupportedPipeline("stages after $facet")
+                return [{field: self._run(sub_pipeline, rows, documents) for field, sub_pipeline in spec.items()}]
+            if name in ("$skip", "$limit"):
+                if not _is_number(spec) or spec < 0:
+                    raise UnsupportedPipeline(f"{name} {spec}")
+                spec = int(spec)
+                window = slice(spec, None) if name == "$skip" else slice(None, spec)
+                if documents is None:
+                    rows = rows[window]
+                else:
+                    documents = documents[window]
+            elif name == "$count":
+                count = len(rows) if documents is None else len(documents)
+                # The server returns no document at all for an empty input
+                documents, rows = ([{spec: count}] if count else []), None
+            elif name == "$sort":
+                if documents is None:
+                    rows = self.sort_rows(rows, spec)
+                else:
+                    for path, direction in reversed(list(spec.items())):
+                        documents = sorted(documents, key=lambda document: _sort_key(get_path(document, path)),
+                                           reverse=direction < 0)
+            elif name == "$match":
+                if documents is not None:
+                    raise UnsupportedPipeline("$match after a stage that builds documents")
+                rows = rows[self.match_mask(spec)[rows]]
+            elif name == "$project":
+                if documents is None:
+                    documents, rows = [self.documents[row] for row in rows], None
+                documents = project(documents, spec)
+            elif name == "$group":
+                if documents is not None:
+                    raise UnsupportedPipeline("$group after a stage that builds documents")
+                documents, rows = self.group_rows(rows, spec), None
+            else:
+                raise UnsupportedPipeline(f"stage {name}")
+
+        if documents is None:
+            return [copy.deepcopy(self.documents[row]) for row in rows]
+        return documents
+
+
+def project(documents: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Apply an inclusion or exclusion $project with optional "$field" references."""
+    excluded = [path for path, value in spec.items() if value in (0, False) and not isinstance(value, str)]
+    computed = {path: value[1:] for path, value in spec.items() if isinstance(value, str) and value.startswith("$")}
+    included = [path for path, value in spec.items() if value in (1, True) and not isinstance(value, str)]
+    if len(excluded) + len(computed) + len(included) != len(spec):
+        raise UnsupportedPipeline(f"$project expression in {spec}")
+    if [path for path in excluded if path != "_id"] and (included or computed):
+        raise UnsupportedPipeline("$project mixing inclusion and exclusion")
+
+    results = []
+    for document in documents:
+        if included or computed:
+            result = {}
+            for path in included:
+                value = get_path(document, path)
+                if value is not MISSING:
+                    _set_path(result, path, copy.deepcopy(value))
+            if "_id" not in excluded and "_id" in document:
+                result["_id"] = document["_id"]
+            for path, source in computed.items():
+                value = get_path(document, source)
+                if value is not MISSING:
+                    _set_path(result, path, copy.deepcopy(value))
+        else:
+            result = copy.deepcopy(document)
+            for path in excluded:
+                _delete_path(result, path)
+        results.append(result)
+    return results
+
+
+def uses_local_engine() -> bool:
+    """Whether MONGO_BACKEND=local runs pipelines against the in-memory catalog."""
+    return os.getenv("MONGO_BACKEND", "mongodb").lower() == "local"
+
+
+_engine = None
+_engine_version = None
+_engine_lock = threading.Lock()
+
+
+def get_local_engine() -> LocalCatalogEngine:
+    """The shared engine, reloaded from MongoDB whenever the catalog version changes."""
+    global _engine, _engine_version
+    version = get_catalog_version()
+    if _engine is None or _engine_version != version:
+        with _engine_lock:
+            if _engine is None or _engine_version != version:
+                documents = list(get_collection().find({}, {"_id": 0}))
+                _engine = LocalCatalogEngine(documents)
+                _engine_version = version
+                print(f"Loaded {len(documents)} products into the local engine (catalog version {version})")
+    return _engine
+
+
+def local_aggregate(pipeline: Any) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Run a generated pipeline through the optimizer and the local engine.
+
+    Returns:
+        Tuple of (documents, total number of documents the pipeline matches)
+
+    Raises:
+        UnsupportedPipeline: The caller should run the pipeline on MongoDB instead
+    """
+    settings = get_guard_settings()
+    pipeline, capped, _ = optimize_pipeline(pipeline, settings)
+    engine = get_local_engine()
+    documents, cut_off = take_bounded(engine.aggregate(pipeline), settings)
+    if not needs_count(documents, capped, cut_off, settings):
+        return documents, len(documents)
+    counted = engine.aggregate(count_pipeline(pipeline, capped))
+    return documents, counted[0]["count"] if counted else 0
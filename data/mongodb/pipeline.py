@@ -0,0 +1,393 @@
+import os
+import json
+import threading
+
+import bson
+from pymongo.errors import OperationFailure
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from data.mongodb.index_advisor import record_query_shape, summarize_plan
+
+# Stages after which documents are no longer catalog products
+RESHAPING_STAGES = {"$group", "$count", "$facet", "$bucket", "$bucketAuto", "$sortByCount", "$replaceRoot",
+                    "$replaceWith", "$unwind"}
+# Stages a $match can be moved in front of without changing the result
+MATCH_COMMUTES_WITH = {"$sort"}
+
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+class PipelineRejected(Exception):
+    """Raised when a pipeline would scan the collection and MONGO_COLLSCAN_POLICY is "reject"."""
+
+
+def get_guard_settings() -> Dict[str, Any]:
+    """Read the pipeline guard settings from environment variables."""
+    return {
+        "max_results": int(os.getenv("MONGO_MAX_RESULTS", "50")),
+        "heavy_fields": [field.strip() for field in os.getenv("MONGO_HEAVY_FIELDS", "images,contentHash").split(",")
+                         if field.strip()],
+        "collscan_policy": os.getenv("MONGO_COLLSCAN_POLICY", "cap").lower(),
+        "collscan_max_time_ms": int(os.getenv("MONGO_COLLSCAN_MAX_TIME_MS", "2000")),
+        "max_result_bytes": int(os.getenv("MONGO_MAX_RESULT_BYTES", str(256 * 1024))),
+        # 0 fetches the whole capped result in the first batch
+        "batch_size": int(os.getenv("MONGO_BATCH_SIZE", "0")),
+    }
+
+
+def _log(rewrites: Optional[List[str]], message: str):
+    # Without a list to record into, the caller only wants the result
+    if rewrites is None:
+        return
+    print(f"Pipeline rewrite: {message}")
+    rewrites.append(message)
+
+
+def _stage_name(stage: Dict[str, Any]) -> str:
+    return next(iter(stage))
+
+
+def canonicalize(pipeline: Any, rewrites: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Bring a parsed pipeline into a canonical form.
+
+    A single stage is wrapped in a list, stages with several operators are
+    split, empty $match stages are dropped, consecutive $match stages are
+    merged with $and and $sort directions become 1 / -1.
+    """
+    if isinstance(pipeline, dict):
+        pipeline = [pipeline]
+        _log(rewrites, "wrapped a single stage in a list")
+    stages = []
+    for stage in pipeline or []:
+        if not isinstance(stage, dict) or not stage:
+            _log(rewrites, f"dropped invalid stage {stage!r}")
+            continue
+        if len(stage) > 1:
+            _log(rewrites, f"split stage with operators {list(stage)}")
+        stages.extend({name: spec} for name, spec in stage.items())
+
+    canonical = []
+    for stage in stages:
+        name, spec = _stage_name(stage), stage[_stage_name(stage)]
+        if name == "$match" and not spec:
+            _log(rewrites, "dropped empty $match")
+            continue
+        if name == "$sort" and isinstance(spec, dict):
+            normalized = {field: -1 if direction in (-1, "-1", "desc", "descending") else 1
+                          for field, direction in spec.items()}
+            if normalized != spec:
+                _log(rewrites, f"normalized $sort {spec} to {normalized}")
+            stage = {"$sort": normalized}
+        if name == "$match" and canonical and _stage_name(canonical[-1]) == "$match":
+            merged = {"$and": [canonical[-1]["$match"], spec]}
+            _log(rewrites, "merged consecutive $match stages")
+            canonical[-1] = {"$match": merged}
+            continue
+        canonical.append(stage)
+    return canonical
+
+
+def _project_keeps(spec: Dict[str, Any], fields: List[str]) -> bool:
+    """Whether a plain inclusion/exclusion $project passes `fields` through unchanged."""
+    if "_id" in fields or any(value not in (0, 1, True, False) for value in spec.values()):
+        return False
+    keys = [key for key in spec if key != "_id"]
+    related = lambda key, field: key == field or field.startswith(key + ".") or key.startswith(field + ".")
+    if keys and all(spec[key] for key in keys):
+        # Inclusion: every field must be kept whole
+        return all(any(key == field or field.startswith(key + ".") for key in keys) for field in fields)
+    # Exclusion: no field may lose any part of itself
+    return not any(related(key, field) for key in keys for field in fields)
+
+
+def _match_fields(condition: Dict[str, Any]) -> List[str]:
+    fields = []
+    for key, value in condition.items():
+        if key in ("$and", "$or", "$nor"):
+            for clause in value:
+                fields.extend(_match_fields(clause))
+        elif not key.startswith("$"):
+            fields.append(key)
+        else:
+            # $expr, $text, ... may depend on anything
+            fields.append("*")
+    return fields
+
+
+def move_matches_earlier(pipeline: List[Dict[str, Any]], rewrites: List[str]) -> List[Dict[str, Any]]:
+    """Move $match stages in front of $sort stages and of plain $project stages that keep their fields."""
+    pipeline = list(pipeline)
+    i = 1
+    while i < len(pipeline):
+        stage = pipeline[i]
+        if _stage_name(stage) != "$match":
+            i += 1
+            continue
+        fields = _match_fields(stage["$match"])
+        j = i
+        while j > 0:
+            previous = pipeline[j - 1]
+            name = _stage_name(previous)
+            if name in MATCH_COMMUTES_WITH or (name == "$project" and "*" not in fields
+                                                and _project_keeps(previous["$project"], fields)):
+                j -= 1
+            else:
+                break
+        if j < i:
+            _log(rewrites, f"moved $match before {[_stage_name(s) for s in pipeline[j:i]]}")
+            pipeline.insert(j, pipeline.pop(i))
+        i += 1
+    return pipeline
+
+
+def returns_documents(pipeline: List[Dict[str, Any]]) -> bool:
+    """Whether the pipeline outputs catalog documents rather than groups or counts."""
+    return not any(_stage_name(stage) in RESHAPING_STAGES for stage in pipeline)
+
+
+def drop_heavy_fields(pipeline: List[Dict[str, Any]], heavy_fields: List[str], rewrites: List[str]) -> List[Dict[str, Any]]:
+    """
+    Append a $project that removes _id and heavy fields from returned documents.
+
+    Heavy fields a $project of the pipeline asks for explicitly are kept.
+    """
+    if not returns_documents(pipeline):
+        return pipeline
+    requested = {field for stage in pipeline if _stage_name(stage) == "$project"
+                 for field, value in stage["$project"].items() if value not in (0, False)}
+    dropped = [field for field in heavy_fields if field not in requested]
+    _log(rewrites, f"dropped _id and heavy fields {dropped}")
+    return pipeline + [{"$project": {"_id": 0, **{field: 0 for field in dropped}}}]
+
+
+def cap_results(pipeline: List[Dict[str, Any]], max_results: int, rewrites: List[str]) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Cap the number of returned documents.
+
+    Unless the pipeline already ends in a $count or has a $limit of at most
+    `max_results`, a $limit of `max_results` is appended; the true total is
+    then counted separately when the cap is reached (see count_pipeline()).
+
+    Returns:
+        Tuple of (pipeline, whether the cap was appended)
+    """
+    if pipeline:
+        last = pipeline[-1]
+        if _stage_name(last) == "$count":
+            return pipeline, False
+        # A small $limit bounds the output unless an $unwind after it multiplies the documents
+        for stage in reversed(pipeline):
+            name = _stage_name(stage)
+            if name == "$unwind":
+                break
+            if name == "$limit" and isinstance(stage["$limit"], int) and stage["$limit"] <= max_results:
+                return pipeline, False
+    _log(rewrites, f"capped results at {max_results}")
+    return pipeline + [{"$limit": max_results}], True
+
+
+def count_pipeline(pipeline: List[Dict[str, Any]], capped: bool) -> List[Dict[str, Any]]:
+    """The pipeline without the appended cap, counting its output instead of returning it."""
+    return (pipeline[:-1] if capped else pipeline) + [{"$count": "count"}]
+
+
+def optimize_pipeline(pipeline: Any, settings: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], bool, List[str]]:
+    """
+    Rewrite an LLM-generated pipeline into a cheaper, bounded equivalent.
+
+    Args:
+        pipeline: Parsed aggregation pipeline
+        settings: Guard settings, defaults to get_guard_settings()
+
+    Returns:
+        Tuple of (rewritten pipeline, whether a result cap was appended, rewrite log)
+    """
+    settings = settings or get_guard_settings()
+    rewrites = []
+    pipeline = canonicalize(pipeline, rewrites)
+    pipeline = move_matches_earlier(pipeline, rewrites)
+    pipeline = drop_heavy_fields(pipeline, settings["heavy_fields"], rewrites)
+    pipeline, capped = cap_results(pipeline, settings["max_results"], rewrites)
+    return pipeline, capped, rewrites
+
+
+def explain_command(collection_name: str, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The explain command for an aggregation, at queryPlanner verbosity so nothing is executed."""
+    return {"explain": {"aggregate": collection_name, "pipeline": pipeline, "cursor": {}}, "verbosity": "queryPlanner"}
+
+
+def _cached_plan(key: str) -> Optional[Dict[str, Any]]:
+    with _plan_cache_lock:
+        if key in _plan_cache:
+            _plan_cache.move_to_end(key)
+            return _plan_cache[key]
+    return None
+
+
+def _remember_plan(key: str, plan: Dict[str, Any]):
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        while len(_plan_cache) > 256:
+            _plan_cache.popitem(last=False)
+
+
+def _plan_key(collection_name: str, pipeline: List[Dict[str, Any]]) -> str:
+    return collection_name + json.dumps(pipeline, sort_keys=True, default=str)
+
+
+# Plan of a pipeline the server couldn't explain; it runs unguarded
+UNEXPLAINED_PLAN = {"collscan": None, "indexes": []}
+# Unauthorized, CommandNotFound, CommandNotSupported: asking again gets the same answer
+UNSUPPORTED_EXPLAIN_CODES = {13, 59, 115}
+
+
+def _unexplained(error: Exception, key: str) -> Dict[str, Any]:
+    """The plan to use when explain() failed; only failures a retry can't fix are cached."""
+    print(f"Could not explain pipeline: {error}")
+    # NotImplementedError: a client (mongomock) without the explain command
+    if isinstance(error, NotImplementedError) or (isinstance(error, OperationFailure)
+                                                  and error.code in UNSUPPORTED_EXPLAIN_CODES):
+        _remember_plan(key, UNEXPLAINED_PLAN)
+    # Timeouts and network errors are retried by the next query
+    return UNEXPLAINED_PLAN
+
+
+def _aggregate_options(plan: Dict[str, Any], settings: Dict[str, Any]) -> Dict[str, Any]:
+    if not plan["collscan"] or settings["collscan_policy"] == "allow":
+        return {}
+    if settings["collscan_policy"] == "reject":
+        raise PipelineRejected("pipeline requires a collection scan")
+    print(f"Pipeline plan is a COLLSCAN; capping it at {settings['collscan_max_time_ms']} ms")
+    return {"maxTimeMS": settings["collscan_max_time_ms"]}
+
+
+def check_plan(collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Summarize the pipeline's query plan.
+
+    Returns:
+        summarize_plan() of explain(): whether it scans the whole collection and
+        which indexes it uses (collscan is None when the server can't explain it)
+    """
+    key = _plan_key(collection.name, pipeline)
+    cached = _cached_plan(key)
+    if cached is not None:
+        return cached
+    try:
+        plan = summarize_plan(collection.database.command(explain_command(collection.name, pipeline)))
+    except Exception as e:
+        return _unexplained(e, key)
+    _remember_plan(key, plan)
+    return plan
+
+
+async def acheck_plan(collection, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Async version of check_plan() for an AsyncCollection."""
+    key = _plan_key(collection.name, pipeline)
+    cached = _cached_plan(key)
+    if cached is not None:
+        return cached
+    try:
+        plan = summarize_plan(await collection.database.command(explain_command(collection.name, pipeline)))
+    except Exception as e:
+        return _unexplained(e, key)
+    _remember_plan(key, plan)
+    return plan
+
+
+def take_bounded(documents, settings: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Read documents until MONGO_MAX_RESULTS documents or MONGO_MAX_RESULT_BYTES (BSON size) are reached.
+
+    Args:
+        documents: Iterable of documents, typically a cursor
+        settings: Guard settings
+
+    Returns:
+        Tuple of (documents kept, whether the byte limit cut the results off)
+    """
+    kept, size = [], 0
+    for document in documents:
+        size += len(bson.encode(document))
+        if size > settings["max_result_bytes"] and kept:
+            return kept, True
+        kept.append(document)
+        if len(kept) >= settings["max_results"]:
+            break
+    return kept, False
+
+
+def needs_count(documents: List[Dict[str, Any]], capped: bool, cut_off: bool, settings: Dict[str, Any]) -> bool:
+    """Whether more documents may exist than were read, so the total must be counted separately."""
+    return cut_off or (capped and len(documents) >= settings["max_results"])
+
+
+def _batch_size(settings: Dict[str, Any]) -> int:
+    # One more than the cap so reaching it doesn't cost another round trip for the cursor's end
+    return settings["batch_size"] or settings["max_results"] + 1
+
+
+def guarded_aggregate(collection, pipeline: Any) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Run an LLM-generated pipeline through the optimizer and the COLLSCAN check.
+
+    The cursor is streamed in batches and read only up to the document and
+    byte limits; the true total comes from a separate $count when needed.
+
+    Args:
+        collection: pymongo collection
+        pipeline: Parsed aggregation pipeline
+
+    Returns:
+        Tuple of (documents, total number of documents the pipeline matches)
+    """
+    settings = get_guard_settings()
+    pipeline, capped, _ = optimize_pipeline(pipeline, settings)
+    plan = check_plan(collection, pipeline)
+    # Feed the index advisor with the shape and plan of every executed pipeline
+    record_query_shape(pipeline, plan if plan["collscan"] is not None else None)
+    options = _aggregate_options(plan, settings)
+    with collection.aggregate(pipeline, batchSize=_batch_size(settings), **options) as cursor:
+        documents, cut_off = take_bounded(cursor, settings)
+    if not needs_count(documents, capped, cut_off, settings):
+        return documents, len(documents)
+    counted = list(collection.aggregate(count_pipeline(pipeline, capped), **options))
+    total = counted[0]["count"] if counted else 0
+    print(f"MongoDB results cut off at {len(documents)} of {total} documents")
+    return documents, total
+
+
+async def _abounded(cursor, settings: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], bool]:
+    kept, size = [], 0
+    async for document in cursor:
+        size += len(bson.encode(document))
+        if size > settings["max_result_bytes"] and kept:
+            return kept, True
+        kept.append(document)
+        if len(kept) >= settings["max_results"]:
+            break
+    return kept, False
+
+
+async def aguarded_aggregate(collection, pipeline: Any) -> Tuple[List[Dict[str, Any]], int]:
+    """Async version of guarded_aggregate() for an AsyncCollection."""
+    settings = get_guard_settings()
+    pipeline, capped, _ = optimize_pipeline(pipeline, settings)
+    plan = await acheck_plan(collection, pipeline)
+    record_query_shape(pipeline, plan if plan["collscan"] is not None else None)
+    options = _aggregate_options(plan, settings)
+    cursor = await collection.aggregate(pipeline, batchSize=_batch_size(settings), **options)
+    try:
+        documents, cut_off = await _abounded(cursor, settings)
+    finally:
+        await cursor.close()
+    if not needs_count(documents, capped, cut_off, settings):
+        return documents, len(documents)
+    cursor = await collection.aggregate(count_pipeline(pipeline, capped), **options)
+    counted = await cursor.to_list(length=None)
+    total = counted[0]["count"] if counted else 0
+    print(f"MongoDB results cut off at {len(documents)} of {total} documents")
+    return documents, total
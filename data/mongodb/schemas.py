@@ -1,4 +1,10 @@
-from pymongo import IndexModel, ASCENDING, TEXT
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import IndexModel, ASCENDING, TEXT, ReplaceOne, DeleteMany
+from pymongo.errors import BulkWriteError
 from data.mongodb.connection import get_collection
 
 # Define schema for cheese products based on cheese_data_numeric.json
@@ -99,11 +105,25 @@ product_schema = {
     }
 }
 
+def apply_product_schema(products):
+    """Create the products collection with the schema validator, or attach it to an existing one."""
+    db = products.database
+    if products.name in db.list_collection_names():
+        db.command({"collMod": products.name, "validator": product_schema["validator"]})
+    else:
+        db.create_collection(products.name, validator=product_schema["validator"])
+
 def setup_mongodb():
     """Set up MongoDB collections with proper schemas and indexes."""
     # Get products collection
     products = get_collection()
     
+    # Attach the JSON schema validator
+    try:
+        apply_product_schema(products)
+    except Exception as e:
+        print(f"Could not apply product schema: {e}")
+    
     # Create text index for search
     products.create_index([
         ("name", TEXT),
@@ -117,6 +137,8 @@ def setup_mongodb():
     products.create_index([("sku", ASCENDING)])
     products.create_index([("popularityOrder", ASCENDING)])
     products.create_index([("empty", ASCENDING)])
+    # Shape the reasoning prompt asks for: department filter sorted by the each price
+    products.create_index([("department", ASCENDING), ("prices.Each", ASCENDING)])
     
     # Return the configured collection
     return products
@@ -137,7 +159,147 @@ def import_products_to_mongodb(products_data, clear_existing=True):
     
     # Insert products
     if len(products_data) > 0:
-        products.insert_many(products_data)
+        products.insert_many([with_content_hash(product) for product in products_data])
         print(f"Imported {len(products_data)} products to MongoDB")
     else:
         print("No products to import")
+
+
+def _upsert_chunk(products, chunk):
+    """Upsert one chunk of products keyed on sku with an unordered bulk_write."""
+    operations = [ReplaceOne({"sku": product["sku"]}, with_content_hash(product), upsert=True) for product in chunk]
+    try:
+        result = products.bulk_write(operations, ordered=False)
+        return {"upserted": result.upserted_count, "modified": result.modified_count,
+                "matched": result.matched_count, "errors": 0}
+    except BulkWriteError as e:
+        # Unordered writes keep going past failed documents; report what happened
+        details = e.details
+        for error in details.get("writeErrors", [])[:3]:
+            print(f"Failed to import product: {error.get('errmsg')}")
+        return {"upserted": details.get("nUpserted", 0), "modified": details.get("nModified", 0),
+                "matched": details.get("nMatched", 0), "errors": len(details.get("writeErrors", []))}
+
+def bulk_import_products(products_data, chunk_size=None, workers=None, remove_missing=True):
+    """Idempotently import cheese products to MongoDB.
+    
+    Provisions the schema validator and indexes, then upserts the products
+    keyed on sku in chunks of unordered bulk_write calls spread over worker
+    threads. Unlike import_products_to_mongodb(), the collection is never
+    emptied while the load runs.
+    
+    Args:
+        products_data: List of dictionaries containing product information
+        chunk_size: Products per bulk_write, defaults to MONGODB_IMPORT_CHUNK_SIZE
+        workers: Parallel chunk workers, defaults to MONGODB_IMPORT_WORKERS
+        remove_missing: Whether to delete stored products that are not in products_data
+    
+    Returns:
+        Import report with write counts and docs/sec
+    """
+    chunk_size = chunk_size or int(os.getenv("MONGODB_IMPORT_CHUNK_SIZE", "500"))
+    workers = workers or int(os.getenv("MONGODB_IMPORT_WORKERS", "4"))
+    products = setup_mongodb()
+    
+    with_sku = [product for product in products_data if product.get("sku")]
+    if len(with_sku) < len(products_data):
+        print(f"Skipping {len(products_data) - len(with_sku)} products without sku")
+    chunks = [with_sku[i:i+chunk_size] for i in range(0, len(with_sku), chunk_size)]
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda chunk: _upsert_chunk(products, chunk), chunks))
+    
+    report = {key: sum(result[key] for result in results) for key in ("upserted", "modified", "matched", "errors")}
+    if remove_missing:
+        skus = [product["sku"] for product in with_sku]
+        report["deleted"] = products.delete_many({"sku": {"$nin": skus}}).deleted_count
+    
+    elapsed = time.perf_counter() - start
+    report["documents"] = len(with_sku)
+    report["seconds"] = elapsed
+    report["docs_per_second"] = len(with_sku) / elapsed if elapsed else 0.0
+    print(f"Imported {len(with_sku)} products to MongoDB in {len(chunks)} chunks "
+          f"({report['docs_per_second']:.1f} docs/sec): {report}")
+    return report
+
+def compute_content_hash(product):
+    """Hash the catalog content of a product, ignoring storage-only fields."""
+    content = {k: v for k, v in product.items() if k not in ("_id", "contentHash")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def with_content_hash(product):
+    """Return a copy of the product document carrying its content hash."""
+    return {**{k: v for k, v in product.items() if k != "_id"}, "contentHash": compute_content_hash(product)}
+
+def diff_products(products_data, collection=None):
+    """Diff incoming products against the stored catalog by SKU and content hash.
+    
+    Args:
+        products_data: List of dictionaries containing product information
+        collection: Collection to diff against, defaults to the products collection
+    
+    Returns:
+        Dictionary with "inserts" and "updates" (product lists), "deletes"
+        (list of SKUs) and "unchanged" (count)
+    """
+    products = collection if collection is not None else get_collection()
+    
+    incoming = {}
+    for product in products_data:
+        if not product.get("sku"):
+            print(f"Skipping product without sku: {product.get('name', '')}")
+            continue
+        incoming[product["sku"]] = product
+    
+    stored = {}
+    missing_hash = []
+    missing_sku = 0
+    for doc in products.find({}, {"_id": 0, "sku": 1, "contentHash": 1}):
+        if not doc.get("sku"):
+            # Can't be matched to an incoming product, so it is neither updated nor deleted
+            missing_sku += 1
+            continue
+        if "contentHash" in doc:
+            stored[doc["sku"]] = doc["contentHash"]
+        else:
+            missing_hash.append(doc["sku"])
+    if missing_sku:
+        print(f"Skipping {missing_sku} stored documents without sku")
+    # Documents imported before content hashes existed are hashed on the fly
+    if missing_hash:
+        for doc in products.find({"sku": {"$in": missing_hash}}, {"_id": 0}):
+            stored[doc["sku"]] = compute_content_hash(doc)
+    
+    changes = {"inserts": [], "updates": [], "deletes": [], "unchanged": 0}
+    for sku, product in incoming.items():
+        if sku not in stored:
+            changes["inserts"].append(product)
+        elif stored[sku] != compute_content_hash(product):
+            changes["updates"].append(product)
+        else:
+            changes["unchanged"] += 1
+    changes["deletes"] = [sku for sku in stored if sku not in incoming]
+    return changes
+
+def apply_product_changes(changes, collection=None):
+    """Apply a diff from diff_products() to MongoDB without emptying the collection."""
+    products = collection if collection is not None else get_collection()
+    
+    operations = [
+        ReplaceOne({"sku": product["sku"]}, with_content_hash(product), upsert=True)
+        for product in changes["inserts"] + changes["updates"]
+    ]
+    if changes["deletes"]:
+        operations.append(DeleteMany({"sku": {"$in": changes["deletes"]}}))
+    if operations:
+        products.bulk_write(operations, ordered=False)
+
+def summarize_changes(changes):
+    """Count the changes of a diff from diff_products()."""
+    return {
+        "inserted": len(changes["inserts"]),
+        "updated": len(changes["updates"]),
+        "deleted": len(changes["deletes"]),
+        "unchanged": changes["unchanged"],
+    }
@@ -1,4 +1,5 @@
 import os
+import threading
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
 
@@ -50,3 +51,58 @@ def get_index(pc, index_name="cheese-products", dimension=1536):
     
     # Return the index
     return pc.Index(index_name)
+
+
+# Long-lived Pinecone client and index handles, shared by every query
+_pinecone_client = None
+_index_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_pinecone_client():
+    """Get the shared Pinecone client, creating it on first use."""
+    global _pinecone_client
+    if _pinecone_client is None:
+        with _cache_lock:
+            if _pinecone_client is None:
+                _pinecone_client = init_pinecone()
+    return _pinecone_client
+
+
+def get_cached_index(index_name="cheese-products", dimension=1536, pc=None):
+    """Get a cached Pinecone index handle.
+
+    The first call checks that the index exists (creating it if needed) via
+    get_index(); later calls return the same handle, so queries skip the
+    list_indexes() control-plane round trip and reuse the handle's HTTP pool.
+
+    Args:
+        index_name: Name of the Pinecone index
+        dimension: Dimension of the embeddings (1536 for OpenAI)
+        pc: Optional Pinecone client, defaults to the shared client
+
+    Returns:
+        Pinecone index
+    """
+    index = _index_cache.get(index_name)
+    if index is not None:
+        return index
+    with _cache_lock:
+        index = _index_cache.get(index_name)
+        if index is None:
+            index = get_index(pc or get_pinecone_client(), index_name, dimension)
+            _index_cache[index_name] = index
+    return index
+
+
+def invalidate_index_cache(index_name=None):
+    """Drop cached index handles so the next call re-checks the index.
+
+    Args:
+        index_name: Index to drop, or None to drop every cached handle
+    """
+    with _cache_lock:
+        if index_name is None:
+            _index_cache.clear()
+        else:
+            _index_cache.pop(index_name, None)
@@ -0,0 +1,119 @@
+import os
+import time
+import queue
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+from data.embeddings import embed_batch_with_retry, get_rate_limiter
+from data.embedding_store import content_key, get_embedding_store
+
+# Marks the end of the stream of upsert batches
+_DONE = object()
+
+
+def _clean_text(text: str) -> str:
+    return text.strip().replace("\n", " ")
+
+
+def run_indexing_pipeline(products: List[Dict[str, Any]], texts: List[str], metadata: List[Dict[str, Any]],
+                          index, batch_size: int = 50, workers: int = None, model="text-embedding-ada-002",
+                          client=None, rate_limiter=None, store=None) -> Dict[str, Any]:
+    """
+    Embed and upsert products with a bounded producer/consumer pipeline.
+
+    Embedding workers run concurrently (within the shared rate limit) and hand
+    finished batches to the caller's thread through a bounded queue, so Pinecone
+    upserts overlap with embedding. Texts already in the embedding store are
+    not sent to the embedding API.
+
+    Args:
+        products: Products to index
+        texts: Text to embed for each product
+        metadata: Pinecone metadata for each product
+        index: Pinecone index (anything with an upsert(vectors=...) method)
+        batch_size: Number of products per embedding request and upsert
+        workers: Concurrent embedding requests, defaults to EMBEDDING_WORKERS
+        model: The OpenAI embedding model to use
+        client: OpenAI client, defaults to the shared client
+        rate_limiter: Rate limiter, defaults to the shared limiter
+        store: Embedding store, defaults to the shared store
+
+    Returns:
+        Throughput report
+    """
+    workers = workers or int(os.getenv("EMBEDDING_WORKERS", "4"))
+    rate_limiter = rate_limiter or get_rate_limiter()
+    if store is None:
+        store = get_embedding_store()
+
+    start = time.perf_counter()
+    batches = [range(i, min(i + batch_size, len(products))) for i in range(0, len(products), batch_size)]
+    ready = queue.Queue(maxsize=workers * 2)
+    counters = {"embedded": 0, "cached": 0}
+    counters_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def hand_over(item):
+        # Block while the queue is full, unless the consumer has given up
+        while not stopped.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce(rows):
+        try:
+            keys = [content_key(model, texts[row]) for row in rows]
+            missing = [(key, row) for key, row in zip(keys, rows) if key not in store]
+            if missing:
+                embeddings = embed_batch_with_retry([_clean_text(texts[row]) for _, row in missing], model=model,
+                                                    client=client, rate_limiter=rate_limiter)
+                store.add_many([key for key, _ in missing], embeddings)
+            with counters_lock:
+                counters["embedded"] += len(missing)
+                counters["cached"] += len(rows) - len(missing)
+            vectors = [{
+                "id": products[row].get("sku", str(uuid.uuid4())),
+                "values": store.get(key).tolist(),
+                "metadata": metadata[row],
+            } for key, row in zip(keys, rows)]
+            hand_over(vectors)
+        except Exception as e:
+            hand_over(e)
+
+    def feed(executor):
+        for future in [executor.submit(produce, rows) for rows in batches]:
+            future.result()
+        hand_over(_DONE)
+
+    upserted = 0
+    with ThreadPoolExecutor(max_workers=workers + 1) as executor:
+        executor.submit(feed, executor)
+        try:
+            while True:
+                item = ready.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                index.upsert(vectors=item)
+                upserted += len(item)
+                print(f"Indexed {upserted}/{len(products)} products")
+        except BaseException:
+            # Stop the remaining embedding jobs before surfacing the error
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.perf_counter() - start
+    return {
+        "products": upserted,
+        "embedded": counters["embedded"],
+        "cached": counters["cached"],
+        "seconds": elapsed,
+        "products_per_second": upserted / elapsed if elapsed else 0.0,
+        "workers": workers,
+    }
@@ -0,0 +1,43 @@
+from data.local_index.exact import ExactVectorIndex
+from data.local_index.ivf import IVFVectorIndex, QUANTIZATIONS
+import numpy as np
+import time
+
+
+def synthetic_vectors(count, dimension, clusters=500, seed=0):
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.6 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+def benchmark_ann_index(count=100000, dimension=256, queries=200, top_k=10, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+    vectors = synthetic_vectors(count, dimension)
+    query_vectors = synthetic_vectors(queries, dimension, seed=1)
+    ids = [str(i) for i in range(count)]
+    metadata = [{} for _ in range(count)]
+
+    exact = ExactVectorIndex.build(ids, vectors, metadata)
+    start = time.perf_counter()
+    truth = [set(exact.search(q, top_k)[0].tolist()) for q in query_vectors]
+    exact_ms = (time.perf_counter() - start) / queries * 1000
+    print(f"{count} vectors x {dimension} dims, {queries} queries, recall@{top_k}")
+    print(f"exact scan: {exact_ms:.3f} ms/query, {exact.vectors.nbytes / 2**20:.0f} MiB\n")
+
+    print(f"{'storage':<8} {'nprobe':>6} {'recall':>7} {'ms/query':>9} {'MiB':>6}")
+    for quantization in QUANTIZATIONS:
+        start = time.perf_counter()
+        index = IVFVectorIndex.build(ids, vectors, metadata, quantization=quantization)
+        build_seconds = time.perf_counter() - start
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            found = [set(index.search(q, top_k, nprobe=nprobe)[0].tolist()) for q in query_vectors]
+            latency = (time.perf_counter() - start) / queries * 1000
+            recall = np.mean([len(f & t) / top_k for f, t in zip(found, truth)])
+            print(f"{quantization:<8} {nprobe:>6} {recall:>7.3f} {latency:>9.3f} {index.codes.nbytes / 2**20:>6.0f}")
+        print(f"{quantization:<8} built {len(index.centroids)} lists in {build_seconds:.1f}s\n")
+
+
+if __name__ == "__main__":
+    benchmark_ann_index()
@@ -0,0 +1,83 @@
+from agent.checkpointer import BoundedMemorySaver, SQLiteSaver
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import StateGraph, END
+from typing import Any, List, TypedDict
+import argparse
+import tempfile
+import tracemalloc
+import time
+import uuid
+import os
+
+
+class TurnState(TypedDict, total=False):
+    query: str
+    thought: List[str]
+    searched_result: List[Any]
+    final_response: str
+
+
+def build_turn_graph(checkpointer):
+    """A stand-in for one agent turn: a few steps that checkpoint a search-sized payload."""
+    def understand(state):
+        return {"thought": [f"Looking for {state['query']}"]}
+
+    def search(state):
+        return {"searched_result": [{"sku": str(i), "name": f"Cheese {i}", "brand": "Galbani",
+                                     "prices": {"Each": 10.0 + i}, "href": f"https://shop/{i}"} for i in range(20)]}
+
+    def respond(state):
+        return {"final_response": "Here are the cheeses. " * 20}
+
+    workflow = StateGraph(TurnState)
+    workflow.add_node("understand", understand)
+    workflow.add_node("search", search)
+    workflow.add_node("respond", respond)
+    workflow.set_entry_point("understand")
+    workflow.add_edge("understand", "search")
+    workflow.add_edge("search", "respond")
+    workflow.add_edge("respond", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def soak(name, checkpointer, turns, report_every):
+    """Run `turns` turns, each on a new thread like app.py, and report traced memory as they accumulate."""
+    graph = build_turn_graph(checkpointer)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    samples = []
+    start = time.perf_counter()
+    for turn in range(1, turns + 1):
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        graph.invoke({"query": f"mozzarella {turn}"}, config=config)
+        if turn % report_every == 0:
+            current = (tracemalloc.get_traced_memory()[0] - baseline) / 1024 / 1024
+            samples.append(current)
+            stats = checkpointer.stats() if hasattr(checkpointer, "stats") else {}
+            print(f"{name:<8} turn {turn:>6}   traced {current:8.2f} MB   {stats}")
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {turns / elapsed:.0f} turns/s, memory grew {samples[-1] - samples[0]:+.2f} MB "
+          f"after turn {report_every}\n")
+    return samples
+
+
+def benchmark_checkpointer(turns=10000, report_every=1000, max_threads=200):
+    unbounded = soak("unbounded", InMemorySaver(), turns, report_every)
+    bounded = soak("memory", BoundedMemorySaver(max_threads=max_threads), turns, report_every)
+    with tempfile.TemporaryDirectory() as directory:
+        saver = SQLiteSaver(os.path.join(directory, "checkpoints.sqlite"), max_threads=max_threads, compact_every=500)
+        soak("sqlite", saver, turns, report_every)
+        print(f"sqlite file after compaction: {saver.stats()['bytes'] / 1024 / 1024:.2f} MB")
+
+    # After the first report the bounded saver is at its cap, so memory must stay flat
+    assert bounded[-1] - bounded[0] < 0.2 * (unbounded[-1] - unbounded[0]) + 1, "Bounded checkpointer memory keeps growing"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory of the checkpointer over many single-turn threads")
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--report-every", type=int, default=1000)
+    parser.add_argument("--max-threads", type=int, default=200)
+    args = parser.parse_args()
+    benchmark_checkpointer(args.turns, args.report_every, args.max_threads)
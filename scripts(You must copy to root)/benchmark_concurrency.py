@@ -0,0 +1,106 @@
+import os
+# Every session must reach the model for the throughput to mean anything
+os.environ["LLM_CACHE_BACKEND"] = "none"
+
+from agent.graph import create_agent_graph
+from data.mongodb.connection import aclose_mongodb_client
+from data.embeddings import aclose_openai_client
+from langchain_core.messages import AIMessage
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import time
+import uuid
+
+QUERY = "Show me mozzarella under $50"
+
+
+def canned_output(node, schema):
+    if schema is None:
+        return AIMessage(content='{"plan": []}' if node == "planning" else "Here are the cheeses.")
+    values = {}
+    for name, field in schema.model_fields.items():
+        values[name] = {bool: False, str: ""}.get(field.annotation, [])
+    if "mongo_query" in values:
+        values["mongo_query"] = '[{"$match": {"name": {"$regex": "mozzarella", "$options": "i"}}}, {"$project": {"_id": 0}}, {"$limit": 10}]'
+    if "is_result_sufficient" in values:
+        values["is_result_sufficient"] = True
+    return schema(**values)
+
+
+def stub_llm_calls(latency):
+    """Replace the model calls of every node with canned outputs after `latency` seconds."""
+    import agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning, agent.nodes.response
+
+    def fake_invoke(node, llm, prompt, schema=None):
+        time.sleep(latency)
+        return canned_output(node, schema)
+
+    async def afake_invoke(node, llm, prompt, schema=None):
+        await asyncio.sleep(latency)
+        return canned_output(node, schema)
+
+    for module in (agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning, agent.nodes.response):
+        module.cached_invoke = fake_invoke
+        module.acached_invoke = afake_invoke
+
+
+def new_session():
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    init_state = {"query": QUERY, "messages": [], "thought": [], "mongo_results": [], "pinecone_results": []}
+    return init_state, config
+
+
+def run_threads(graph, sessions, threads):
+    """Sync entry point: graph.invoke on a thread pool."""
+    def run(_):
+        init_state, config = new_session()
+        return graph.invoke(init_state, config=config)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(run, range(sessions)))
+    return time.perf_counter() - start
+
+
+async def run_async(graph, sessions, concurrency):
+    """Async entry point: graph.ainvoke on one event loop."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run():
+        async with semaphore:
+            init_state, config = new_session()
+            return await graph.ainvoke(init_state, config=config)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    # The async clients' pools belong to this loop, which asyncio.run() closes next
+    await aclose_mongodb_client()
+    await aclose_openai_client()
+    return elapsed
+
+
+def benchmark_concurrency(concurrency_levels=(1, 10, 50), threads=8, stub_latency=None):
+    load_dotenv()
+    if stub_latency is not None:
+        stub_llm_calls(stub_latency)
+        print(f"Model calls stubbed with {stub_latency * 1000:.0f} ms latency")
+    graph = create_agent_graph("standard")
+
+    for sessions in concurrency_levels:
+        elapsed = run_threads(graph, sessions, threads)
+        print(f"sync  {threads} threads     N={sessions:<4} {elapsed:7.2f} s   {sessions / elapsed:7.2f} sessions/s")
+        elapsed = asyncio.run(run_async(graph, sessions, sessions))
+        print(f"async one event loop N={sessions:<4} {elapsed:7.2f} s   {sessions / elapsed:7.2f} sessions/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of N concurrent sessions in one process, sync vs async")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--threads", type=int, default=8, help="Thread pool size of the sync run")
+    parser.add_argument("--stub-latency", type=float, default=None,
+                        help="Stub the model calls with this latency in seconds instead of calling OpenAI")
+    args = parser.parse_args()
+    benchmark_concurrency(args.sessions, args.threads, args.stub_latency)
@@ -0,0 +1,83 @@
+import os
+# Every call must reach the model for the timings to mean anything
+os.environ["LLM_CACHE_BACKEND"] = "none"
+
+from agent.graph import create_agent_graph
+from agent.llm_cache import get_llm_cache_stats, node_stats
+from langchain_core.messages import AIMessage
+from dotenv import load_dotenv
+import numpy as np
+import argparse
+import time
+import uuid
+
+QUERIES = [
+    "Do you have cheddar cheese?",
+    "Show me mozzarella under $50",
+    "How many products are in the Sliced Cheese department?",
+    "What is the most expensive item?",
+    "Recommend a mild option for kids",
+    "What goes well with crackers?",
+]
+
+
+def stub_llm_calls(latency):
+    """Replace the model calls of every node with canned outputs after `latency` seconds."""
+    import agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning, agent.nodes.front_end
+
+    def fake_invoke(node, llm, prompt, schema=None):
+        time.sleep(latency)
+        node_stats[node]["bypassed"] += 1
+        if schema is None:
+            return AIMessage(content='{"plan": []}')
+        values = {}
+        for name, field in schema.model_fields.items():
+            values[name] = {bool: False, str: ""}.get(field.annotation, [])
+        if "mongo_query" in values:
+            values["mongo_query"] = '[{"$limit": 5}]'
+        return schema(**values)
+
+    for module in (agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning, agent.nodes.front_end):
+        module.cached_invoke = fake_invoke
+
+
+def time_to_first_search(graph, query):
+    """Seconds from the start of a turn until the searches are dispatched (None if the turn never searches)."""
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    init_state = {"query": query, "messages": [], "thought": [], "mongo_results": [], "pinecone_results": []}
+    start = time.perf_counter()
+    for update in graph.stream(init_state, config=config, stream_mode="updates"):
+        if "parallel_search" in update:
+            return time.perf_counter() - start
+    return None
+
+
+def benchmark_front_end(rounds=3, stub_latency=None):
+    load_dotenv()
+    if stub_latency is not None:
+        stub_llm_calls(stub_latency)
+        print(f"Model calls stubbed with {stub_latency * 1000:.0f} ms latency")
+
+    for mode in ("standard", "fused"):
+        graph = create_agent_graph(mode)
+        node_stats.clear()
+        timings = []
+        for _ in range(rounds):
+            for query in QUERIES:
+                elapsed = time_to_first_search(graph, query)
+                if elapsed is not None:
+                    timings.append(elapsed)
+        calls = sum(counts["bypassed"] for counts in get_llm_cache_stats()["nodes"].values())
+        turns = rounds * len(QUERIES)
+        timings = np.array(timings) * 1000
+        print(f"{mode:<9} time to first search  p50 {np.percentile(timings, 50):8.1f} ms   "
+              f"p95 {np.percentile(timings, 95):8.1f} ms   LLM calls/turn {calls / turns:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare time-to-first-search of the standard and fused graphs")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stub-latency", type=float, default=None,
+                        help="Stub the model calls with this latency in seconds instead of calling OpenAI")
+    args = parser.parse_args()
+    benchmark_front_end(args.rounds, args.stub_latency)
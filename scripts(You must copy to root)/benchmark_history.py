@@ -0,0 +1,97 @@
+import os
+# Every turn must reach the (stubbed) model so its prompt is measured
+os.environ["LLM_CACHE_BACKEND"] = "none"
+os.environ["INTENT_FAST_PATH_ENABLED"] = "false"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+from agent.graph import create_agent_graph
+from agent.history import HISTORY_FIELDS
+from agent.compaction import count_tokens
+from benchmark_concurrency import canned_output
+from langchain_core.messages import AIMessage
+from collections import defaultdict
+from contextlib import redirect_stdout
+from dotenv import load_dotenv
+import argparse
+import io
+import uuid
+
+QUERIES = [
+    "Show me mozzarella under $50",
+    "Which of those is the cheapest per pound?",
+    "Do you have any sliced cheddar from Schreiber?",
+    "Compare the first two you showed me",
+    "What about parmesan in cases?",
+    "Is the second one in stock?",
+]
+
+
+def canned_answer(turn):
+    """An answer the size of a real one: a markdown table of ten products."""
+    rows = "\n".join(f"| Cheese, Mozzarella, Whole Milk, {i + 1} Lb | Galbani | ${10 + i}.99 | {100000 + turn * 10 + i} |"
+                     for i in range(10))
+    return f"Here are 10 of the 37 matching cheeses:\n\n| Name | Brand | Price | SKU |\n|---|---|---|---|\n{rows}"
+
+
+def record_prompts(prompt_tokens, turn):
+    """Stub the model calls of every node and count the tokens of the prompts they are given."""
+    import agent.history, agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning, agent.nodes.response
+
+    def fake_invoke(node, llm, prompt, schema=None):
+        text = prompt.to_string() if hasattr(prompt, "to_string") else "\n".join(str(m.content) for m in prompt)
+        prompt_tokens[node] += count_tokens(text)
+        if node == "response":
+            return AIMessage(content=canned_answer(turn))
+        if node == "history":
+            return AIMessage(content="The user is shopping for mozzarella and cheddar under $50 and compared "
+                                     "Galbani and Schreiber products by price per pound. " * 3)
+        return canned_output(node, schema)
+
+    for module in (agent.history, agent.nodes.understanding, agent.nodes.planning, agent.nodes.reasoning,
+                   agent.nodes.response):
+        module.cached_invoke = fake_invoke
+
+
+def run_session(turns, enabled):
+    """A long session carried over turn by turn like app.py; returns the prompt tokens of every turn."""
+    os.environ["HISTORY_ENABLED"] = "true" if enabled else "false"
+    graph = create_agent_graph("standard")
+    per_turn = []
+    carried = {"messages": []}
+    for turn in range(turns):
+        prompt_tokens = defaultdict(int)
+        record_prompts(prompt_tokens, turn)
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        init_state = {**carried, "query": QUERIES[turn % len(QUERIES)], "thought": [],
+                      "mongo_results": [], "pinecone_results": []}
+        # The nodes log every step; keep it out of the report
+        with redirect_stdout(io.StringIO()):
+            state = graph.invoke(init_state, config=config)
+        carried = {field: state[field] for field in ("messages",) + HISTORY_FIELDS if field in state}
+        per_turn.append(dict(prompt_tokens))
+    return per_turn, state
+
+
+def benchmark_history(turns=50, report_every=5):
+    load_dotenv()
+    raw, _ = run_session(turns, enabled=False)
+    managed, state = run_session(turns, enabled=True)
+
+    print(f"{'turn':>5} {'raw prompt tokens':>18} {'managed':>8}   managed per node")
+    for turn in range(report_every - 1, turns, report_every):
+        print(f"{turn + 1:>5} {sum(raw[turn].values()):>18} {sum(managed[turn].values()):>8}   {managed[turn]}")
+    print(f"Summary after {turns} turns: {state.get('summarized_message_count', 0)} messages folded, "
+          f"{len(state['messages'])} kept, pinned SKUs {state.get('pinned_skus', [])[:5]}...")
+
+    # Once the kept turns are full, the prompts must stop growing while the raw history keeps growing
+    settled = sum(managed[turns // 2].values())
+    assert sum(managed[-1].values()) <= settled * 1.1, "Managed prompts keep growing"
+    assert sum(raw[-1].values()) > 2 * sum(managed[-1].values()), "Raw history did not grow; is the benchmark measuring it?"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt tokens per turn over a long session, raw vs managed history")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--report-every", type=int, default=5)
+    args = parser.parse_args()
+    benchmark_history(args.turns, args.report_every)
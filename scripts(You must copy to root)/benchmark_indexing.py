@@ -0,0 +1,65 @@
+from data.pinecone.index import index_cheese_products
+from data.embeddings import RateLimiter
+from data.embedding_store import EmbeddingStore
+from types import SimpleNamespace
+import tempfile
+import threading
+import json
+import time
+
+# Simulated API latency
+EMBEDDING_LATENCY = 0.3
+UPSERT_LATENCY = 0.1
+
+
+class StubEmbeddings:
+    """Stands in for client.embeddings; every fifth request fails once to exercise retries."""
+
+    def __init__(self):
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def create(self, input, model):
+        with self.lock:
+            self.requests += 1
+            attempt = self.requests
+        time.sleep(EMBEDDING_LATENCY)
+        if attempt % 5 == 0:
+            raise RuntimeError("429 Too Many Requests (stub)")
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(text))] * 1536) for text in input])
+
+
+class StubIndex:
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors):
+        time.sleep(UPSERT_LATENCY)
+        for vector in vectors:
+            self.vectors[vector["id"]] = vector
+
+
+def run(products, workers, batch_size=10):
+    client = SimpleNamespace(embeddings=StubEmbeddings())
+    index = StubIndex()
+    with tempfile.TemporaryDirectory() as path:
+        # Fresh store and limiter so every run embeds the whole catalog
+        report = index_cheese_products(products, batch_size=batch_size, workers=workers, index=index, client=client,
+                                       rate_limiter=RateLimiter(requests_per_minute=600, tokens_per_minute=1000000),
+                                       store=EmbeddingStore(path))
+    assert len(index.vectors) == len({p["sku"] for p in products}), "every product must be upserted"
+    assert all(any(v["values"]) for v in index.vectors.values()), "no zero-vector fallbacks"
+    return report
+
+
+def benchmark_indexing():
+    products = json.load(open("data/cheese_data_numeric.json"))
+    reports = {workers: run(products, workers) for workers in (1, 4, 8)}
+
+    print(f"\n{'workers':>8} {'seconds':>8} {'products/sec':>13}")
+    for workers, report in reports.items():
+        print(f"{workers:>8} {report['seconds']:>8.2f} {report['products_per_second']:>13.1f}")
+
+
+if __name__ == "__main__":
+    benchmark_indexing()
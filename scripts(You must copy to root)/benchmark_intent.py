@@ -0,0 +1,56 @@
+"""Accuracy and coverage of the rule-based query understanding fast path.
+
+Run from the repository root:
+    python benchmark_intent.py
+"""
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.intent import classify_query
+
+LABELS_PATH = "data/intent_labels.json"
+
+# Mid-conversation messages that ask about the products just shown; never greetings
+FOLLOW_UPS = ["how is it?", "whats good", "is it good?", "how is it going to taste?", "hello?", "good morning"]
+HISTORY = [HumanMessage(content="Show me mozzarella under $50"),
+           AIMessage(content="Here are 10 mozzarella cheeses, e.g. Galbani Whole Milk Mozzarella (sku 103674).")]
+
+
+def main():
+    with open(LABELS_PATH, "r") as f:
+        labels = json.load(f)
+
+    decided = correct = 0
+    errors = []
+    start = time.perf_counter()
+    for example in labels:
+        result = classify_query(example["query"])
+        if result is None:
+            continue
+        decided += 1
+        if result["needs_clarification"] == example["needs_clarification"]:
+            correct += 1
+        else:
+            errors.append((example["query"], result["reason"]))
+    elapsed = time.perf_counter() - start
+
+    # Not even on the first turn are these greetings; after an answer, nothing is
+    checks = [(query, []) for query in FOLLOW_UPS[:4]] + [(query, HISTORY) for query in FOLLOW_UPS]
+    for query, history in checks:
+        result = classify_query(query, history)
+        if result is not None and result["needs_clarification"]:
+            errors.append((query, f"{result['reason']} (after {len(history)} messages)"))
+
+    print(f"Labelled queries: {len(labels)}")
+    print(f"Short-circuited: {decided} ({decided / len(labels):.0%}), the rest goes to the LLM")
+    print(f"Accuracy on short-circuited queries: {correct}/{decided} ({correct / decided if decided else 0:.0%})")
+    print(f"Classification time: {elapsed * 1000 / len(labels):.3f} ms/query")
+    for query, reason in errors:
+        print(f"  wrong: {query!r} -> {reason}")
+    assert not errors, "The fast path must not decide a query wrongly"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from data.mongodb.connection import get_collection
+from data.mongodb.local_engine import LocalCatalogEngine
+from data.mongodb.pipeline import guarded_aggregate, optimize_pipeline
+from dotenv import load_dotenv
+from contextlib import redirect_stdout
+import numpy as np
+import argparse
+import io
+import time
+
+# Shapes the reasoning prompt makes the LLM write
+PIPELINES = [
+    [{"$match": {"department": "Sliced Cheese"}}, {"$sort": {"prices.Each": 1}}, {"$limit": 10}],
+    [{"$match": {"name": {"$regex": "mozzarella", "$options": "i"}, "prices.Each": {"$lt": 50}}},
+     {"$project": {"name": 1, "brand": 1, "prices": 1, "sku": 1}}],
+    [{"$match": {"brand": {"$in": ["Galbani", "Schreiber"]}}}, {"$sort": {"popularityOrder": 1}}],
+    [{"$group": {"_id": "$department", "count": {"$sum": 1}, "avg": {"$avg": "$prices.Each"}}}],
+    [{"$match": {"empty": False}}, {"$count": "count"}],
+]
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):8.3f} ms   p95 {np.percentile(latencies, 95):8.3f} ms"
+
+
+def time_runs(run, pipelines, rounds):
+    latencies = []
+    # The guard logs every rewrite; keep it out of the timings' output
+    with redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            for pipeline in pipelines:
+                start = time.perf_counter()
+                run(pipeline)
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def benchmark_local_engine(rounds=50):
+    load_dotenv()
+    collection = get_collection()
+    start = time.perf_counter()
+    engine = LocalCatalogEngine(list(collection.find({}, {"_id": 0})))
+    print(f"Loaded {engine.size} products into the local engine in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def run_local(pipeline):
+        optimized, _, _ = optimize_pipeline(pipeline)
+        return engine.aggregate(optimized)
+
+    def run_mongodb(pipeline):
+        return guarded_aggregate(collection, pipeline)
+
+    print(f"local engine  {percentiles(time_runs(run_local, PIPELINES, rounds))}")
+    print(f"MongoDB       {percentiles(time_runs(run_mongodb, PIPELINES, rounds))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of generated pipelines on the local engine vs MongoDB")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    benchmark_local_engine(args.rounds)
@@ -0,0 +1,61 @@
+from data.mongodb.connection import (
+    PoolStatsListener,
+    create_mongodb_client,
+    get_collection,
+    warm_up_mongodb,
+    get_pool_stats,
+    close_mongodb_client,
+    pool_stats,
+)
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import time
+
+# Works against a local mongod (MONGODB_CONNECTION_STRING=mongodb://localhost:27017)
+# or mongomock (MONGODB_CONNECTION_STRING=mongomock://, pip install mongomock)
+PIPELINE = [{"$match": {}}, {"$project": {"_id": 0, "sku": 1}}, {"$limit": 10}]
+
+
+# The throwaway clients report here, so the shared client's statistics only cover its own run
+new_client_stats = PoolStatsListener()
+
+
+def query_with_new_client():
+    """The old behaviour: a brand-new client (and pool) for every query."""
+    client = create_mongodb_client(listener=new_client_stats)
+    list(client["Cheese"]["cheese"].aggregate(PIPELINE))
+    client.close()
+
+
+def query_with_shared_client():
+    list(get_collection().aggregate(PIPELINE))
+
+
+def run(label, fn, queries, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: fn(), range(queries)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<15} {queries} queries, {workers} workers: {elapsed:.3f}s ({queries / elapsed:.1f} queries/sec)")
+
+
+def benchmark_mongodb_pool(queries=200, workers=8):
+    load_dotenv()
+    warm_up_mongodb()
+
+    run("new client", query_with_new_client, queries, workers)
+    # Leave out the warm-up
+    pool_stats.reset()
+    run("shared client", query_with_shared_client, queries, workers)
+
+    print("\nPool statistics of the new clients:")
+    for key, value in new_client_stats.snapshot().items():
+        print(f"  {key}: {value}")
+    print("\nPool statistics of the shared client:")
+    for key, value in get_pool_stats().items():
+        print(f"  {key}: {value}")
+    close_mongodb_client()
+
+
+if __name__ == "__main__":
+    benchmark_mongodb_pool()
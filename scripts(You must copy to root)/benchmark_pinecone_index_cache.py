@@ -0,0 +1,58 @@
+from data.pinecone.connection import get_index, get_cached_index, invalidate_index_cache
+import time
+
+# Simulated network latency for each Pinecone API call
+CONTROL_PLANE_LATENCY = 0.05
+DATA_PLANE_LATENCY = 0.02
+
+
+class StubIndex:
+    def __init__(self, client):
+        self.client = client
+
+    def query(self, **kwargs):
+        self.client.calls["query"] += 1
+        time.sleep(DATA_PLANE_LATENCY)
+        return {"matches": []}
+
+
+class StubPinecone:
+    """Counts round trips instead of talking to Pinecone."""
+
+    def __init__(self):
+        self.calls = {"list_indexes": 0, "create_index": 0, "query": 0}
+
+    def list_indexes(self):
+        self.calls["list_indexes"] += 1
+        time.sleep(CONTROL_PLANE_LATENCY)
+        return [{"name": "cheese-products"}]
+
+    def create_index(self, **kwargs):
+        self.calls["create_index"] += 1
+
+    def Index(self, name):
+        return StubIndex(self)
+
+
+def run(label, get_handle, queries):
+    pc = StubPinecone()
+    start = time.perf_counter()
+    for _ in range(queries):
+        get_handle(pc).query(vector=[0.0] * 1536, top_k=10, include_metadata=True)
+    elapsed = time.perf_counter() - start
+    round_trips = sum(pc.calls.values())
+    print(f"{label:<14} {round_trips} round trips for {queries} queries "
+          f"({round_trips / queries:.2f}/query), {elapsed / queries * 1000:.1f} ms/query, calls={pc.calls}")
+    return round_trips
+
+
+def benchmark_index_cache(queries=50):
+    uncached = run("get_index", lambda pc: get_index(pc), queries)
+    invalidate_index_cache()
+    cached = run("cached index", lambda pc: get_cached_index(pc=pc), queries)
+    invalidate_index_cache()
+    print(f"\nSaved {uncached - cached} round trips ({(uncached - cached) / queries:.2f} per query)")
+
+
+if __name__ == "__main__":
+    benchmark_index_cache()
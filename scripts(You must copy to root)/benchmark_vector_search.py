@@ -0,0 +1,52 @@
+from data.local_index.exact import ExactVectorIndex
+from data.pinecone.connection import get_cached_index
+from dotenv import load_dotenv
+import numpy as np
+import tempfile
+import time
+import os
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):7.3f} ms   p95 {np.percentile(latencies, 95):7.3f} ms"
+
+
+def time_queries(search, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def benchmark_vector_search(catalog_sizes=(100, 1000, 5000), dimension=1536, queries=200):
+    load_dotenv()
+    rng = np.random.default_rng(0)
+    query_vectors = rng.normal(size=(queries, dimension)).astype(np.float32)
+    departments = ["Sliced Cheese", "Specialty Cheese", "Cheese Loaf", "Shredded Cheese"]
+
+    for size in catalog_sizes:
+        vectors = rng.normal(size=(size, dimension)).astype(np.float32)
+        metadata = [{"department": departments[i % 4], "price_each": float(i % 90)} for i in range(size)]
+        with tempfile.TemporaryDirectory() as path:
+            ExactVectorIndex.build([str(i) for i in range(size)], vectors, metadata).save(path)
+            index = ExactVectorIndex.load(path)
+            plain = time_queries(lambda q: index.query(q, top_k=10), query_vectors)
+            filtered = time_queries(
+                lambda q: index.query(q, top_k=10, filter={"department": {"$eq": "Sliced Cheese"}}), query_vectors)
+        print(f"local exact  n={size:<6} {percentiles(plain)}")
+        print(f"  + filter   n={size:<6} {percentiles(filtered)}")
+
+    if os.getenv("PINECONE_API_KEY"):
+        index = get_cached_index()
+        remote = time_queries(lambda q: index.query(vector=q.tolist(), top_k=10, include_metadata=True),
+                              query_vectors[:50])
+        print(f"pinecone     (catalog index) {percentiles(remote)}")
+    else:
+        print("PINECONE_API_KEY not set; skipping the Pinecone comparison")
+
+
+if __name__ == "__main__":
+    benchmark_vector_search()
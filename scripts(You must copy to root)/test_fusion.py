@@ -0,0 +1,56 @@
+"""Search results reaching the prompts keep what answers the question.
+
+$group rows are labelled by their _id and must keep it through fusion and
+compaction; the ObjectId of a stored product is dropped.
+
+Run from the repository root:
+    python test_fusion.py
+"""
+import json
+
+import mongomock
+
+from agent.compaction import compact_results
+from agent.fusion import fuse_search_results
+
+CATALOG_PATH = "data/cheese_data_numeric.json"
+
+GROUP_PIPELINES = [
+    [{"$group": {"_id": "$brand", "n": {"$sum": 1}}}, {"$sort": {"_id": 1}}],
+    [{"$group": {"_id": "$department", "avg": {"$avg": "$prices.Each"}}}, {"$sort": {"_id": 1}}],
+    [{"$group": {"_id": {"department": "$department", "empty": "$empty"}, "n": {"$sum": 1}}}, {"$sort": {"n": -1}}],
+]
+
+
+def test_fusion():
+    with open(CATALOG_PATH, "r") as f:
+        catalog = json.load(f)
+    collection = mongomock.MongoClient().Cheese.cheese
+    collection.insert_many([dict(product) for product in catalog])
+
+    failures = 0
+    for pipeline in GROUP_PIPELINES:
+        rows = list(collection.aggregate(pipeline))
+        fused, total = fuse_search_results(rows, [], top_n=len(rows))
+        text, _ = compact_results(fused, "how many", total=total)
+        labelled = all("_id" in record for record in fused) and f"_id: {rows[0]['_id']}" in text
+        if labelled and total == len(rows):
+            print(f"✅ {json.dumps(pipeline)[:100]}  ({total} groups)")
+        else:
+            failures += 1
+            print(f"❌ group keys lost: {json.dumps(pipeline)}")
+            print(f"   fused: {json.dumps(fused[:3], default=str)}")
+
+    products, _ = fuse_search_results(list(collection.find({"department": "Sliced Cheese"}).limit(5)), [])
+    if any("_id" in record for record in products):
+        failures += 1
+        print("❌ product ObjectIds must not reach the prompts")
+    else:
+        print(f"✅ ObjectId dropped from {len(products)} products")
+
+    print(f"{len(GROUP_PIPELINES) + 1 - failures}/{len(GROUP_PIPELINES) + 1} pass")
+    assert not failures, "Fusion must keep group keys and drop storage ids"
+
+
+if __name__ == "__main__":
+    test_fusion()
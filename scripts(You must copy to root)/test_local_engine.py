@@ -0,0 +1,106 @@
+"""Conformance of the local catalog engine against mongomock.
+
+Every pipeline runs on a mongomock copy of data/cheese_data_numeric.json and
+on the local engine; the results must be identical.
+
+Run from the repository root:
+    python test_local_engine.py
+"""
+import json
+
+import mongomock
+
+from data.mongodb.local_engine import LocalCatalogEngine, UnsupportedPipeline
+
+CATALOG_PATH = "data/cheese_data_numeric.json"
+
+PIPELINES = [
+    [{"$match": {"department": "Sliced Cheese"}}],
+    [{"$match": {"brand": {"$in": ["Galbani", "Schreiber"]}}}, {"$project": {"name": 1, "brand": 1}}],
+    [{"$match": {"brand": {"$nin": ["Galbani", "Schreiber"]}}}, {"$count": "count"}],
+    [{"$match": {"prices.Each": {"$lt": 50}}}, {"$sort": {"prices.Each": 1}}, {"$limit": 5}],
+    [{"$match": {"prices.Each": {"$gte": 20, "$lte": 60}}}, {"$sort": {"prices.Each": -1, "name": 1}}],
+    [{"$match": {"prices.Case": {"$gt": 100}}}, {"$project": {"name": 1, "prices.Case": 1}}],
+    [{"$match": {"prices.Case": {"$exists": False}}}, {"$count": "n"}],
+    [{"$match": {"name": {"$regex": "mozzarella", "$options": "i"}}}, {"$project": {"name": 1, "sku": 1}}],
+    [{"$match": {"name": {"$regex": "^Cheese, American"}}}, {"$sort": {"pricePer": 1}}],
+    [{"$match": {"$or": [{"brand": "Galbani"}, {"department": "Cheese Loaf"}]}}, {"$sort": {"sku": 1}}],
+    [{"$match": {"$and": [{"empty": False}, {"popularityOrder": {"$lte": 10}}]}}, {"$sort": {"popularityOrder": 1}}],
+    [{"$match": {"discount": {"$ne": ""}}}, {"$project": {"name": 1, "discount": 1}}],
+    [{"$match": {"weights.EACH": {"$gt": 5}}}, {"$sort": {"weights.EACH": -1}}, {"$skip": 2}, {"$limit": 3}],
+    [{"$sort": {"priceOrder": 1}}, {"$skip": 10}, {"$limit": 10}, {"$project": {"sku": 1, "priceOrder": 1}}],
+    [{"$project": {"name": 1, "price": "$prices.Each", "pounds": "$weights.EACH"}}, {"$sort": {"price": -1}}],
+    [{"$project": {"images": 0, "relateds": 0, "dimensions": 0}}],
+    [{"$group": {"_id": "$department", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}],
+    [{"$match": {"department": "Sliced Cheese"}},
+     {"$group": {"_id": "$brand", "avg": {"$avg": "$prices.Each"}, "min": {"$min": "$prices.Each"},
+                 "max": {"$max": "$prices.Each"}, "total": {"$sum": "$itemCounts.EACH"}}},
+     {"$sort": {"_id": 1}}],
+    [{"$group": {"_id": None, "cheapest": {"$min": "$prices.Each"}, "cases": {"$avg": "$prices.Case"}}}],
+    [{"$group": {"_id": {"department": "$department", "empty": "$empty"}, "n": {"$sum": 1}}},
+     {"$sort": {"n": -1}}, {"$limit": 3}, {"$project": {"n": 1, "_id": 0}}],
+    [{"$match": {"department": "Sliced Cheese"}},
+     {"$facet": {"results": [{"$limit": 5}], "total": [{"$count": "count"}]}}],
+]
+
+# Needs MongoDB; the local engine must refuse it
+UNSUPPORTED = [
+    [{"$unwind": "$relateds"}],
+    [{"$match": {"relateds": "103674"}}],
+    [{"$group": {"_id": "$brand", "n": {"$sum": 1}}}, {"$match": {"n": {"$gt": 2}}}],
+    [{"$match": {"$expr": {"$gt": ["$prices.Case", "$prices.Each"]}}}],
+    [{"$project": {"total": {"$multiply": ["$prices.Each", 2]}}}],
+]
+
+
+def normalize(value):
+    """
+    Make results comparable across backends.
+
+    mongomock adds ObjectId _ids and returns a zero $count for an empty input
+    where the server returns no document; sums may differ in the last bits.
+    """
+    if isinstance(value, list):
+        documents = [normalize(item) for item in value]
+        return [item for item in documents if not (isinstance(item, dict) and list(item.values()) == [0])]
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if not (key == "_id" and hasattr(item, "binary"))}
+    if isinstance(value, float):
+        return round(value, 9)
+    return value
+
+
+def test_local_engine():
+    with open(CATALOG_PATH, "r") as f:
+        catalog = json.load(f)
+    collection = mongomock.MongoClient().Cheese.cheese
+    collection.insert_many([dict(product) for product in catalog])
+    engine = LocalCatalogEngine(catalog)
+
+    failures = 0
+    for pipeline in PIPELINES:
+        expected = normalize(list(collection.aggregate(pipeline)))
+        actual = normalize(engine.aggregate(pipeline))
+        if actual == expected:
+            print(f"✅ {json.dumps(pipeline)[:100]}  ({len(actual)} documents)")
+        else:
+            failures += 1
+            print(f"❌ {json.dumps(pipeline)}")
+            print(f"   mongomock: {json.dumps(expected, default=str)[:300]}")
+            print(f"   local:     {json.dumps(actual, default=str)[:300]}")
+
+    for pipeline in UNSUPPORTED:
+        try:
+            engine.aggregate(pipeline)
+        except UnsupportedPipeline as e:
+            print(f"✅ falls back to MongoDB: {e}")
+        else:
+            failures += 1
+            print(f"❌ should fall back to MongoDB: {json.dumps(pipeline)}")
+
+    print(f"{len(PIPELINES) + len(UNSUPPORTED) - failures}/{len(PIPELINES) + len(UNSUPPORTED)} conform")
+    assert not failures, "The local engine must return what MongoDB returns"
+
+
+if __name__ == "__main__":
+    test_local_engine()
@@ -0,0 +1,65 @@
+"""Keys of the aggregation result cache.
+
+Pipelines that can return different documents, or the same documents in a
+different order, must never share a cache entry; pipelines that differ only
+in the key order of a filter should.
+
+Run from the repository root:
+    python test_result_cache.py
+"""
+import json
+
+from agent.tool_nodes.mongo_search import MongoResultCache, result_cache_key
+
+# Each pair must miss each other's entries
+DIFFERENT = [
+    ([{"$sort": {"prices.Each": 1, "name": 1}}], [{"$sort": {"name": 1, "prices.Each": 1}}]),
+    ([{"$match": {"brand": "Galbani"}}, {"$sort": {"prices.Each": -1, "sku": 1}}],
+     [{"$match": {"brand": "Galbani"}}, {"$sort": {"sku": 1, "prices.Each": -1}}]),
+    ([{"$project": {"name": 1, "brand": 1}}], [{"$project": {"brand": 1, "name": 1}}]),
+    ([{"$group": {"_id": "$brand", "n": {"$sum": 1}, "avg": {"$avg": "$prices.Each"}}}],
+     [{"$group": {"_id": "$brand", "avg": {"$avg": "$prices.Each"}, "n": {"$sum": 1}}}]),
+    ([{"$match": {"dimensions": {"CASE": "L 1\"", "EACH": "L 1\""}}}],
+     [{"$match": {"dimensions": {"EACH": "L 1\"", "CASE": "L 1\""}}}]),
+]
+
+# Each pair must share an entry
+SAME = [
+    ([{"$match": {"brand": "Galbani", "prices.Each": {"$gt": 10, "$lt": 50}}}],
+     [{"$match": {"prices.Each": {"$lt": 50, "$gt": 10}, "brand": "Galbani"}}]),
+    ([{"$match": {"$or": [{"brand": "Galbani", "empty": False}, {"department": "Cheese Loaf"}]}}],
+     [{"$match": {"$or": [{"empty": False, "brand": "Galbani"}, {"department": "Cheese Loaf"}]}}]),
+    ([{"$sort": {"prices.Each": "desc"}}], [{"$sort": {"prices.Each": -1}}]),
+]
+
+
+def test_result_cache():
+    failures = 0
+    for first, second in DIFFERENT:
+        cache = MongoResultCache()
+        cache.set(result_cache_key(first, 1), [{"sku": "103674"}, {"sku": "100014"}], 2)
+        if cache.get(result_cache_key(second, 1)) is None:
+            print(f"✅ separate entries: {json.dumps(first)} / {json.dumps(second)}")
+        else:
+            failures += 1
+            print(f"❌ served from the other's entry: {json.dumps(first)} / {json.dumps(second)}")
+
+    for first, second in SAME:
+        cache = MongoResultCache()
+        cache.set(result_cache_key(first, 1), [{"sku": "103674"}], 1)
+        if cache.get(result_cache_key(second, 1)) is not None:
+            print(f"✅ shared entry: {json.dumps(first)} / {json.dumps(second)}")
+        else:
+            failures += 1
+            print(f"❌ should share an entry: {json.dumps(first)} / {json.dumps(second)}")
+
+    if result_cache_key(SAME[0][0], 1) == result_cache_key(SAME[0][0], 2):
+        failures += 1
+        print("❌ a new catalog version must not reuse entries")
+
+    print(f"{len(DIFFERENT) + len(SAME) - failures}/{len(DIFFERENT) + len(SAME)} pass")
+    assert not failures, "Result cache keys must respect stage order semantics"
+
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -1,11 +1,19 @@
 from agent.graph import agent_graph
+from agent.semantic_cache import stream_agent
+from agent.history import HISTORY_FIELDS
+from agent.streaming import STREAM_MODES, response_token
 from langchain_core.messages import HumanMessage
 from langgraph.types import Command, Interrupt
 from dotenv import load_dotenv
+from data.mongodb.connection import warm_up_mongodb
 import uuid
 config = {"configurable": {"thread_id": "initial_thread"}}
 
 load_dotenv()
+try:
+    warm_up_mongodb()
+except Exception as e:
+    print(f"MongoDB warm-up failed: {e}")
 interrupted_state = False
 
 while True:
@@ -17,7 +25,7 @@ while True:
             events = agent_graph.stream(
                 Command(resume={"data":user_input}),
                 config=config, 
-                stream_mode="values",
+                stream_mode=STREAM_MODES,
             )
             interrupted_state = False
         else:
@@ -27,17 +35,22 @@ while True:
             config = {"configurable": {"thread_id": new_thread_id}}
 
             messages_to_carry_over = []
+            history_to_carry_over = {}
             try:
                 previous_state_snapshot = agent_graph.get_state(config_of_previous_session)
                 if previous_state_snapshot and previous_state_snapshot.values:
                     messages_to_carry_over = previous_state_snapshot.values.get("messages", [])
+                    history_to_carry_over = {field: previous_state_snapshot.values[field]
+                                             for field in HISTORY_FIELDS if field in previous_state_snapshot.values}
             except Exception as e:
                 print(f"Info: Could not retrieve state from previous session ({config_of_previous_session.get('configurable', {}).get('thread_id')}): {e}. Starting with fresh history.")
                 messages_to_carry_over = []
+                history_to_carry_over = {}
 
             init_state = {
                 "query": user_input,
                 "messages": messages_to_carry_over,
+                **history_to_carry_over,
                 "needs_clarification": False,
                 "reason": "",
                 "suggested_clarifying_question": "",
@@ -45,26 +58,45 @@ while True:
                 "thought": [],
                 "is_database_searched": False,
                 "searched_result": {},
+                "searched_result_total": 0,
+                "prompt_tokens_saved": 0,
                 "pinecone_results": [],
                 "mongo_results": [],
+                "mongo_total": 0,
                 "mongo_query": "",
                 "pinecone_query": "",
                 "is_result_sufficient": False,
                 "needs_web_search": False,
                 "web_search_query": ""
             }
-            events = agent_graph.stream(
-                init_state, 
+            events = stream_agent(
+                agent_graph,
+                init_state,
                 config=config,
-                stream_mode="values",
+                stream_mode=STREAM_MODES,
             )
         
-        for event in events:
+        streamed = False
+        final_response = None
+        for stream_mode, event in events:
+            if stream_mode == "messages":
+                # Print the answer token by token as it is generated
+                token = response_token(event)
+                if token:
+                    print(token, end="", flush=True)
+                    streamed = True
+                continue
             if '__interrupt__' in event:
                 message = event['__interrupt__'][0].value['message']
                 print(message)
                 interrupted_state = True
                 break
+            final_response = event.get("final_response", final_response)
+        if streamed:
+            print()
+        elif final_response and not interrupted_state:
+            # Answered without streaming, e.g. from the semantic cache
+            print(final_response)
     except Exception as e:
         print(f"Error occurred: {e}")
         resume = input("Do you want to continue? (y/n): ")